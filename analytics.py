@@ -0,0 +1,400 @@
+import argparse
+import itertools
+import logging
+import operator
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from metrics import REGISTRY, configure_logging
+
+logger = logging.getLogger(__name__)
+
+LOAD_SECONDS = REGISTRY.histogram("analytics_load_seconds", "把price_history读取为列数组的耗时")
+LOAD_ROWS = REGISTRY.gauge("analytics_loaded_rows", "当前缓存的价格历史行数")
+
+# 可以按需读取的数值列，只读取用到的列以控制内存
+VALUE_COLUMNS = ("price", "volume")
+
+def data_fingerprint(conn):
+    """价格历史数据的指纹，导入、回填或归档后会变化，用于判断缓存的结果是否过期
+    
+    使用 db_meta 中的数据代数（与 db_query.QueryCache 相同），原地更新价格和归档分区也会使其变化；
+    尚未迁移的旧数据库没有 db_meta，退回到O(1)的 MAX(id) 和两张小表，不扫描 price_history。
+    """
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if "db_meta" in tables:
+        return ("generation", conn.execute("SELECT value FROM db_meta WHERE key = 'generation'").fetchone()[0])
+    parts = [conn.execute("SELECT MAX(id) FROM price_history").fetchone()[0]]
+    if "import_manifest" in tables:
+        parts.extend(conn.execute("SELECT COUNT(*), MAX(imported_at) FROM import_manifest").fetchone())
+    if "price_history_backfill" in tables:
+        parts.extend(conn.execute("SELECT COUNT(*), MAX(last_fetched) FROM price_history_backfill").fetchone())
+    return tuple(parts)
+
+def parse_timestamps(texts):
+    """把 'YYYY-MM-DD HH:MM:SS' 文本批量转换为UTC秒数，格式不规范时逐个解析"""
+    try:
+        return np.array(texts, dtype="datetime64[s]").astype(np.int64)
+    except ValueError:
+        parsed = {}
+        for text in texts:
+            if text not in parsed:
+                moment = datetime.fromisoformat(str(text))
+                if moment.tzinfo is None:
+                    moment = moment.replace(tzinfo=timezone.utc)
+                parsed[text] = int(moment.timestamp())
+        return np.array([parsed[text] for text in texts], dtype=np.int64)
+
+class PriceHistoryColumns:
+    """按物品分组的价格历史列
+    
+    各列按 (item_id, timestamp) 排序；第 i 个物品的行位于 offsets[i]:offsets[i+1]。
+    timestamps 为UTC秒数，values 为 {列名: float64数组}。
+    """
+    
+    def __init__(self, item_ids, offsets, timestamps, values):
+        self.item_ids = item_ids
+        self.offsets = offsets
+        self.timestamps = timestamps
+        self.values = values
+        self._group_index = None
+    
+    @property
+    def n_items(self):
+        return len(self.item_ids)
+    
+    @property
+    def n_rows(self):
+        return len(self.timestamps)
+    
+    @property
+    def starts(self):
+        return self.offsets[:-1]
+    
+    @property
+    def ends(self):
+        return self.offsets[1:]
+    
+    @property
+    def group_index(self):
+        """每一行所属物品的下标"""
+        if self._group_index is None:
+            self._group_index = np.repeat(np.arange(self.n_items), np.diff(self.offsets))
+        return self._group_index
+    
+    def __getitem__(self, name):
+        return self.values[name]
+    
+    @property
+    def nbytes(self):
+        return (self.item_ids.nbytes + self.offsets.nbytes + self.timestamps.nbytes
+                + sum(column.nbytes for column in self.values.values()))
+
+def load_price_history(conn, columns=VALUE_COLUMNS, since=None, chunk_size=65536):
+    """一次顺序读取 price_history，返回 PriceHistoryColumns
+    
+    按 (item_id, timestamp) 索引的顺序读取，结果已按物品分组；since 为UTC秒数，只读取之后的数据。
+    只读取主库中的价格历史：partitions.compact_partitions 归档的月份不在分析范围内（保留期之外）。
+    """
+    columns = tuple(columns)
+    for column in columns:
+        if column not in VALUE_COLUMNS:
+            raise ValueError(f"未知列 {column}，可用: {VALUE_COLUMNS}")
+    where = ""
+    params = ()
+    if since is not None:
+        where = "WHERE timestamp >= ?"
+        params = (datetime.fromtimestamp(since, timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),)
+    
+    started = time.perf_counter()
+    total = conn.execute(f"SELECT COUNT(*) FROM price_history {where}", params).fetchone()[0]
+    width = 1 + len(columns)
+    data = np.empty((total, width), dtype=np.float64)
+    timestamps = np.empty(total, dtype=np.int64)
+    select = "".join(f"COALESCE({column}, 0), " for column in columns)
+    # 时间戳以文本读出，由numpy批量解析，比在SQL中逐行调用strftime快
+    cursor = conn.execute(f'''
+    SELECT item_id, {select}timestamp
+    FROM price_history {where}
+    ORDER BY item_id, timestamp
+    ''', params)
+    get_timestamp = operator.itemgetter(width)
+    row = 0
+    while True:
+        chunk = cursor.fetchmany(chunk_size)
+        if not chunk:
+            break
+        size = min(len(chunk), total - row)
+        chunk = chunk[:size]
+        # 把一批元组展开后直接写入预分配的数组，不创建中间的Python列表
+        data[row:row + size] = np.fromiter(itertools.chain.from_iterable(record[:width] for record in chunk),
+                                           dtype=np.float64, count=size * width).reshape(size, width)
+        timestamps[row:row + size] = parse_timestamps(list(map(get_timestamp, chunk)))
+        row += size
+    data = data[:row]
+    timestamps = timestamps[:row]
+    
+    item_column = data[:, 0].astype(np.int64)
+    boundaries = np.flatnonzero(np.diff(item_column)) + 1
+    offsets = np.concatenate(([0], boundaries, [row])).astype(np.int64)
+    item_ids = item_column[offsets[:-1]] if row else np.empty(0, dtype=np.int64)
+    values = {column: np.ascontiguousarray(data[:, 1 + i]) for i, column in enumerate(columns)}
+    del data, item_column
+    
+    frame = PriceHistoryColumns(item_ids, offsets, timestamps, values)
+    elapsed = time.perf_counter() - started
+    LOAD_SECONDS.observe(elapsed)
+    LOAD_ROWS.set(frame.n_rows)
+    logger.info(f"读取了 {frame.n_rows} 行价格历史（{frame.n_items} 个物品），"
+                f"{frame.nbytes / 1024 / 1024:.1f} MB，用时 {elapsed:.2f} 秒")
+    return frame
+
+def rolling_mean(frame, window, column="price"):
+    """每一行在本物品内最近 window 个点的均值（不足 window 个点时取已有的点）"""
+    values = frame[column]
+    index = np.arange(frame.n_rows)
+    low = np.maximum(index - window + 1, frame.starts[frame.group_index])
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    return (sums[index + 1] - sums[low]) / (index + 1 - low)
+
+def latest_rolling_mean(frame, window, column="price"):
+    """每个物品最近 window 个点的均值"""
+    values = frame[column]
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    ends = frame.ends
+    low = np.maximum(ends - window, frame.starts)
+    return (sums[ends] - sums[low]) / (ends - low)
+
+def volatility(frame, window=None, column="price"):
+    """每个物品最近 window 个点的对数收益率标准差（window=None 时使用全部点），点数不足时为NaN"""
+    prices = np.maximum(frame[column], 1e-9)
+    returns = np.zeros(frame.n_rows)
+    returns[1:] = np.diff(np.log(prices))
+    # 每个物品的第一个点没有收益率
+    returns[frame.starts] = 0.0
+    sums = np.concatenate(([0.0], np.cumsum(returns)))
+    squares = np.concatenate(([0.0], np.cumsum(returns * returns)))
+    starts, ends = frame.starts, frame.ends
+    low = starts + 1 if window is None else np.maximum(ends - window + 1, starts + 1)
+    count = (ends - low).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (sums[ends] - sums[low]) / count
+        variance = ((squares[ends] - squares[low]) - count * mean * mean) / (count - 1)
+        result = np.sqrt(np.maximum(variance, 0.0))
+    result[count < 2] = np.nan
+    return result
+
+def vwap(frame):
+    """每个物品的成交量加权平均价，没有成交量时为NaN"""
+    if frame.n_rows == 0:
+        return np.empty(0)
+    price, volume = frame["price"], frame["volume"]
+    traded = np.add.reduceat(price * volume, frame.starts)
+    volumes = np.add.reduceat(volume, frame.starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(volumes > 0, traded / volumes, np.nan)
+
+def price_change(frame, seconds, column="price"):
+    """每个物品最新价格相对 seconds 秒之前的价格的变化百分比
+    
+    参考价格取该时间点及之前的最后一个点；物品的历史不够长时取第一个点。
+    """
+    if frame.n_rows == 0:
+        return np.empty(0)
+    values = frame[column]
+    starts, last = frame.starts, frame.ends - 1
+    # 行按 (物品, 时间) 排序，组合键在全表范围内单调，一次 searchsorted 即可找到所有物品的参考点
+    keys = (frame.group_index.astype(np.int64) << 32) | frame.timestamps
+    targets = (np.arange(frame.n_items, dtype=np.int64) << 32) | (frame.timestamps[last] - seconds)
+    reference = np.maximum(np.searchsorted(keys, targets, side="right") - 1, starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(values[reference] > 0, (values[last] / values[reference] - 1) * 100, np.nan)
+
+def category_index(frame, categories, bucket_seconds=86400, column="price"):
+    """按类别计算等权价格指数
+    
+    每个物品的价格先除以其第一个点的价格，再按时间桶对每个物品取均值，最后对同一类别的物品取平均。
+    categories 为每个物品的类别名（与 frame.item_ids 对齐）。
+    返回 [(类别, 桶起始时间, 指数, 物品数), ...]，指数以100为基准。
+    """
+    if frame.n_rows == 0:
+        return []
+    values = frame[column]
+    base = values[frame.starts]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        normalized = values / base[frame.group_index]
+    valid = np.isfinite(normalized)
+    origin = frame.timestamps.min() // bucket_seconds * bucket_seconds
+    buckets = (frame.timestamps - origin) // bucket_seconds
+    n_buckets = int(buckets.max()) + 1
+    
+    # 第一步：每个 (物品, 桶) 的均值；行已按物品和时间排序，同一 (物品, 桶) 的行相邻
+    keys = frame.group_index.astype(np.int64) * n_buckets + buckets
+    keys, normalized = keys[valid], normalized[valid]
+    if len(keys) == 0:
+        return []
+    firsts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    item_bucket_mean = np.add.reduceat(normalized, firsts) / np.diff(np.append(firsts, len(keys)))
+    group_keys = keys[firsts]
+    items, item_buckets = group_keys // n_buckets, group_keys % n_buckets
+    
+    # 第二步：同一类别、同一桶内的物品取等权平均
+    names, category_codes = np.unique(np.asarray(categories, dtype=object).astype(str), return_inverse=True)
+    cells = category_codes[items] * n_buckets + item_buckets
+    size = len(names) * n_buckets
+    sums = np.bincount(cells, weights=item_bucket_mean, minlength=size)
+    counts = np.bincount(cells, minlength=size)
+    
+    rows = []
+    for cell in np.flatnonzero(counts):
+        category, bucket = divmod(int(cell), n_buckets)
+        bucket_start = datetime.fromtimestamp(int(origin + bucket * bucket_seconds), timezone.utc)
+        rows.append((str(names[category]), bucket_start.strftime("%Y-%m-%d %H:%M:%S"),
+                     round(float(sums[cell] / counts[cell] * 100), 4), int(counts[cell])))
+    return rows
+
+STATS_COLUMNS = ["item_id", "market_hash_name", "category", "points", "last_price", "rolling_mean",
+                 "volatility", "vwap", "change_24h_pct", "change_7d_pct"]
+
+class MarketAnalytics:
+    """全市场分析：一次读取价格历史后为所有物品同时计算指标
+    
+    读取的列和计算结果都缓存在内存中，直到数据指纹变化（有新的导入、回填或归档）。
+    """
+    
+    def __init__(self, db_path='csgo_items.db', since_days=None):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.since_days = since_days
+        self._fingerprint = None
+        self._frame = None
+        self._items = None
+        self._results = {}
+    
+    def close(self):
+        self.conn.close()
+    
+    def _refresh(self):
+        """数据变化时丢弃缓存"""
+        fingerprint = data_fingerprint(self.conn)
+        if fingerprint != self._fingerprint:
+            if self._fingerprint is not None:
+                logger.info("价格历史已更新，重新读取")
+            self._fingerprint = fingerprint
+            self._frame = None
+            self._items = None
+            self._results = {}
+    
+    def _cached(self, key, compute):
+        self._refresh()
+        if key not in self._results:
+            self._results[key] = compute()
+        return self._results[key]
+    
+    def frame(self):
+        """按物品分组的价格历史列（带缓存）"""
+        self._refresh()
+        if self._frame is None:
+            since = time.time() - self.since_days * 86400 if self.since_days else None
+            self._frame = load_price_history(self.conn, since=since)
+        return self._frame
+    
+    def item_info(self):
+        """与 frame().item_ids 对齐的 (market_hash_name, category) 数组"""
+        frame = self.frame()
+        if self._items is None:
+            info = {item_id: (name, category) for item_id, name, category
+                    in self.conn.execute("SELECT id, market_hash_name, category FROM csgo_items")}
+            names = np.array([info.get(int(item_id), ("", ""))[0] for item_id in frame.item_ids], dtype=object)
+            categories = np.array([info.get(int(item_id), ("", ""))[1] or "" for item_id in frame.item_ids],
+                                  dtype=object)
+            self._items = (names, categories)
+        return self._items
+    
+    def item_stats(self, window=24):
+        """所有物品的指标，返回 (列名, 行列表)"""
+        def compute():
+            frame = self.frame()
+            names, categories = self.item_info()
+            columns = [
+                frame.item_ids, names, categories, np.diff(frame.offsets), frame["price"][frame.ends - 1],
+                latest_rolling_mean(frame, window), volatility(frame, window), vwap(frame),
+                price_change(frame, 86400), price_change(frame, 7 * 86400),
+            ]
+            rows = []
+            for values in zip(*(column.tolist() for column in columns)):
+                rows.append(tuple(round(value, 6) if isinstance(value, float) else value for value in values))
+            return rows
+        return STATS_COLUMNS, self._cached(("stats", window), compute)
+    
+    def movers(self, hours=24, limit=20, losers=False, min_points=2):
+        """涨幅（losers=True 时为跌幅）最大的物品"""
+        def compute():
+            frame = self.frame()
+            names, categories = self.item_info()
+            change = price_change(frame, int(hours * 3600))
+            points = np.diff(frame.offsets)
+            candidates = np.flatnonzero(np.isfinite(change) & (points >= min_points))
+            order = candidates[np.argsort(change[candidates], kind="stable")]
+            if not losers:
+                order = order[::-1]
+            last = frame["price"][frame.ends - 1]
+            return [(int(frame.item_ids[i]), names[i], categories[i], round(float(last[i]), 4),
+                     round(float(change[i]), 4)) for i in order[:limit]]
+        columns = ["item_id", "market_hash_name", "category", "last_price", f"change_{hours:g}h_pct"]
+        return columns, self._cached(("movers", hours, limit, losers, min_points), compute)
+    
+    def category_indices(self, bucket_hours=24):
+        """各类别的等权价格指数"""
+        def compute():
+            frame = self.frame()
+            _, categories = self.item_info()
+            return category_index(frame, categories, int(bucket_hours * 3600))
+        return ["category", "bucket_start", "index", "items"], self._cached(("index", bucket_hours), compute)
+
+def main():
+    from db_query import write_rows
+    
+    parser = argparse.ArgumentParser(description="基于价格历史的全市场分析")
+    parser.add_argument("--db", default="csgo_items.db", help="数据库文件")
+    parser.add_argument("--since-days", type=float, default=None, help="只分析最近若干天的价格历史")
+    parser.add_argument("--format", choices=["table", "csv", "jsonl"], default="table", help="输出格式")
+    parser.add_argument("--log-level", default="WARNING", help="日志级别")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    stats = subparsers.add_parser("stats", help="所有物品的最新价格、滚动均值、波动率、VWAP和涨跌幅")
+    stats.add_argument("--window", type=int, default=24, help="滚动均值和波动率使用的点数")
+    
+    movers = subparsers.add_parser("movers", help="涨跌幅最大的物品")
+    movers.add_argument("--hours", type=float, default=24, help="比较的时间跨度（小时）")
+    movers.add_argument("--limit", type=int, default=20, help="返回的物品数")
+    movers.add_argument("--losers", action="store_true", help="按跌幅排序")
+    
+    index = subparsers.add_parser("index", help="各类别的等权价格指数")
+    index.add_argument("--bucket-hours", type=float, default=24, help="时间桶大小（小时）")
+    index.add_argument("--category", help="只输出某个类别")
+    
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    
+    analytics = MarketAnalytics(args.db, args.since_days)
+    try:
+        if args.command == "stats":
+            columns, rows = analytics.item_stats(args.window)
+        elif args.command == "movers":
+            columns, rows = analytics.movers(args.hours, args.limit, args.losers)
+        else:
+            columns, rows = analytics.category_indices(args.bucket_hours)
+            if args.category:
+                rows = [row for row in rows if row[0] == args.category]
+        write_rows(columns, rows, args.format)
+    except BrokenPipeError:
+        sys.stderr.close()
+    finally:
+        analytics.close()
+
+if __name__ == "__main__":
+    main()
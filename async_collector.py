@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import logging
+import random
+import time
+import os
+import aiohttp
+from contextlib import asynccontextmanager
+
+from collector import (ProxyPool, STEAM_MARKET_URL, USER_AGENTS, get_item_types, proxy_label,
+                       REQUEST_SECONDS, REQUESTS, RETRIES, SLEEP_SECONDS)
+from crawl_planner import CrawlPlanner
+import http_cache
+from metrics import add_arguments, close_exporters, configure_logging, start_exporters
+from rate_limiter import RateLimiter, backoff_delay, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+class RequestScheduler:
+    """在事件循环中为请求分配发送时机：并发上限 + 共享限速器的令牌桶，代替线程中的固定睡眠"""
+    
+    def __init__(self, rate_limiter=None, max_in_flight=100):
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_in_flight = max_in_flight
+        self._semaphore = None
+    
+    @asynccontextmanager
+    async def slot(self, endpoint, proxy=None):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        async with self._semaphore:
+            wait = self.rate_limiter.reserve(endpoint, proxy)
+            SLEEP_SECONDS.inc(wait, endpoint=endpoint, reason="rate_limit")
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield
+
+class AsyncSteamMarketCollector:
+    """基于asyncio的Steam市场收集器，接口与SteamMarketCollector一致"""
+    
+    def __init__(self, proxy=None, proxy_pool=None, rate_limiter=None, max_in_flight=100,
+                 timeout=15, max_retries=5, base_url=STEAM_MARKET_URL, cache=None, refresh_cache=False):
+        self.proxy = proxy
+        self.base_url = base_url.rstrip("/")
+        self.proxy_pool = proxy_pool
+        self.scheduler = RequestScheduler(rate_limiter, max_in_flight)
+        self.rate_limiter = self.scheduler.rate_limiter
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_retries = max_retries
+        self.max_in_flight = max_in_flight
+        self.user_agents = list(USER_AGENTS)
+        self.session = None
+        # 响应缓存（http_cache.ResponseCache）；refresh_cache 时只写不读
+        self.cache = cache
+        self.refresh_cache = refresh_cache
+    
+    async def __aenter__(self):
+        await self.start()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def start(self):
+        """创建所有类型共用的连接池"""
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={
+                    "Accept-Language": "en-US,en;q=0.9",
+                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8",
+                },
+            )
+    
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+    
+    def _report_proxy(self, proxy, latency=None, kind=None):
+        """把请求结果反馈给代理池的健康统计"""
+        if not self.proxy_pool or not proxy:
+            return
+        if kind is None:
+            self.proxy_pool.report_success(proxy, latency)
+        else:
+            self.proxy_pool.report_failure(proxy, kind)
+    
+    def _pick_proxy(self):
+        """返回aiohttp使用的代理URL"""
+        proxy = self.proxy
+        if self.proxy_pool:
+            proxy = self.proxy_pool.get_proxy()
+        if isinstance(proxy, dict):
+            proxy = proxy.get("https") or proxy.get("http")
+        return proxy
+    
+    async def _get_json(self, endpoint, url, params):
+        # 缓存命中时不进入调度器、不选择代理
+        if self.cache is not None and not self.refresh_cache:
+            cached = self.cache.get(endpoint, url, params)
+            if cached is not None:
+                return cached
+        await self.start()
+        for attempt in range(self.max_retries):
+            proxy = self._pick_proxy()
+            headers = {"User-Agent": random.choice(self.user_agents)}
+            try:
+                async with self.scheduler.slot(endpoint, proxy):
+                    started = time.monotonic()
+                    async with self.session.get(url, params=params, headers=headers, proxy=proxy) as response:
+                        REQUESTS.inc(endpoint=endpoint, status=response.status)
+                        if response.status == 429:  # Too Many Requests
+                            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                            self.rate_limiter.record_throttle(endpoint, proxy, retry_after)
+                            self._report_proxy(proxy, kind="429")
+                            RETRIES.inc(endpoint=endpoint, cause="429")
+                            logger.warning(f"遇到429错误，降低 {proxy_label(proxy)} 的请求速率并更换代理...")
+                            continue
+                        if 400 <= response.status < 500:
+                            # 其他4xx（例如价格历史未登录时的400）重试也不会成功，代理本身是正常的
+                            logger.warning(f"请求被拒绝: HTTP {response.status}，{url} {params}")
+                            data = None
+                        else:
+                            response.raise_for_status()
+                            data = await response.json(content_type=None)
+                    latency = time.monotonic() - started
+                    REQUEST_SECONDS.observe(latency, endpoint=endpoint, proxy=proxy_label(proxy))
+                self.rate_limiter.record_success(endpoint, proxy)
+                self._report_proxy(proxy, latency)
+                if self.cache is not None and isinstance(data, dict) and data.get("success"):
+                    self.cache.set(endpoint, url, params, data)
+                return data
+            except aiohttp.ClientSSLError as e:
+                logger.warning(f"SSL错误: {e!r}，代理 {proxy_label(proxy)}，更换代理并重试...")
+                self._report_proxy(proxy, kind="ssl")
+                REQUESTS.inc(endpoint=endpoint, status="ssl")
+                RETRIES.inc(endpoint=endpoint, cause="ssl")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"请求错误: {e!r}，第 {attempt+1}/{self.max_retries} 次，重试...")
+                self._report_proxy(proxy, kind="error")
+                REQUESTS.inc(endpoint=endpoint, status="error")
+                RETRIES.inc(endpoint=endpoint, cause="error")
+            delay = backoff_delay(attempt)
+            SLEEP_SECONDS.inc(delay, endpoint=endpoint, reason="backoff")
+            await asyncio.sleep(delay)
+        logger.error(f"达到最大重试次数 {self.max_retries}，返回空结果")
+        return None
+    
+    async def search_items(self, appid, query="", category=None, start=0, count=10):
+        url = f"{self.base_url}/search/render/"
+        
+        params = {
+            "appid": appid,
+            "norender": 1,
+            "start": start,
+            "count": count
+        }
+        
+        if query:
+            params["query"] = query
+        
+        if category:
+            params[f"category_{appid}_Item"] = category
+        
+        result = await self._get_json("search", url, params)
+        if result is None:
+            return {"success": False, "results": []}
+        return result
+    
+    async def get_item_price_history(self, appid, market_hash_name):
+        """获取物品价格历史，失败时返回None"""
+        url = f"{self.base_url}/pricehistory/"
+        
+        params = {
+            "appid": appid,
+            "market_hash_name": market_hash_name
+        }
+        
+        result = await self._get_json("pricehistory", url, params)
+        if result is None or not result.get("success", False):
+            logger.warning(f"获取物品 {market_hash_name} 价格历史失败")
+            return None
+        return result
+
+def _record_pages(planner, pages):
+    """把一批完成的页交给 planner（在写入线程中执行）"""
+    for item_type, start, result in pages:
+        planner.record(item_type, start, result)
+
+async def async_crawl_item_types(collector, item_types, appid=730, max_pages=500, items_per_page=100,
+                                 save_dir="data/categories", pages_in_flight=64, compact=True, archive_raw=False):
+    """按 total_count 规划各类型的页并在事件循环中并发抓取，同时最多 pages_in_flight 页，返回 {类型: 物品数}"""
+    planner = CrawlPlanner(item_types, save_dir, items_per_page, max_pages, compact=compact, archive_raw=archive_raw)
+    tasks = {}
+    while True:
+        for item_type, start in planner.next_requests(pages_in_flight - len(tasks)):
+            task = asyncio.ensure_future(collector.search_items(appid=appid, category=item_type,
+                                                                start=start, count=items_per_page))
+            tasks[task] = (item_type, start)
+        if not tasks:
+            break
+        
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        pages = []
+        for task in done:
+            item_type, start = tasks.pop(task)
+            try:
+                result = task.result()
+            except Exception as e:
+                logger.error(f"{item_type} 起始索引 {start} 请求时出错: {e!r}")
+                result = None
+            pages.append((item_type, start, result))
+        # 检查点写入（每页fsync）和压实在线程中执行，期间其他请求继续进行；
+        # planner 只在这个协程中使用，写入完成前不会分配新的页，不会被并发访问
+        await asyncio.to_thread(_record_pages, planner, pages)
+    
+    return await asyncio.to_thread(planner.finish)
+
+async def async_process_item_type(collector, item_type, appid=730, max_pages=10, items_per_page=10,
+                                  save_dir="data/categories", pages_in_flight=4, compact=True):
+    """异步处理单个物品类型，同时请求 pages_in_flight 页，返回该类型已保存的物品数"""
+    logger.info(f"正在获取 {item_type} 类型的物品...")
+    counts = await async_crawl_item_types(collector, [item_type], appid, max_pages, items_per_page, save_dir,
+                                          pages_in_flight, compact)
+    return counts[item_type]
+
+async def async_get_csgo_item_categories(collector, max_pages=500, all_items=True, items_per_page=100,
+                                         save_dir="data/categories", pages_in_flight=64, archive_raw=False):
+    """在一个事件循环中并发收集所有物品类型，所有类型的页共用 pages_in_flight 个并发名额"""
+    item_types = get_item_types(all_items)
+    os.makedirs(save_dir, exist_ok=True)
+    
+    counts = await async_crawl_item_types(collector, item_types, 730, max_pages, items_per_page, save_dir,
+                                          pages_in_flight, archive_raw=archive_raw)
+    logger.info(f"完成 {len(counts)} 个类型，共 {sum(counts.values())} 个物品")
+
+async def async_main(enable_proxy_pool=True, max_in_flight=100, pages_in_flight=64, cache=None, refresh_cache=False,
+                     archive_raw=False):
+    proxy_pool = ProxyPool() if enable_proxy_pool else None
+    async with AsyncSteamMarketCollector(proxy_pool=proxy_pool, max_in_flight=max_in_flight,
+                                         cache=cache, refresh_cache=refresh_cache) as collector:
+        await async_get_csgo_item_categories(collector, pages_in_flight=pages_in_flight, archive_raw=archive_raw)
+        collector.rate_limiter.report()
+    if proxy_pool:
+        proxy_pool.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="基于asyncio收集Steam市场的CSGO物品数据")
+    parser.add_argument("--archive-raw", action="store_true", help="另外把原始搜索结果归档到 .raw.jsonl.gz")
+    add_arguments(parser)
+    http_cache.add_arguments(parser)
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    exporters = start_exporters(args.metrics_port, args.metrics_file, metrics_host=args.metrics_host)
+    try:
+        asyncio.run(async_main(cache=http_cache.open_cache(args), refresh_cache=args.refresh_cache,
+                               archive_raw=args.archive_raw))
+    finally:
+        close_exporters(exporters)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import argparse
+import concurrent.futures
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from collector import SteamMarketCollector
+from db_setup import bump_generation, create_database, configure_connection, refresh_rollups, write_price_history
+import http_cache
+from partitions import archive_boundary_timestamp
+from metrics import REGISTRY, add_arguments, close_exporters, configure_logging, start_exporters
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_ITEMS = REGISTRY.counter("backfill_items_total", "回填的物品数", ("status",))
+BACKFILL_POINTS = REGISTRY.counter("backfill_points_total", "回填写入的价格点数")
+
+def parse_price_history(data):
+    """把Steam pricehistory返回的prices数组转换为 (timestamp, price, volume) 列表
+    
+    每个点的格式为 ["Oct 19 2025 01: +0", 1.23, "45"]，时间为UTC整点。
+    """
+    points = []
+    for entry in (data or {}).get("prices", []):
+        try:
+            date_text, price, volume = entry[0], entry[1], entry[2]
+            timestamp = datetime.strptime(date_text.split(":")[0], "%b %d %Y %H")
+            points.append((timestamp.strftime("%Y-%m-%d %H:%M:%S"), float(price),
+                           int(str(volume).replace(",", ""))))
+        except (ValueError, IndexError, TypeError) as e:
+            logger.warning(f"无法解析价格点 {entry}: {e}")
+    return points
+
+def select_backfill_items(conn, max_age_hours=24, limit=None, retry_minutes=60, max_failures=5):
+    """选出需要回填的物品：从未回填的优先，其次按成交量从高到低、上次回填时间从早到晚
+    
+    抓取失败的物品排在最后，第 n 次连续失败后等待 retry_minutes * 2^(n-1) 分钟再重试，
+    连续失败 max_failures 次后不再选出（成功一次后清零）。
+    """
+    query = '''
+    SELECT c.id, c.market_hash_name
+    FROM csgo_items c
+    LEFT JOIN price_history_backfill b ON b.item_id = c.id
+    WHERE b.item_id IS NULL
+       OR (b.status = 'failed' AND b.attempts < ?
+           AND COALESCE(b.last_failed, '') < datetime('now', printf('-%f minutes', ? * (1 << (b.attempts - 1)))))
+       OR (b.status IS NOT 'failed' AND (b.last_fetched IS NULL OR b.last_fetched < datetime('now', ?)))
+    ORDER BY b.status IS 'failed', b.last_fetched IS NOT NULL, c.volume DESC, b.last_fetched
+    '''
+    params = [max_failures, retry_minutes, f"-{max_age_hours} hours"]
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+    return conn.execute(query, params).fetchall()
+
+def _record_results(conn, results):
+    """把一批物品的价格点和回填状态写在同一个事务里，中断后已提交的物品不会重复抓取
+    
+    早于归档边界的价格点已经在归档分区中（Steam的历史数据不会再变化），不再写入主库。
+    """
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    boundary = archive_boundary_timestamp(conn)
+    rows = []
+    states = []
+    for item_id, points in results:
+        if points is None:
+            states.append((item_id, None, None, 0, "failed", 1, now))
+            BACKFILL_ITEMS.inc(status="failed")
+            continue
+        BACKFILL_ITEMS.inc(status="ok")
+        rows.extend((item_id, price, volume, timestamp) for timestamp, price, volume in points
+                    if boundary is None or timestamp >= boundary)
+        last_point = points[-1][0] if points else None
+        states.append((item_id, now, last_point, len(points), "ok", 0, None))
+    
+    with conn:
+        cursor = conn.cursor()
+        write_price_history(cursor, rows)
+        cursor.executemany('''
+        INSERT INTO price_history_backfill (item_id, last_fetched, last_point, points, status, attempts, last_failed)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (item_id) DO UPDATE SET
+            last_fetched = COALESCE(excluded.last_fetched, price_history_backfill.last_fetched),
+            last_point = COALESCE(excluded.last_point, price_history_backfill.last_point),
+            points = excluded.points,
+            status = excluded.status,
+            attempts = CASE WHEN excluded.status = 'failed' THEN price_history_backfill.attempts + 1 ELSE 0 END,
+            last_failed = excluded.last_failed
+        ''', states)
+        refresh_rollups(cursor)
+        bump_generation(cursor)
+    BACKFILL_POINTS.inc(len(rows))
+    return len(rows)
+
+def backfill_price_history(collector, db_path='csgo_items.db', appid=730, max_workers=8,
+                           max_age_hours=24, limit=None, commit_every=50, retry_minutes=60, max_failures=5):
+    """并发抓取物品价格历史并批量写入price_history
+    
+    抓取在线程池中进行，速率由收集器的限速器控制；写入只在当前线程进行，
+    每 commit_every 个物品提交一次。失败的物品按 retry_minutes、max_failures 退避重试（见 select_backfill_items）。
+    """
+    conn = create_database(db_path)
+    configure_connection(conn)
+    
+    items = select_backfill_items(conn, max_age_hours, limit, retry_minutes, max_failures)
+    if not items:
+        logger.info("没有需要回填价格历史的物品")
+        conn.close()
+        return {"items": 0, "failed": 0, "points": 0, "seconds": 0.0}
+    logger.info(f"需要回填 {len(items)} 个物品的价格历史")
+    
+    def fetch(item):
+        item_id, market_hash_name = item
+        data = collector.get_item_price_history(appid, market_hash_name)
+        return item_id, (parse_price_history(data) if data is not None else None)
+    
+    started = time.perf_counter()
+    done = 0
+    failed = 0
+    points_written = 0
+    pending_results = []
+    item_iter = iter(items)
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # 只保持有限数量的任务在途，避免一次提交全部物品；in_flight: {future: 物品}
+        in_flight = {}
+        for item in item_iter:
+            in_flight[executor.submit(fetch, item)] = item
+            if len(in_flight) >= max_workers * 2:
+                break
+        
+        while in_flight:
+            finished, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                item_id, market_hash_name = in_flight.pop(future)
+                try:
+                    _, points = future.result()
+                except Exception as e:
+                    # 与抓取失败相同：记为失败，退避后重新选出
+                    logger.error(f"回填 {market_hash_name} 时出错: {e}")
+                    points = None
+                pending_results.append((item_id, points))
+                done += 1
+                if points is None:
+                    failed += 1
+                next_item = next(item_iter, None)
+                if next_item is not None:
+                    in_flight[executor.submit(fetch, next_item)] = next_item
+            
+            if len(pending_results) >= commit_every or (not in_flight and pending_results):
+                points_written += _record_results(conn, pending_results)
+                pending_results = []
+                elapsed = time.perf_counter() - started
+                logger.info(f"已回填 {done}/{len(items)} 个物品（失败 {failed}），写入 {points_written} 个价格点，"
+                            f"{done / elapsed:.2f} 物品/秒")
+    
+    conn.close()
+    logger.info(f"回填完成: {done - failed} 个成功，{failed} 个失败，共 {points_written} 个价格点")
+    return {"items": done, "failed": failed, "points": points_written, "seconds": time.perf_counter() - started}
+
+def main():
+    parser = argparse.ArgumentParser(description="回填物品的Steam价格历史")
+    parser.add_argument("--db", default="csgo_items.db", help="数据库文件")
+    parser.add_argument("--workers", type=int, default=8, help="并发抓取线程数")
+    parser.add_argument("--max-age-hours", type=float, default=24, help="超过该时间未回填的物品会重新抓取")
+    parser.add_argument("--limit", type=int, default=None, help="本次最多回填的物品数")
+    parser.add_argument("--retry-minutes", type=float, default=60, help="失败物品第一次重试前的等待时间，之后每次失败加倍")
+    parser.add_argument("--max-failures", type=int, default=5, help="连续失败该次数后不再重试")
+    parser.add_argument("--no-proxy-pool", action="store_true", help="不使用代理池")
+    add_arguments(parser)
+    http_cache.add_arguments(parser)
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    exporters = start_exporters(args.metrics_port, args.metrics_file, metrics_host=args.metrics_host)
+    
+    # pricehistory接口需要登录，从环境变量读取steamLoginSecure
+    login_secure = os.environ.get("STEAM_LOGIN_SECURE")
+    cookies = {"steamLoginSecure": login_secure} if login_secure else None
+    if not cookies:
+        logger.warning("未设置 STEAM_LOGIN_SECURE，价格历史接口可能返回400")
+    
+    collector = SteamMarketCollector(enable_proxy_pool=not args.no_proxy_pool, cookies=cookies,
+                                     cache=http_cache.open_cache(args), refresh_cache=args.refresh_cache)
+    try:
+        backfill_price_history(collector, args.db, max_workers=args.workers,
+                               max_age_hours=args.max_age_hours, limit=args.limit,
+                               retry_minutes=args.retry_minutes, max_failures=args.max_failures)
+    finally:
+        collector.close()
+        close_exporters(exporters)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from backfill import backfill_price_history
+from collector import (ProxyPool, SessionManager, SteamMarketCollector, get_csgo_item_categories, get_item_types,
+                       SLEEP_SECONDS)
+from db_query import CSGODatabase
+from db_setup import import_data
+from metrics import configure_logging
+from mock_steam import MockSteamMarket
+from rate_limiter import RateLimiter
+
+# 回归检查的指标: (阶段, 指标, 是否越大越好)
+REGRESSION_METRICS = [
+    ("crawl", "pages_per_sec", True),
+    ("crawl", "items_per_sec", True),
+    ("crawl", "latency_p99_ms", False),
+    ("import", "rows_per_sec", True),
+    ("backfill", "items_per_sec", True),
+]
+
+def percentile(values, q):
+    """最近秩百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, -(-len(ordered) * q // 100) - 1))
+    return ordered[int(index)]
+
+class TimedSessionManager(SessionManager):
+    """记录每个HTTP请求耗时（按接口分别统计）的SessionManager"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = {}
+    
+    def get(self, url, proxy=None, headers=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().get(url, proxy=proxy, headers=headers, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            endpoint = "pricehistory" if "/pricehistory" in url else "search"
+            with self._lock:
+                self.latencies.setdefault(endpoint, []).append(elapsed)
+
+def _latency_summary(latencies):
+    return {
+        "requests": len(latencies),
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+def _rate(count, seconds):
+    return round(count / seconds, 2) if seconds > 0 else 0.0
+
+def _checkpoint_items(save_dir):
+    total = 0
+    for cursor_path in glob.glob(os.path.join(save_dir, "*.cursor")):
+        with open(cursor_path, 'r', encoding='utf-8') as f:
+            total += json.load(f)["items"]
+    return total
+
+def run_benchmark(args, work_dir):
+    """对模拟服务运行 收集 → 导入 → 回填 → 查询 全流程，返回各阶段指标"""
+    item_types = get_item_types(args.all_items)
+    market = MockSteamMarket(args.items_per_type, item_types, latency=args.latency, jitter=args.jitter,
+                             throttle_rate=args.throttle_rate, proxies=args.proxies,
+                             bad_proxies=args.bad_proxies)
+    results = {"params": {key: value for key, value in vars(args).items()
+                          if key not in ("output", "baseline", "tolerance", "work_dir", "verbose")}}
+    
+    with market:
+        proxy_pool = None
+        if market.proxies:
+            proxy_pool = ProxyPool(min_proxies=0, proxies=market.proxies, probe_interval=1,
+                                   quarantine_base=2, validation_url=f"{market.base_url}/")
+        rate_limiter = RateLimiter(endpoint_rates={
+            "search": (args.rate, args.rate),
+            "pricehistory": (args.rate, args.rate),
+        })
+        collector = SteamMarketCollector(rate_limiter=rate_limiter, base_url=market.base_url,
+                                         proxy_pool=proxy_pool, pool_maxsize=args.workers)
+        collector.sessions = TimedSessionManager(collector.sessions.pool_connections,
+                                                 collector.sessions.pool_maxsize,
+                                                 headers=collector.sessions.headers)
+        save_dir = os.path.join(work_dir, "data", "categories")
+        db_path = os.path.join(work_dir, "csgo_items.db")
+        
+        try:
+            # 1. 收集
+            started = time.perf_counter()
+            get_csgo_item_categories(collector, args.workers, args.max_pages, args.all_items,
+                                     save_dir, args.items_per_page)
+            elapsed = time.perf_counter() - started
+            pages = market.snapshot().get("search:200", 0)
+            items = _checkpoint_items(save_dir)
+            expected = len(item_types) * min(args.items_per_type, args.max_pages * args.items_per_page)
+            results["crawl"] = {
+                "seconds": round(elapsed, 3),
+                "pages": pages,
+                "items": items,
+                "complete": items == expected,
+                "pages_per_sec": _rate(pages, elapsed),
+                "items_per_sec": _rate(items, elapsed),
+                "throttled": market.snapshot().get("search:429", 0),
+                "rate_limit_wait_s": round(SLEEP_SECONDS.value(endpoint="search", reason="rate_limit"), 3),
+                "backoff_wait_s": round(SLEEP_SECONDS.value(endpoint="search", reason="backoff"), 3),
+                **_latency_summary(collector.sessions.latencies.get("search", [])),
+            }
+            
+            # 2. 导入
+            imported = import_data(os.path.join(work_dir, "data"), db_path, args.batch_size,
+                                   workers=args.import_workers)
+            results["import"] = {
+                "seconds": round(imported["seconds"], 3),
+                "rows": imported["rows"],
+                "rows_per_sec": _rate(imported["rows"], imported["seconds"]),
+            }
+            
+            # 3. 价格历史回填
+            if args.backfill_items:
+                backfilled = backfill_price_history(collector, db_path, max_workers=args.workers,
+                                                    limit=args.backfill_items)
+                results["backfill"] = {
+                    "seconds": round(backfilled["seconds"], 3),
+                    "items": backfilled["items"],
+                    "failed": backfilled["failed"],
+                    "points": backfilled["points"],
+                    "items_per_sec": _rate(backfilled["items"], backfilled["seconds"]),
+                    **_latency_summary(collector.sessions.latencies.get("pricehistory", [])),
+                }
+        finally:
+            collector.close()
+    
+    # 4. 查询
+    # 关闭结果缓存，测量的是SQL查询本身
+    db = CSGODatabase(db_path, cache_size=0)
+    try:
+        category = db.get_categories()[0][0]
+        db.cursor.execute("SELECT item_id FROM price_history ORDER BY id DESC LIMIT 1")
+        row = db.cursor.fetchone()
+        queries = {
+            "get_all_items": lambda: db.get_all_items(100),
+            "get_categories": db.get_categories,
+            "get_items_by_category": lambda: db.get_items_by_category(category),
+            "search_items": lambda: db.search_items("mock rifle"),
+            "get_item_price_history": lambda: db.get_item_price_history(row[0] if row else 1),
+        }
+        results["queries"] = {}
+        for name, query in queries.items():
+            timings = []
+            for _ in range(args.query_repeat):
+                started = time.perf_counter()
+                query()
+                timings.append(time.perf_counter() - started)
+            results["queries"][name] = {"median_ms": round(statistics.median(timings) * 1000, 3)}
+    finally:
+        db.close()
+    
+    results["server"] = market.snapshot()
+    return results
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """与基线结果比较，返回超出容差的回归列表"""
+    if baseline.get("params") != results.get("params"):
+        print("警告: 基线的运行参数与本次不同，比较结果可能没有意义")
+    regressions = []
+    for stage, metric, higher_is_better in REGRESSION_METRICS:
+        old = baseline.get(stage, {}).get(metric)
+        new = results.get(stage, {}).get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append(f"{stage}.{metric}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+def print_report(results):
+    crawl = results["crawl"]
+    print(f"收集: {crawl['pages']} 页 / {crawl['items']} 个物品，用时 {crawl['seconds']} 秒，"
+          f"{crawl['pages_per_sec']} 页/秒，{crawl['items_per_sec']} 物品/秒"
+          f"{'' if crawl['complete'] else '（不完整）'}")
+    print(f"  请求 {crawl['requests']} 次，429 {crawl['throttled']} 次，"
+          f"延迟 p50 {crawl['latency_p50_ms']} ms，p99 {crawl['latency_p99_ms']} ms，"
+          f"限速等待 {crawl['rate_limit_wait_s']} 秒，退避 {crawl['backoff_wait_s']} 秒（各线程累计）")
+    imported = results["import"]
+    print(f"导入: {imported['rows']} 行，用时 {imported['seconds']} 秒，{imported['rows_per_sec']} 行/秒")
+    if "backfill" in results:
+        backfill = results["backfill"]
+        print(f"回填: {backfill['items']} 个物品（失败 {backfill['failed']}），{backfill['points']} 个价格点，"
+              f"{backfill['items_per_sec']} 物品/秒，延迟 p50 {backfill['latency_p50_ms']} ms，"
+              f"p99 {backfill['latency_p99_ms']} ms")
+    for name, timing in results["queries"].items():
+        print(f"查询 {name}: {timing['median_ms']} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="对本地模拟的Steam市场运行端到端性能基准")
+    parser.add_argument("--items-per-type", type=int, default=300, help="每个物品类型的物品数")
+    parser.add_argument("--items-per-page", type=int, default=100, help="每页请求的物品数")
+    parser.add_argument("--max-pages", type=int, default=500, help="每个类型最多请求的页数")
+    parser.add_argument("--all-items", action="store_true", help="收集全部物品类型（默认只收集基础类型）")
+    parser.add_argument("--workers", type=int, default=5, help="并发线程数")
+    parser.add_argument("--rate", type=float, default=50.0, help="每个 (代理, 接口) 的请求速率上限")
+    parser.add_argument("--latency", type=float, default=0.02, help="模拟服务的固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.01, help="模拟服务的随机延迟上限（秒）")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="模拟服务返回429的概率")
+    parser.add_argument("--proxies", type=int, default=0, help="假代理数量（0表示直连）")
+    parser.add_argument("--bad-proxies", type=int, default=0, help="其中频繁返回429的代理数量")
+    parser.add_argument("--batch-size", type=int, default=1000, help="导入时每批的行数")
+    parser.add_argument("--import-workers", type=int, default=1, help="导入时解析文件的进程数")
+    parser.add_argument("--backfill-items", type=int, default=200, help="回填价格历史的物品数（0表示跳过）")
+    parser.add_argument("--query-repeat", type=int, default=20, help="每个查询重复次数")
+    parser.add_argument("--work-dir", help="保留数据和数据库的目录（默认使用临时目录）")
+    parser.add_argument("--output", help="把结果写入JSON文件，可作为之后运行的基线")
+    parser.add_argument("--baseline", help="与基线JSON比较，出现回归时以非零状态退出")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对退化比例")
+    parser.add_argument("--verbose", action="store_true", help="显示各阶段的进度日志")
+    args = parser.parse_args()
+    # 默认只显示错误，避免各阶段的进度日志淹没基准结果
+    configure_logging("INFO" if args.verbose else "ERROR")
+    
+    if args.work_dir:
+        os.makedirs(args.work_dir, exist_ok=True)
+        results = run_benchmark(args, args.work_dir)
+    else:
+        with tempfile.TemporaryDirectory() as work_dir:
+            results = run_benchmark(args, work_dir)
+    
+    print_report(results)
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"性能回归: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("未发现性能回归")
+
+if __name__ == "__main__":
+    main()
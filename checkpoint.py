@@ -0,0 +1,185 @@
+import gzip
+import json
+import logging
+import os
+import glob
+import time
+from datetime import datetime
+
+from metrics import REGISTRY, configure_logging
+from records import StringTable, encode_lines, iter_jsonl_items, iter_jsonl_records
+
+logger = logging.getLogger(__name__)
+
+WRITE_SECONDS = REGISTRY.histogram("checkpoint_write_seconds", "检查点写入耗时（append: 追加一页，compact: 压实）", ("op",))
+
+def _empty_cursor():
+    # total: 第一页返回的 total_count；done: 已完成页的起始索引（页可能乱序完成）；
+    # strings: 数据文件中已定义的字符串表（紧凑记录中的类型和稀有度编号）
+    return {"next_start": 0, "items": 0, "offset": 0, "pages": 0, "total": None, "done": [], "strings": []}
+
+class CategoryCheckpoint:
+    """单个物品类型的追加式检查点：JSONL数据文件 + 游标文件
+    
+    数据文件中每个物品是一行紧凑记录（records.ItemRecord），旧版检查点中的原始结果行在读取时转换。
+    """
+    
+    def __init__(self, save_dir, item_type, date_str=None):
+        if date_str is None:
+            date_str = datetime.now().strftime("%Y%m%d")
+        base = os.path.join(save_dir, f"{item_type}_{date_str}")
+        self.item_type = item_type
+        self.data_path = base + ".jsonl"
+        self.cursor_path = base + ".cursor"
+        self.json_path = base + ".json"
+        self.raw_path = base + ".raw.jsonl.gz"
+        os.makedirs(save_dir, exist_ok=True)
+        self._migrate_legacy_json()
+        self.cursor = self._load_cursor()
+        self._truncate_to_cursor()
+        self._strings = StringTable(self.cursor["strings"])
+    
+    @property
+    def next_start(self):
+        return self.cursor["next_start"]
+    
+    @property
+    def item_count(self):
+        return self.cursor["items"]
+    
+    @property
+    def total(self):
+        return self.cursor["total"]
+    
+    def completed_starts(self, items_per_page):
+        """已完成页的起始索引；旧版游标没有记录时，视 next_start 之前的页为已完成"""
+        if not self.cursor["done"]:
+            self.cursor["done"] = list(range(0, self.cursor["next_start"], items_per_page))
+        return set(self.cursor["done"])
+    
+    def set_total(self, total):
+        """记录类型的物品总数"""
+        self.cursor["total"] = total
+        self._save_cursor()
+    
+    def _load_cursor(self):
+        """只读取游标文件，不解析数据文件"""
+        cursor = _empty_cursor()
+        if os.path.exists(self.cursor_path):
+            try:
+                with open(self.cursor_path, 'r', encoding='utf-8') as f:
+                    cursor.update(json.load(f))
+            except Exception as e:
+                logger.warning(f"读取游标文件 {self.cursor_path} 时出错: {e}，从头开始")
+        return cursor
+    
+    def _save_cursor(self):
+        tmp_path = self.cursor_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.cursor, f)
+        os.replace(tmp_path, self.cursor_path)
+    
+    def _truncate_to_cursor(self):
+        """丢弃游标之后的半页数据（例如写入途中进程被终止）"""
+        size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        if size > self.cursor["offset"]:
+            with open(self.data_path, 'r+b') as f:
+                f.truncate(self.cursor["offset"])
+        elif size < self.cursor["offset"]:
+            logger.warning(f"数据文件 {self.data_path} 比游标记录的短，重新开始")
+            self.cursor = _empty_cursor()
+            if os.path.exists(self.data_path):
+                os.remove(self.data_path)
+            self._save_cursor()
+    
+    def _migrate_legacy_json(self):
+        """把旧版整体写入的JSON文件转换为JSONL检查点（只执行一次）"""
+        if os.path.exists(self.cursor_path) or not os.path.exists(self.json_path):
+            return
+        try:
+            with open(self.json_path, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+        except Exception as e:
+            logger.error(f"加载旧版文件 {self.json_path} 时出错: {e}")
+            return
+        if not isinstance(items, list):
+            return
+        with open(self.data_path, 'w', encoding='utf-8') as f:
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            offset = f.tell()
+        self.cursor = dict(_empty_cursor(), next_start=len(items), items=len(items), offset=offset)
+        self._save_cursor()
+        logger.info(f"已将 {self.json_path} 转换为检查点，共 {len(items)} 个物品")
+    
+    def append_page(self, records, next_start, start=None):
+        """追加一页记录并推进游标，start 为该页的起始索引（并发抓取时页可能乱序到达）"""
+        started = time.perf_counter()
+        with open(self.data_path, 'a', encoding='utf-8') as f:
+            for line in encode_lines(records, self._strings):
+                f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            offset = f.tell()
+        self.cursor["offset"] = offset
+        self.cursor["next_start"] = max(self.cursor["next_start"], next_start)
+        self.cursor["items"] += len(records)
+        self.cursor["strings"] = list(self._strings.values)
+        self.cursor["pages"] += 1
+        if start is not None and start not in self.cursor["done"]:
+            self.cursor["done"].append(start)
+        self._save_cursor()
+        WRITE_SECONDS.observe(time.perf_counter() - started, op="append")
+    
+    def archive_raw(self, results):
+        """把一页原始search/render结果追加到gzip归档（只用于排查问题，导入时不读取）"""
+        with gzip.open(self.raw_path, 'at', encoding='utf-8') as f:
+            for item in results:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    
+    def iter_records(self):
+        """逐行读取检查点中的物品记录"""
+        if not os.path.exists(self.data_path):
+            return
+        with open(self.data_path, 'r', encoding='utf-8') as f:
+            yield from iter_jsonl_records(f)
+    
+    def iter_items(self):
+        """逐行读取检查点中的物品，紧凑记录转换为扁平字典"""
+        if not os.path.exists(self.data_path):
+            return
+        with open(self.data_path, 'r', encoding='utf-8') as f:
+            yield from iter_jsonl_items(f)
+    
+    def compact(self):
+        """把JSONL检查点压实为db_setup.import_data可读取的JSON数组文件"""
+        tmp_path = self.json_path + ".tmp"
+        count = 0
+        started = time.perf_counter()
+        with open(tmp_path, 'w', encoding='utf-8') as out:
+            out.write("[")
+            for record in self.iter_records():
+                out.write(",\n" if count else "\n")
+                out.write(json.dumps(record.as_dict(), ensure_ascii=False))
+                count += 1
+            out.write("\n]\n")
+        os.replace(tmp_path, self.json_path)
+        WRITE_SECONDS.observe(time.perf_counter() - started, op="compact")
+        return count
+
+def compact_checkpoints(save_dir="data/categories"):
+    """压实目录下的所有检查点"""
+    total = 0
+    for cursor_path in sorted(glob.glob(os.path.join(save_dir, "*.cursor"))):
+        stem = os.path.basename(cursor_path)[:-len(".cursor")]
+        item_type, _, date_str = stem.rpartition("_")
+        checkpoint = CategoryCheckpoint(save_dir, item_type, date_str)
+        count = checkpoint.compact()
+        logger.info(f"已压实 {checkpoint.json_path}，共 {count} 个物品")
+        total += count
+    return total
+
+if __name__ == "__main__":
+    import sys
+    configure_logging()
+    compact_checkpoints(sys.argv[1] if len(sys.argv) > 1 else "data/categories")
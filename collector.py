@@ -1,22 +1,168 @@
 import requests
+import argparse
 import json
+import logging
 import os
 import time
 import random
 import re
 import concurrent.futures
+import threading
+from collections import deque
 import urllib3
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 from datetime import datetime
 
+from checkpoint import CategoryCheckpoint
+from crawl_planner import CrawlPlanner
+import http_cache
+from metrics import REGISTRY, add_arguments, close_exporters, configure_logging, start_exporters
+from rate_limiter import RateLimiter, backoff_delay, parse_retry_after, proxy_key
+from work_queue import QueueWorker, open_queue
+
+logger = logging.getLogger(__name__)
+
+# 收集器指标，同步和异步引擎共用
+REQUEST_SECONDS = REGISTRY.histogram("steam_request_seconds", "Steam接口请求的网络耗时（秒）", ("endpoint", "proxy"))
+REQUESTS = REGISTRY.counter("steam_requests_total", "Steam接口请求数，按HTTP状态码或错误类型", ("endpoint", "status"))
+RETRIES = REGISTRY.counter("steam_retries_total", "失败后重试的次数，按原因（429、ssl、error）", ("endpoint", "cause"))
+SLEEP_SECONDS = REGISTRY.counter("steam_sleep_seconds_total",
+                                 "发送请求前的等待时间（rate_limit: 令牌桶，backoff: 重试退避）", ("endpoint", "reason"))
+PROXY_ACTIVE = REGISTRY.gauge("proxy_pool_active", "未被隔离的代理数")
+PROXY_EVENTS = REGISTRY.counter("proxy_pool_events_total", "代理池事件（quarantine、recover、remove）", ("event",))
+
+def proxy_label(proxy):
+    """指标中使用的代理标签，去掉代理地址中的用户名和密码"""
+    return re.sub(r"//[^/@]*@", "//", proxy_key(proxy))
+
+# Steam市场接口地址，测试和基准时可替换为 mock_steam.py 的地址
+STEAM_MARKET_URL = "https://steamcommunity.com/market"
+
+# 扩展User-Agent列表
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.107 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:90.0) Gecko/20100101 Firefox/90.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.164 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.2 Safari/605.1.15",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:90.0) Gecko/20100101 Firefox/90.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36"
+]
+
+# CSGO物品类型
+CSGO_ITEM_TYPES = [
+    "Pistol", "SMG", "Rifle", "Sniper Rifle", "Shotgun", "Machinegun",
+    "Container", "Key", "Pass", "Gift", "Tag", "Tool",
+    "Sticker", "Music Kit", "Weapon Case", "Graffiti", "Patch",
+    "Collectible", "Gloves", "Agents", "Knives"
+]
+
+# 获取所有物品时追加的类型
+CSGO_EXTRA_ITEM_TYPES = [
+    "Hands", "Crate", "Operation Pass", "Sealed Graffiti",
+    "Sticker Capsule", "Pin", "Souvenir Package", "Autograph Capsule",
+    "Patch Pack", "Storage Unit", "Viewer Pass", "Map Token",
+    "Name Tag", "Case Key", "Ticket", "Medal", "Coin"
+]
+
+def get_item_types(all_items=True):
+    """返回要收集的物品类型列表"""
+    item_types = list(CSGO_ITEM_TYPES)
+    if all_items:
+        item_types.extend(CSGO_EXTRA_ITEM_TYPES)
+    return item_types
+
+class ProxyStats:
+    """单个代理的健康统计：成功率、延迟EWMA、最近的429/SSL错误"""
+    
+    def __init__(self, proxy, latency=None):
+        self.proxy = proxy
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = latency
+        self.recent_errors = deque(maxlen=50)
+        self.quarantined_until = 0.0
+        self.quarantine_count = 0
+    
+    def success_rate(self):
+        # 拉普拉斯平滑，新代理从0.5开始
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+    
+    def recent_error_count(self, now, window):
+        return sum(1 for t, _ in self.recent_errors if now - t <= window)
+    
+    def score(self, now, window):
+        """健康分数：成功率越高、延迟越低、最近错误越少，被选中的概率越大"""
+        latency = self.latency if self.latency is not None else 1.0
+        return self.success_rate() / (latency + 0.1) / (1 + self.recent_error_count(now, window))
+    
+    def is_quarantined(self, now):
+        return now < self.quarantined_until
+
 class ProxyPool:
-    def __init__(self, min_proxies=5, max_proxies=20):
+    def __init__(self, min_proxies=5, max_proxies=20, proxies=None, background=True,
+                 probe_interval=30, ewma_alpha=0.3, error_window=60, max_recent_errors=5,
+                 max_consecutive_failures=3, quarantine_base=30, quarantine_max=600, max_quarantines=5,
+                 validation_url=None):
         self.proxies = []
+        self.stats = {}
         self.min_proxies = min_proxies
         self.max_proxies = max_proxies
-        self.current_index = 0
-        self.validation_url = "https://steamcommunity.com/market/"
-        self._get_proxies()
+        self.validation_url = validation_url or f"{STEAM_MARKET_URL}/"
+        self.probe_interval = probe_interval
+        self.ewma_alpha = ewma_alpha
+        self.error_window = error_window
+        self.max_recent_errors = max_recent_errors
+        self.max_consecutive_failures = max_consecutive_failures
+        self.quarantine_base = quarantine_base
+        self.quarantine_max = quarantine_max
+        self.max_quarantines = max_quarantines
+        self.lock = threading.RLock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._ready = threading.Event()
+        self._thread = None
+        
+        # 直接提供的代理（例如测试环境）不需要验证
+        for proxy in proxies or []:
+            self._add_proxy(proxy)
+        
+        if background:
+            # 后台验证和补充代理，启动时不阻塞
+            self._thread = threading.Thread(target=self._maintain, name="proxy-pool", daemon=True)
+            self._thread.start()
+        else:
+            self._get_proxies()
+            self._ready.set()
+    
+    def _maintain(self):
+        """后台线程：代理不足时补充，定期复查被隔离的代理"""
+        while not self._stop.is_set():
+            try:
+                if self.active_count() < self.min_proxies:
+                    self._get_proxies()
+                self._probe_quarantined()
+            except Exception as e:
+                logger.error(f"维护代理池时出错: {e}")
+            PROXY_ACTIVE.set(self.active_count())
+            self._ready.set()
+            self._wake.wait(self.probe_interval)
+            self._wake.clear()
+    
+    def wait_ready(self, timeout=None):
+        """等待第一轮代理验证完成（可选）"""
+        return self._ready.wait(timeout)
+    
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
     
     def _get_proxies(self):
         """从多个来源获取代理IP"""
@@ -26,17 +172,17 @@ class ProxyPool:
         ]
         
         for source in sources:
-            if len(self.proxies) >= self.min_proxies:
+            if self.active_count() >= self.min_proxies:
                 break
             try:
                 source()
             except Exception as e:
-                print(f"从代理源获取代理时出错: {e}")
+                logger.warning(f"从代理源获取代理时出错: {e}")
         
         if self.proxies:
-            print(f"成功获取 {len(self.proxies)} 个有效代理")
+            logger.info(f"代理池中共有 {len(self.proxies)} 个代理，其中 {self.active_count()} 个可用")
         else:
-            print("警告: 未能获取任何有效代理")
+            logger.warning("未能获取任何有效代理")
     
     def _get_kuaidaili_proxies(self):
         """从快代理获取免费代理IP"""
@@ -55,7 +201,7 @@ class ProxyPool:
             
             self._validate_proxies(proxies)
         except Exception as e:
-            print(f"从快代理获取代理时出错: {e}")
+            logger.warning(f"从快代理获取代理时出错: {e}")
     
     def _get_89ip_proxies(self):
         """从89IP获取免费代理"""
@@ -76,204 +222,420 @@ class ProxyPool:
             
             self._validate_proxies(proxies)
         except Exception as e:
-            print(f"从89IP获取代理时出错: {e}")
+            logger.warning(f"从89IP获取代理时出错: {e}")
     
     def _validate_proxies(self, proxy_list):
-        """验证代理是否可用"""
-        valid_proxies = []
+        """并发验证代理，验证通过的代理立即加入代理池"""
+        with self.lock:
+            proxy_list = [p for p in proxy_list if f"http://{p}" not in self.stats]
         
         with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
             future_to_proxy = {executor.submit(self._check_proxy, proxy): proxy for proxy in proxy_list}
             for future in concurrent.futures.as_completed(future_to_proxy):
                 proxy = future_to_proxy[future]
                 try:
-                    is_valid = future.result()
-                    if is_valid:
-                        valid_proxies.append(proxy)
+                    latency = future.result()
+                    if latency is not None:
+                        self._add_proxy({"http": f"http://{proxy}", "https": f"http://{proxy}"}, latency)
                         # 如果已经找到足够的有效代理，提前结束
-                        if len(self.proxies) + len(valid_proxies) >= self.max_proxies:
+                        if self.active_count() >= self.max_proxies:
                             break
                 except Exception as e:
-                    print(f"验证代理 {proxy} 时出错: {e}")
-        
-        # 添加有效代理到代理池
-        for proxy in valid_proxies:
-            if len(self.proxies) < self.max_proxies:
-                self.proxies.append({"http": f"http://{proxy}", "https": f"http://{proxy}"})
-            else:
-                break
+                    logger.debug(f"验证代理 {proxy} 时出错: {e}")
     
     def _check_proxy(self, proxy):
-        """检查单个代理是否可用"""
-        proxies = {"http": f"http://{proxy}", "https": f"http://{proxy}"}
+        """检查单个代理是否可用，可用时返回延迟（秒），否则返回None"""
+        if isinstance(proxy, dict):
+            proxies = proxy
+        else:
+            proxies = {"http": f"http://{proxy}", "https": f"http://{proxy}"}
         try:
+            started = time.monotonic()
             response = requests.get(self.validation_url, proxies=proxies, timeout=5)
-            return response.status_code == 200
-        except:
-            return False
+            if response.status_code == 200:
+                return time.monotonic() - started
+        except Exception:
+            pass
+        return None
+    
+    def _add_proxy(self, proxy, latency=None):
+        key = proxy_key(proxy)
+        with self.lock:
+            if key in self.stats or self.active_count() >= self.max_proxies:
+                return
+            self.stats[key] = ProxyStats(proxy, latency)
+            self.proxies.append(proxy)
+            PROXY_ACTIVE.set(self.active_count())
+    
+    def active_count(self):
+        """未被隔离的代理数量"""
+        now = time.monotonic()
+        with self.lock:
+            return sum(1 for stats in self.stats.values() if not stats.is_quarantined(now))
     
     def get_proxy(self):
-        """获取一个代理"""
-        if not self.proxies:
-            return None
-        
-        # 轮换使用代理
-        proxy = self.proxies[self.current_index]
-        self.current_index = (self.current_index + 1) % len(self.proxies)
-        return proxy
+        """按健康分数加权随机选择一个未被隔离的代理"""
+        now = time.monotonic()
+        with self.lock:
+            candidates = [stats for stats in self.stats.values() if not stats.is_quarantined(now)]
+            if not candidates:
+                return None
+            weights = [stats.score(now, self.error_window) for stats in candidates]
+            return random.choices(candidates, weights=weights)[0].proxy
+    
+    def report_success(self, proxy, latency):
+        """记录一次成功请求及其延迟"""
+        with self.lock:
+            stats = self.stats.get(proxy_key(proxy))
+            if stats is None:
+                return
+            stats.successes += 1
+            stats.consecutive_failures = 0
+            if stats.latency is None:
+                stats.latency = latency
+            else:
+                stats.latency = self.ewma_alpha * latency + (1 - self.ewma_alpha) * stats.latency
+    
+    def report_failure(self, proxy, kind="error"):
+        """记录一次失败请求，kind 为 "429"、"ssl" 或 "error"；错误过多时隔离该代理"""
+        now = time.monotonic()
+        with self.lock:
+            stats = self.stats.get(proxy_key(proxy))
+            if stats is None:
+                return
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            stats.recent_errors.append((now, kind))
+            if (stats.consecutive_failures >= self.max_consecutive_failures
+                    or stats.recent_error_count(now, self.error_window) >= self.max_recent_errors):
+                self._quarantine(stats, now)
+    
+    def _quarantine(self, stats, now):
+        """隔离代理，隔离时间随隔离次数指数增长"""
+        if stats.quarantine_count >= self.max_quarantines:
+            self.remove_proxy(stats.proxy)
+            return
+        duration = min(self.quarantine_max, self.quarantine_base * (2 ** stats.quarantine_count))
+        stats.quarantine_count += 1
+        stats.quarantined_until = now + duration
+        stats.consecutive_failures = 0
+        PROXY_EVENTS.inc(event="quarantine")
+        PROXY_ACTIVE.set(self.active_count())
+        logger.warning(f"隔离代理 {proxy_key(stats.proxy)} {duration:.0f} 秒，可用代理 {self.active_count()} 个")
+        if self.active_count() < self.min_proxies:
+            self._wake.set()
+    
+    def _probe_quarantined(self):
+        """重新探测隔离期已过的代理，通过则恢复使用"""
+        now = time.monotonic()
+        with self.lock:
+            due = [stats for stats in self.stats.values()
+                   if stats.quarantined_until and stats.quarantined_until <= now]
+        for stats in due:
+            latency = self._check_proxy(stats.proxy)
+            with self.lock:
+                if latency is not None:
+                    stats.quarantined_until = 0.0
+                    stats.latency = latency
+                    stats.recent_errors.clear()
+                    PROXY_EVENTS.inc(event="recover")
+                    PROXY_ACTIVE.set(self.active_count())
+                    logger.info(f"代理 {proxy_key(stats.proxy)} 恢复可用")
+                else:
+                    self._quarantine(stats, time.monotonic())
+    
+    def snapshot(self):
+        """返回每个代理的健康状态"""
+        now = time.monotonic()
+        with self.lock:
+            return [{
+                "proxy": key,
+                "score": round(stats.score(now, self.error_window), 4),
+                "success_rate": round(stats.success_rate(), 3),
+                "latency": round(stats.latency, 3) if stats.latency is not None else None,
+                "recent_errors": stats.recent_error_count(now, self.error_window),
+                "quarantined_for": round(max(0.0, stats.quarantined_until - now), 1),
+            } for key, stats in self.stats.items()]
     
     def remove_proxy(self, proxy):
         """从代理池中移除无效代理"""
-        if proxy in self.proxies:
-            self.proxies.remove(proxy)
-            print(f"移除无效代理，剩余 {len(self.proxies)} 个代理")
-            
-            # 如果代理数量低于最小值，尝试获取更多代理
-            if len(self.proxies) < self.min_proxies:
-                self._get_proxies()
+        with self.lock:
+            stats = self.stats.pop(proxy_key(proxy), None)
+            if stats is None:
+                return
+            if stats.proxy in self.proxies:
+                self.proxies.remove(stats.proxy)
+            PROXY_EVENTS.inc(event="remove")
+            PROXY_ACTIVE.set(self.active_count())
+            logger.info(f"移除无效代理，剩余 {len(self.proxies)} 个代理")
+        
+        # 如果代理数量低于最小值，唤醒后台线程补充，不阻塞当前请求
+        if self.active_count() < self.min_proxies:
+            self._wake.set()
+
+class SessionManager:
+    """按 (代理, 工作线程) 维护带连接池的keep-alive会话
+    
+    每个工作线程对每个代理使用独立的 requests.Session，代理和User-Agent在每次请求时传入，
+    不再修改共享会话的状态，因此线程之间不会互相覆盖设置，切换代理后也能复用已建立的TLS连接。
+    """
+    
+    def __init__(self, pool_connections=4, pool_maxsize=10, headers=None, cookies=None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.headers = dict(headers or {})
+        self.cookies = dict(cookies or {})
+        self._local = threading.local()
+        self._all_sessions = []
+        self._lock = threading.Lock()
+    
+    def _create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(self.headers)
+        session.cookies.update(self.cookies)
+        with self._lock:
+            self._all_sessions.append(session)
+        return session
+    
+    def get_session(self, proxy=None):
+        """返回当前线程用于该代理的会话"""
+        sessions = getattr(self._local, "sessions", None)
+        if sessions is None:
+            sessions = self._local.sessions = {}
+        key = proxy_key(proxy)
+        session = sessions.get(key)
+        if session is None:
+            session = sessions[key] = self._create_session()
+        return session
+    
+    def get(self, url, proxy=None, headers=None, **kwargs):
+        """发送GET请求，代理和请求头只作用于本次请求"""
+        session = self.get_session(proxy)
+        return session.get(url, proxies=proxy or None, headers=headers, **kwargs)
+    
+    def close(self):
+        """关闭所有线程创建的会话"""
+        with self._lock:
+            sessions, self._all_sessions = self._all_sessions, []
+        for session in sessions:
+            session.close()
 
 class SteamMarketCollector:
-    def __init__(self, use_proxy=False, proxy=None, enable_proxy_pool=False):
-        self.session = requests.Session()
+    def __init__(self, use_proxy=False, proxy=None, enable_proxy_pool=False, rate_limiter=None,
+                 pool_connections=4, pool_maxsize=10, cookies=None, base_url=STEAM_MARKET_URL, proxy_pool=None,
+                 cache=None, refresh_cache=False):
         self.use_proxy = use_proxy
-        self.proxy_pool = None
+        self.proxy = proxy
+        self.proxy_pool = proxy_pool
+        self.base_url = base_url.rstrip("/")
+        # 所有工作线程共享的限速器
+        self.rate_limiter = rate_limiter or RateLimiter()
+        # 响应缓存（http_cache.ResponseCache）；refresh_cache 时只写不读
+        self.cache = cache
+        self.refresh_cache = refresh_cache
         
         # 如果启用代理池
-        if enable_proxy_pool:
+        if enable_proxy_pool and self.proxy_pool is None:
             self.proxy_pool = ProxyPool()
+        if self.proxy_pool:
             self.use_proxy = True
         
-        # 如果使用代理但未指定，从代理池获取
-        if self.use_proxy:
-            if proxy:
-                self.session.proxies = proxy
-            elif self.proxy_pool:
-                self.session.proxies = self.proxy_pool.get_proxy()
+        self.user_agents = list(USER_AGENTS)
         
-        # 扩展User-Agent列表
-        self.user_agents = [
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.107 Safari/537.36",
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:90.0) Gecko/20100101 Firefox/90.0",
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.164 Safari/537.36",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.2 Safari/605.1.15",
-            "Mozilla/5.0 (X11; Linux x86_64; rv:90.0) Gecko/20100101 Firefox/90.0",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36"
-        ]
-        
-        self.session.headers.update({
-            "User-Agent": random.choice(self.user_agents),
+        # 每个 (代理, 工作线程) 一个连接池；价格历史接口需要登录Cookie（steamLoginSecure）
+        self.sessions = SessionManager(pool_connections, pool_maxsize, headers={
             "Accept-Language": "en-US,en;q=0.9",
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8",
-        })
-    
-    def _rotate_user_agent(self):
-        self.session.headers.update({"User-Agent": random.choice(self.user_agents)})
+        }, cookies=cookies)
     
-    def _rotate_proxy(self):
+    def close(self):
+        self.sessions.close()
         if self.proxy_pool:
-            self.session.proxies = self.proxy_pool.get_proxy()
+            self.proxy_pool.close()
+        if self.cache is not None:
+            self.cache.close()
     
-    def search_items(self, appid, query="", category=None, start=0, count=10):
-        url = f"https://steamcommunity.com/market/search/render/"
-        
-        params = {
-            "appid": appid,
-            "norender": 1,
-            "start": start,
-            "count": count
-        }
-        
-        if query:
-            params["query"] = query
-        
-        if category:
-            params["category_"+appid+"_Item"] = category
-        
-        # 随机延迟1-3秒
-        delay = random.uniform(1, 3)
-        time.sleep(delay)
-        
-        # 轮换User-Agent
-        self._rotate_user_agent()
-        
-        # 如果使用代理池，获取新代理
+    def _pick_proxy(self):
+        """为本次请求选择代理：优先代理池，其次固定代理"""
+        if not self.use_proxy:
+            return None
+        if self.proxy:
+            return self.proxy
         if self.proxy_pool:
-            self._rotate_proxy()
+            return self.proxy_pool.get_proxy()
+        return None
+    
+    def _report_proxy(self, proxy, response=None, kind=None):
+        """把请求结果反馈给代理池的健康统计"""
+        if not self.proxy_pool or not proxy:
+            return
+        if kind is None:
+            self.proxy_pool.report_success(proxy, response.elapsed.total_seconds())
+        else:
+            self.proxy_pool.report_failure(proxy, kind)
+    
+    def _request_headers(self):
+        """为本次请求随机选择User-Agent"""
+        return {"User-Agent": random.choice(self.user_agents)}
+    
+    def _get_json(self, endpoint, url, params, max_retries=5, timeout=15):
+        """带限速、代理轮换和重试的GET请求，成功时返回解析后的JSON，失败返回None"""
+        # 缓存命中时不占用令牌、不选择代理
+        if self.cache is not None and not self.refresh_cache:
+            cached = self.cache.get(endpoint, url, params)
+            if cached is not None:
+                return cached
         
-        max_retries = 5
         retry_count = 0
         
         while retry_count < max_retries:
+            # 每次尝试都重新选择代理和User-Agent
+            proxy = self._pick_proxy()
+            # 按 (代理, 接口) 的令牌桶等待发送时机，代替固定的随机延迟
+            waited = self.rate_limiter.acquire(endpoint, proxy)
+            SLEEP_SECONDS.inc(waited, endpoint=endpoint, reason="rate_limit")
             try:
-                response = self.session.get(url, params=params, timeout=15)  # 增加超时时间
+                started = time.perf_counter()
+                response = self.sessions.get(url, proxy=proxy, headers=self._request_headers(),
+                                             params=params, timeout=timeout)
+                REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, proxy=proxy_label(proxy))
+                REQUESTS.inc(endpoint=endpoint, status=response.status_code)
                 
                 if response.status_code == 429:  # Too Many Requests
-                    print(f"遇到429错误，等待并更换代理...")
-                    time.sleep(5)  # 等待5秒
-                    
-                    # 更换代理
-                    if self.proxy_pool:
-                        current_proxy = self.session.proxies
-                        self._rotate_proxy()
-                        print(f"更换代理: {current_proxy} -> {self.session.proxies}")
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    self.rate_limiter.record_throttle(endpoint, proxy, retry_after)
+                    self._report_proxy(proxy, kind="429")
+                    RETRIES.inc(endpoint=endpoint, cause="429")
+                    logger.warning(f"遇到429错误，降低 {proxy_label(proxy)} 的请求速率并更换代理...")
                     
                     retry_count += 1
                     continue
                 
+                if 400 <= response.status_code < 500:
+                    # 其他4xx（例如价格历史未登录时的400）重试也不会成功
+                    logger.warning(f"请求被拒绝: HTTP {response.status_code}，{url} {params}")
+                    return None
+                
                 response.raise_for_status()
-                return response.json()
+                self.rate_limiter.record_success(endpoint, proxy)
+                self._report_proxy(proxy, response)
+                data = response.json()
+                # 只缓存成功的响应，失败结果下次仍然重新请求
+                if self.cache is not None and isinstance(data, dict) and data.get("success"):
+                    self.cache.set(endpoint, url, params, data)
+                return data
                 
             except requests.exceptions.SSLError as e:
-                print(f"SSL错误: {e}，更换代理并重试...")
-                if self.proxy_pool:
-                    current_proxy = self.session.proxies
-                    self._rotate_proxy()
-                    print(f"更换代理: {current_proxy} -> {self.session.proxies}")
+                logger.warning(f"SSL错误: {e}，代理 {proxy_label(proxy)}，更换代理并重试...")
+                self._report_proxy(proxy, kind="ssl")
+                REQUESTS.inc(endpoint=endpoint, status="ssl")
+                RETRIES.inc(endpoint=endpoint, cause="ssl")
                 
             except requests.exceptions.RequestException as e:
-                print(f"请求错误: {e}，重试...")
-                if self.proxy_pool:
-                    current_proxy = self.session.proxies
-                    self._rotate_proxy()
-                    print(f"更换代理: {current_proxy} -> {self.session.proxies}")
+                logger.warning(f"请求错误: {e}，代理 {proxy_label(proxy)}，更换代理并重试...")
+                self._report_proxy(proxy, kind="error")
+                REQUESTS.inc(endpoint=endpoint, status="error")
+                RETRIES.inc(endpoint=endpoint, cause="error")
             
+            # 带抖动的指数退避后重试
+            delay = backoff_delay(retry_count)
+            SLEEP_SECONDS.inc(delay, endpoint=endpoint, reason="backoff")
+            time.sleep(delay)
             retry_count += 1
-            time.sleep(2)  # 等待2秒后重试
         
-        print(f"达到最大重试次数 {max_retries}，返回空结果")
-        return {"success": False, "results": []}
+        logger.error(f"达到最大重试次数 {max_retries}，返回空结果")
+        return None
     
-    def get_item_price_history(self, appid, market_hash_name):
-        url = f"https://steamcommunity.com/market/pricehistory/"
+    def search_items(self, appid, query="", category=None, start=0, count=10):
+        url = f"{self.base_url}/search/render/"
         
         params = {
             "appid": appid,
-            "market_hash_name": market_hash_name
+            "norender": 1,
+            "start": start,
+            "count": count
         }
         
-        # 随机延迟2-5秒
-        delay = random.uniform(2, 5)
-        time.sleep(delay)
+        if query:
+            params["query"] = query
         
-        # 轮换User-Agent
-        self._rotate_user_agent()
+        if category:
+            params[f"category_{appid}_Item"] = category
         
-        try:
-            response = self.session.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            print(f"获取物品价格历史时出错: {e}")
+        result = self._get_json("search", url, params)
+        if result is None:
+            return {"success": False, "results": []}
+        return result
+    
+    def get_item_price_history(self, appid, market_hash_name):
+        """获取物品价格历史，失败时返回None"""
+        url = f"{self.base_url}/pricehistory/"
+        
+        params = {
+            "appid": appid,
+            "market_hash_name": market_hash_name
+        }
+        
+        result = self._get_json("pricehistory", url, params)
+        if result is None or not result.get("success", False):
+            logger.warning(f"获取物品 {market_hash_name} 价格历史失败")
             return None
+        return result
+
+def crawl_item_types(collector, item_types, appid=730, max_pages=500, items_per_page=100, save_dir="data/categories",
+                     max_workers=5, compact=True, archive_raw=False):
+    """按 total_count 规划各类型的页并用线程池并发抓取，失败的页在其他页完成后重新请求
+    
+    每个类型先请求第一页得到 total_count，然后一次性分发其余的页；各类型轮流分配工作线程。
+    archive_raw=True 时另外把原始结果归档到 .raw.jsonl.gz。返回 {类型: 物品数}。
+    """
+    planner = CrawlPlanner(item_types, save_dir, items_per_page, max_pages, compact=compact, archive_raw=archive_raw)
+    # 排队的请求不超过工作线程数的两倍，新发现的页和补抓的页能及时得到调度
+    window = max_workers * 2
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        while True:
+            for item_type, start in planner.next_requests(window - len(futures)):
+                future = executor.submit(collector.search_items, appid=appid, category=item_type,
+                                         start=start, count=items_per_page)
+                futures[future] = (item_type, start)
+            if not futures:
+                break
+            
+            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                item_type, start = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"{item_type} 起始索引 {start} 请求时出错: {e}")
+                    result = None
+                planner.record(item_type, start, result)
+    
+    return planner.finish()
 
-def process_item_type(collector, item_type, appid=730, max_pages=10, items_per_page=10, save_dir="data/categories"):
-    """处理单个物品类型的数据收集"""
-    print(f"正在获取 {item_type} 类型的物品...")
+def process_item_type(collector, item_type, appid=730, max_pages=10, items_per_page=10, save_dir="data/categories",
+                      checkpoint_format="jsonl", compact=True, max_workers=4, archive_raw=False):
+    """处理单个物品类型的数据收集，返回该类型已保存的全部物品（jsonl模式下为 records.ItemRecord 列表）
     
+    checkpoint_format="jsonl" 时按 total_count 并发抓取各页，结果追加写入JSONL检查点，
+    游标文件记录已完成的页；compact=True 时在结束后压实为 .json 文件供 db_setup.import_data 使用。
+    checkpoint_format="json" 保留旧的整体重写模式。
+    """
+    logger.info(f"正在获取 {item_type} 类型的物品...")
+    
+    if checkpoint_format == "json":
+        return _process_item_type_json(collector, item_type, appid, max_pages, items_per_page, save_dir)
+    
+    crawl_item_types(collector, [item_type], appid, max_pages, items_per_page, save_dir, max_workers, compact,
+                     archive_raw)
+    return list(CategoryCheckpoint(save_dir, item_type).iter_records())
+
+def _process_item_type_json(collector, item_type, appid, max_pages, items_per_page, save_dir):
+    """旧版检查点：每页后重写整个JSON文件"""
     # 创建保存目录
     os.makedirs(save_dir, exist_ok=True)
     
@@ -290,9 +652,9 @@ def process_item_type(collector, item_type, appid=730, max_pages=10, items_per_p
             with open(filename, 'r', encoding='utf-8') as f:
                 all_items = json.load(f)
                 total_count = len(all_items)
-                print(f"从文件加载了 {total_count} 个物品")
+                logger.info(f"从文件加载了 {total_count} 个物品")
         except Exception as e:
-            print(f"加载文件时出错: {e}")
+            logger.error(f"加载文件时出错: {e}")
             all_items = []
             total_count = 0
     
@@ -302,7 +664,7 @@ def process_item_type(collector, item_type, appid=730, max_pages=10, items_per_p
     # 获取物品数据
     for page in range(start_page, max_pages):
         start = page * items_per_page
-        print(f"正在获取第 {page+1}/{max_pages} 页，起始索引: {start}")
+        logger.debug(f"正在获取第 {page+1}/{max_pages} 页，起始索引: {start}")
         
         result = collector.search_items(
             appid=appid,
@@ -312,74 +674,77 @@ def process_item_type(collector, item_type, appid=730, max_pages=10, items_per_p
         )
         
         if not result.get("success", False):
-            print(f"获取第 {page+1} 页失败，跳过")
+            logger.warning(f"获取第 {page+1} 页失败，跳过")
             continue
         
         items = result.get("results", [])
         if not items:
-            print(f"第 {page+1} 页没有物品，可能已到达末尾")
+            logger.info(f"第 {page+1} 页没有物品，可能已到达末尾")
             break
         
         all_items.extend(items)
         
         # 保存当前进度
         with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(all_items, f, ensure_ascii=False, indent=2)
-        
-        print(f"已保存 {len(all_items)} 个物品到 {filename}")
+            json.dump(all_items, f, ensure_ascii=False)
         
-        # 随机等待5-10秒，避免请求过于频繁
-        wait_time = random.uniform(5, 10)
-        print(f"等待 {wait_time:.2f} 秒...")
-        time.sleep(wait_time)
+        logger.debug(f"已保存 {len(all_items)} 个物品到 {filename}")
     
     return all_items
 
-def get_csgo_item_categories(collector, max_workers=5, max_pages=500, all_items=True):
+def get_csgo_item_categories(collector, max_workers=5, max_pages=500, all_items=True,
+                             save_dir="data/categories", items_per_page=100, archive_raw=False):
     """获取CSGO物品种类列表"""
-    # CSGO物品类型
-    item_types = [
-        "Pistol", "SMG", "Rifle", "Sniper Rifle", "Shotgun", "Machinegun",
-        "Container", "Key", "Pass", "Gift", "Tag", "Tool",
-        "Sticker", "Music Kit", "Weapon Case", "Graffiti", "Patch",
-        "Collectible", "Gloves", "Agents", "Knives"
-    ]
-    
-    # 如果需要获取所有物品，扩展物品类型列表
-    if all_items:
-        item_types.extend([
-            "Hands", "Crate", "Operation Pass", "Sealed Graffiti",
-            "Sticker Capsule", "Pin", "Souvenir Package", "Autograph Capsule",
-            "Patch Pack", "Storage Unit", "Viewer Pass", "Map Token",
-            "Name Tag", "Case Key", "Ticket", "Medal", "Coin"
-        ])
+    item_types = get_item_types(all_items)
     
     # 创建保存目录
-    save_dir = "data/categories"
     os.makedirs(save_dir, exist_ok=True)
     
-    # 使用线程池并行处理多个物品类型
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 为每个物品类型创建一个任务
-        future_to_type = {executor.submit(
-            process_item_type, collector, item_type, 730, max_pages, 100, save_dir
-        ): item_type for item_type in item_types}
-        
-        # 处理完成的任务
-        for future in concurrent.futures.as_completed(future_to_type):
-            item_type = future_to_type[future]
-            try:
-                items = future.result()
-                print(f"完成 {item_type} 类型，获取了 {len(items)} 个物品")
-            except Exception as e:
-                print(f"{item_type} 类型处理时出错: {e}")
+    # 所有类型的页共用一个线程池
+    counts = crawl_item_types(collector, item_types, 730, max_pages, items_per_page, save_dir, max_workers,
+                              archive_raw=archive_raw)
+    logger.info(f"完成 {len(counts)} 个类型，共 {sum(counts.values())} 个物品")
+    
+    # 输出各代理/接口的实时速率，便于调参
+    collector.rate_limiter.report()
 
 def main():
-    # 创建收集器实例，启用代理池
-    collector = SteamMarketCollector(enable_proxy_pool=True)
+    parser = argparse.ArgumentParser(description="收集Steam市场的CSGO物品数据")
+    parser.add_argument("--queue", default=None,
+                        help="作为工作进程从队列领取任务：队列数据库文件或协调进程的 http://主机:端口")
+    parser.add_argument("--worker-id", default=None, help="工作进程标识（默认为 主机名-进程号）")
+    parser.add_argument("--threads", type=int, default=4, help="工作进程的并发请求线程数")
+    parser.add_argument("--no-proxy-pool", action="store_true", help="不使用代理池")
+    parser.add_argument("--base-url", default=STEAM_MARKET_URL, help="市场接口地址（可指向 mock_steam.py）")
+    parser.add_argument("--archive-raw", action="store_true", help="另外把原始搜索结果归档到 .raw.jsonl.gz")
+    add_arguments(parser)
+    http_cache.add_arguments(parser)
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    exporters = start_exporters(args.metrics_port, args.metrics_file, metrics_host=args.metrics_host)
+    
+    # 价格历史任务需要登录，从环境变量读取steamLoginSecure
+    login_secure = os.environ.get("STEAM_LOGIN_SECURE")
+    cookies = {"steamLoginSecure": login_secure} if login_secure else None
+    
+    # 创建收集器实例，每个进程有自己的代理池和限速器
+    collector = SteamMarketCollector(enable_proxy_pool=not args.no_proxy_pool, cookies=cookies,
+                                     base_url=args.base_url, cache=http_cache.open_cache(args),
+                                     refresh_cache=args.refresh_cache)
     
     # 获取CSGO物品数据
-    get_csgo_item_categories(collector)
+    try:
+        if args.queue:
+            queue = open_queue(args.queue)
+            try:
+                QueueWorker(queue, collector, args.worker_id, args.threads).run()
+            finally:
+                queue.close()
+        else:
+            get_csgo_item_categories(collector, archive_raw=args.archive_raw)
+    finally:
+        collector.close()
+        close_exporters(exporters)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,178 @@
+import logging
+
+from checkpoint import CategoryCheckpoint
+from metrics import REGISTRY
+from records import ItemRecord, StringTable
+
+logger = logging.getLogger(__name__)
+
+PAGES = REGISTRY.counter("collector_pages_total", "按类型统计的分页结果（ok、failed、empty）", ("category", "result"))
+ITEMS = REGISTRY.counter("collector_items_total", "按类型统计的已保存物品数", ("category",))
+DUPLICATES = REGISTRY.counter("collector_duplicate_items_total", "已在其他页或其他类型中出现而被跳过的物品数",
+                              ("category",))
+
+def format_ranges(starts, items_per_page):
+    """把起始索引列表格式化为区间，例如 0-199, 500-599"""
+    ranges = []
+    for start in sorted(starts):
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = start + items_per_page
+        else:
+            ranges.append([start, start + items_per_page])
+    return ", ".join(f"{low}-{high - 1}" for low, high in ranges)
+
+class CategoryPlan:
+    """单个类型的抓取计划：第一页返回 total_count 后确定全部起始索引，记录已完成、进行中和失败的页"""
+    
+    def __init__(self, checkpoint, items_per_page, max_pages, max_attempts):
+        self.checkpoint = checkpoint
+        self.item_type = checkpoint.item_type
+        self.items_per_page = items_per_page
+        self.max_pages = max_pages
+        self.max_attempts = max_attempts
+        self.done = checkpoint.completed_starts(items_per_page)
+        self.in_flight = set()
+        self.attempts = {}
+        self.compacted = False
+    
+    @property
+    def total(self):
+        return self.checkpoint.total
+    
+    def planned_starts(self):
+        """按 total_count 计算的全部起始索引，不超过 max_pages 页"""
+        if self.total is None:
+            # 还不知道总数（包括旧版游标）：先请求第一个未完成的页以获得 total_count
+            return [max(self.done) + self.items_per_page if self.done else 0]
+        stop = min(self.total, self.max_pages * self.items_per_page)
+        return range(0, stop, self.items_per_page)
+    
+    def pending(self):
+        """还需要请求的起始索引；第一页完成前只请求第一页"""
+        if self.total is None and self.in_flight:
+            return []
+        return [start for start in self.planned_starts()
+                if start not in self.done and start not in self.in_flight
+                and self.attempts.get(start, 0) < self.max_attempts]
+    
+    def missing(self):
+        """放弃的页（超过最大尝试次数仍失败）"""
+        return [start for start in self.planned_starts() if start not in self.done]
+    
+    def is_finished(self):
+        return not self.in_flight and not self.pending()
+
+class CrawlPlanner:
+    """按 Steam 返回的 total_count 为每个类型规划页，并发抓取时分发请求、补抓失败的页并跨类型去重
+    
+    每页结果在 record() 中转换为紧凑记录后写入检查点，archive_raw=True 时另外把原始结果归档。
+    
+    next_requests() 返回下一批 (类型, 起始索引)，调用方并发请求后把结果交给 record()。
+    同一时间只应有一个调用方使用 planner（可以在工作线程中），检查点写入和去重集合都不加锁。
+    """
+    
+    def __init__(self, item_types, save_dir="data/categories", items_per_page=100, max_pages=500, max_attempts=3,
+                 compact=True, archive_raw=False):
+        self.items_per_page = items_per_page
+        self.compact = compact
+        self.archive_raw = archive_raw
+        self.plans = {}
+        # 所有类型的记录共用的字符串表
+        self.strings = StringTable()
+        # market_hash_name -> 第一次出现的类型，例如同时出现在 "Weapon Case" 和 "Container" 中的箱子
+        self.seen = {}
+        for item_type in item_types:
+            checkpoint = CategoryCheckpoint(save_dir, item_type)
+            if checkpoint.item_count:
+                logger.info(f"从检查点恢复 {item_type}: 已有 {checkpoint.item_count} 个物品，"
+                            f"已完成 {len(checkpoint.completed_starts(items_per_page))} 页")
+            for record in checkpoint.iter_records():
+                self.seen.setdefault(record.market_hash_name, item_type)
+            self.plans[item_type] = CategoryPlan(checkpoint, items_per_page, max_pages, max_attempts)
+    
+    def next_requests(self, limit):
+        """取出最多 limit 个待请求的页，各类型轮流分配，使所有类型同时推进"""
+        queues = [(plan, iter(plan.pending())) for plan in self.plans.values()]
+        requests = []
+        while queues and len(requests) < limit:
+            active = []
+            for plan, starts in queues:
+                if len(requests) >= limit:
+                    break
+                start = next(starts, None)
+                if start is None:
+                    continue
+                plan.in_flight.add(start)
+                requests.append((plan.item_type, start))
+                active.append((plan, starts))
+            queues = active
+        return requests
+    
+    def has_work(self):
+        return any(not plan.is_finished() for plan in self.plans.values())
+    
+    def record(self, item_type, start, result):
+        """记录一页的结果，返回新写入的物品数"""
+        plan = self.plans[item_type]
+        plan.in_flight.discard(start)
+        page = start // self.items_per_page + 1
+        
+        if not result or not result.get("success", False):
+            plan.attempts[start] = plan.attempts.get(start, 0) + 1
+            PAGES.inc(category=item_type, result="failed")
+            logger.warning(f"{item_type} 获取第 {page} 页失败（第 {plan.attempts[start]}/{plan.max_attempts} 次）")
+            if plan.is_finished():
+                self._finish_plan(plan)
+            return 0
+        
+        results = result.get("results", [])
+        total = result.get("total_count")
+        if total is None:
+            # 响应中没有 total_count 时退化为逐页抓取：本页是满页就再计划下一页
+            total = start + len(results) + (self.items_per_page if len(results) >= self.items_per_page else 0)
+        # 挂单变化时 total_count 可能增加，按最大值扩展计划，多出的页返回空结果即结束
+        if plan.total is None or total > plan.total:
+            first = plan.total is None
+            plan.checkpoint.set_total(total)
+            if first:
+                logger.info(f"{item_type} 共 {total} 个物品，计划 {len(plan.planned_starts())} 页")
+        
+        if self.archive_raw and results:
+            plan.checkpoint.archive_raw(results)
+        
+        records = []
+        for item in results:
+            record = ItemRecord.from_result(item, self.strings)
+            if record.market_hash_name in self.seen:
+                DUPLICATES.inc(category=item_type)
+                continue
+            self.seen[record.market_hash_name] = item_type
+            records.append(record)
+        
+        plan.checkpoint.append_page(records, start + self.items_per_page, start=start)
+        plan.done.add(start)
+        PAGES.inc(category=item_type, result="ok" if results else "empty")
+        ITEMS.inc(len(records), category=item_type)
+        logger.debug(f"{item_type}: 第 {page} 页写入 {len(records)} 个物品，共 {plan.checkpoint.item_count} 个")
+        
+        if plan.is_finished():
+            self._finish_plan(plan)
+        return len(records)
+    
+    def _finish_plan(self, plan):
+        if plan.compacted:
+            return
+        plan.compacted = True
+        missing = plan.missing()
+        if missing:
+            logger.error(f"{plan.item_type} 有 {len(missing)} 页多次失败，缺少索引 "
+                         f"{format_ranges(missing, self.items_per_page)}，重新运行时会补抓")
+        if self.compact:
+            count = plan.checkpoint.compact()
+            logger.info(f"完成 {plan.item_type} 类型，已压实 {count} 个物品到 {plan.checkpoint.json_path}")
+    
+    def finish(self):
+        """结束抓取：压实尚未压实的类型，返回 {类型: 物品数}"""
+        for plan in self.plans.values():
+            self._finish_plan(plan)
+        return {item_type: plan.checkpoint.item_count for item_type, plan in self.plans.items()}
@@ -1,83 +1,430 @@
+import argparse
+import base64
+import csv
+import itertools
+import json
+import os
+import re
 import sqlite3
-import pandas as pd
-import matplotlib.pyplot as plt
-from tabulate import tabulate
+import sys
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from partitions import default_archive_dir, iter_archived_history
+
+# pandas和tabulate导入较慢，只在需要DataFrame或表格输出时才导入
+
+# CSGODatabase使用的SQL，集中定义以便 db_setup.check_query_plans 检查执行计划
+QUERIES = {
+    "get_all_items": """
+        SELECT id, name, market_hash_name, item_type, category, rarity, price, volume 
+        FROM csgo_items 
+        ORDER BY price DESC
+        LIMIT ?
+        """,
+    "get_items_by_category": """
+        SELECT id, name, market_hash_name, item_type, rarity, price, volume 
+        FROM csgo_items 
+        WHERE category = ?
+        ORDER BY price DESC
+        """,
+    "get_categories": """
+        SELECT category, COUNT(*) as count
+        FROM csgo_items
+        GROUP BY category
+        ORDER BY count DESC
+        """,
+    "get_item_price_history": """
+        SELECT ph.price, ph.volume, ph.timestamp
+        FROM price_history ph
+        WHERE ph.item_id = ?
+        ORDER BY ph.timestamp
+        """,
+    "get_item_id": """
+        SELECT id FROM csgo_items WHERE market_hash_name = ?
+        """,
+    # 物品的OHLC汇总（db_setup.refresh_rollups 维护），按主键 (item_id, resolution, bucket) 范围读取
+    "get_item_ohlc": """
+        SELECT bucket, open, high, low, close, volume, points
+        FROM price_rollups
+        WHERE item_id = ? AND resolution = ? AND bucket >= ? AND bucket < ?
+        ORDER BY bucket
+        """,
+    "get_item_rollup_range": """
+        SELECT MIN(bucket), MAX(bucket) FROM price_rollups WHERE item_id = ? AND resolution = 'week'
+        """,
+    # 导入和回填每次提交时加一的数据代数（db_setup.bump_generation）
+    "get_generation": """
+        SELECT value FROM db_meta WHERE key = 'generation'
+        """,
+    # 键集分页（fetch_items_page）：按 (price DESC, id) 排序，从上一页最后一行的 (price, id) 之后继续；
+    # price 为NULL的物品排在最后，按 id 分页
+    "items_page_first": """
+        SELECT id, name, market_hash_name, item_type, category, rarity, price, volume
+        FROM csgo_items
+        WHERE price IS NOT NULL
+        ORDER BY price DESC, id
+        LIMIT ?
+        """,
+    "items_page_after": """
+        SELECT id, name, market_hash_name, item_type, category, rarity, price, volume
+        FROM csgo_items
+        WHERE price <= ? AND (price < ? OR id > ?)
+        ORDER BY price DESC, id
+        LIMIT ?
+        """,
+    "items_page_null": """
+        SELECT id, name, market_hash_name, item_type, category, rarity, price, volume
+        FROM csgo_items
+        WHERE price IS NULL AND id > ?
+        ORDER BY id
+        LIMIT ?
+        """,
+    "category_page_first": """
+        SELECT id, name, market_hash_name, item_type, category, rarity, price, volume
+        FROM csgo_items
+        WHERE category = ? AND price IS NOT NULL
+        ORDER BY price DESC, id
+        LIMIT ?
+        """,
+    "category_page_after": """
+        SELECT id, name, market_hash_name, item_type, category, rarity, price, volume
+        FROM csgo_items
+        WHERE category = ? AND price <= ? AND (price < ? OR id > ?)
+        ORDER BY price DESC, id
+        LIMIT ?
+        """,
+    "category_page_null": """
+        SELECT id, name, market_hash_name, item_type, category, rarity, price, volume
+        FROM csgo_items
+        WHERE category = ? AND price IS NULL AND id > ?
+        ORDER BY id
+        LIMIT ?
+        """,
+    # 全文索引匹配，名称列的权重高于类型和稀有度
+    "search_items": """
+        SELECT c.id, c.name, c.market_hash_name, c.item_type, c.category, c.rarity, c.price, c.volume
+        FROM csgo_items_fts f
+        JOIN csgo_items c ON c.id = f.rowid
+        WHERE csgo_items_fts MATCH ?
+        ORDER BY bm25(csgo_items_fts, 10.0, 10.0, 2.0, 1.0), c.price DESC
+        LIMIT ?
+        """,
+}
+
+# search_items 返回的列
+SEARCH_COLUMNS = ["id", "name", "market_hash_name", "item_type", "category", "rarity", "price", "volume"]
+
+# 检查执行计划时使用的示例参数
+QUERY_PLAN_PARAMS = {
+    "get_all_items": (10,),
+    "get_items_by_category": ("Rifle",),
+    "get_item_price_history": (1,),
+    "get_item_id": ("AK-47 | Redline (Field-Tested)",),
+    "get_generation": (),
+    "get_item_ohlc": (1, "day", "2026-01-01 00:00:00", "2027-01-01 00:00:00"),
+    "get_item_rollup_range": (1,),
+    "search_items": ('"knife"*', 100),
+    "items_page_first": (100,),
+    "items_page_after": (10.0, 10.0, 1, 100),
+    "items_page_null": (0, 100),
+    "category_page_first": ("Rifle", 100),
+    "category_page_after": ("Rifle", 10.0, 10.0, 1, 100),
+    "category_page_null": ("Rifle", 0, 100),
+}
+
+# 已知会全表扫描的查询
+ALLOWED_TABLE_SCANS = set()
+
+def build_match_query(keyword):
+    """把搜索关键字转换为FTS5查询：按单词拆分，所有单词都需出现，每个单词可前缀匹配，完整匹配的排名更高"""
+    tokens = re.findall(r'\w+', keyword.lower())
+    return " AND ".join(f'("{token}" OR "{token}"*)' for token in tokens)
+
+# 分页查询返回的列
+PAGE_COLUMNS = ["id", "name", "market_hash_name", "item_type", "category", "rarity", "price", "volume"]
+
+def encode_page_cursor(price, item_id):
+    """把一页最后一行的 (price, id) 编码为不透明的游标字符串"""
+    return base64.urlsafe_b64encode(json.dumps([price, item_id]).encode("utf-8")).decode("ascii")
+
+def decode_page_cursor(cursor):
+    """解析 encode_page_cursor 生成的游标，格式错误时抛出ValueError"""
+    try:
+        price, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+    if not isinstance(item_id, int) or not (price is None or isinstance(price, (int, float))):
+        raise ValueError(f"无效的分页游标: {cursor}")
+    return price, item_id
+
+def fetch_items_page(conn, category=None, limit=100, after=None):
+    """按价格从高到低分页读取物品（可限定类别），返回 (列名, 行列表, 下一页游标)
+    
+    使用键集分页：after 为上一页返回的游标，每页只读取 limit 行，翻到后面的页也不需要跳过前面的行。
+    没有更多数据时下一页游标为None。limit 小于1或游标格式错误时抛出ValueError。
+    """
+    if not isinstance(limit, int) or limit < 1:
+        raise ValueError(f"limit 必须是大于0的整数: {limit!r}")
+    scope = "items" if category is None else "category"
+    prefix = () if category is None else (category,)
+    after = after or None
+    price, last_id = decode_page_cursor(after) if after else (None, None)
+    rows = []
+    if after is None:
+        rows = conn.execute(QUERIES[f"{scope}_page_first"], prefix + (limit,)).fetchall()
+    elif price is not None:
+        rows = conn.execute(QUERIES[f"{scope}_page_after"], prefix + (price, price, last_id, limit)).fetchall()
+    if len(rows) < limit:
+        # 有价格的物品已经读完，继续读取没有价格的物品
+        null_after = last_id if after is not None and price is None else 0
+        rows += conn.execute(QUERIES[f"{scope}_page_null"], prefix + (null_after, limit - len(rows))).fetchall()
+    next_cursor = encode_page_cursor(rows[-1][6], rows[-1][0]) if len(rows) == limit else None
+    return list(PAGE_COLUMNS), rows, next_cursor
+
+# 汇总粒度及时间桶长度（秒），由细到粗，与 db_setup.ROLLUP_RESOLUTIONS 对应
+OHLC_RESOLUTIONS = [("hour", 3600), ("day", 86400), ("week", 7 * 86400)]
+
+OHLC_COLUMNS = ["bucket", "open", "high", "low", "close", "volume", "points"]
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def rollup_bucket(resolution, moment):
+    """返回 moment 所在时间桶的起点，周从周一开始"""
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if resolution != "hour":
+        moment = moment.replace(hour=0)
+    if resolution == "week":
+        moment -= timedelta(days=moment.weekday())
+    return moment
+
+def choose_resolution(start, end, resolution=None, max_points=500):
+    """选择汇总粒度
+    
+    resolution 为粒度名称时直接使用；为秒数时使用桶长度不超过它的最粗粒度；
+    为None时使用在 [start, end) 内时间桶数不超过 max_points 的最细粒度，范围太大时使用周。
+    """
+    names = [name for name, _ in OHLC_RESOLUTIONS]
+    if isinstance(resolution, str):
+        if resolution not in names:
+            raise ValueError(f"未知的汇总粒度 {resolution}，可选: {', '.join(names)}")
+        return resolution
+    if resolution is not None:
+        matching = [name for name, span in OHLC_RESOLUTIONS if span <= resolution]
+        return matching[-1] if matching else names[0]
+    seconds = (end - start).total_seconds()
+    for name, span in OHLC_RESOLUTIONS:
+        if seconds / span <= max_points:
+            return name
+    return names[-1]
+
+def _parse_time(value):
+    return value if value is None or isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+class QueryCache:
+    """按 (方法, 参数) 缓存查询结果，按LRU淘汰，数据代数变化时全部失效
+    
+    每次读取缓存前先检查 PRAGMA data_version：它只在其他连接提交写入后变化，
+    不变时不需要查询任何表；变化时再读取 db_meta 中的 generation，与上次不同才清空缓存。
+    没有 db_meta 表的旧数据库在每次有其他连接提交时清空缓存。
+    """
+    
+    def __init__(self, conn, maxsize=128, max_rows=50000):
+        self.conn = conn
+        self.maxsize = maxsize
+        self.max_rows = max_rows
+        self.entries = OrderedDict()
+        self.data_version = None
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+    
+    def _read_generation(self):
+        try:
+            row = self.conn.execute(QUERIES["get_generation"]).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row else None
+    
+    def _check(self):
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return
+        self.data_version = data_version
+        generation = self._read_generation()
+        if generation is None or generation != self.generation:
+            self.entries.clear()
+        self.generation = generation
+    
+    def get(self, method, args, compute):
+        """返回缓存的结果，没有时调用 compute() 并缓存（超过 max_rows 行的结果不缓存）"""
+        if not self.maxsize:
+            return compute()
+        self._check()
+        key = (method, args)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        value = compute()
+        if not hasattr(value, "__len__") or len(value) <= self.max_rows:
+            self.entries[key] = value
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return value
+    
+    def clear(self):
+        self.entries.clear()
+
+def _dataframe(columns, rows):
+    import pandas as pd
+    return pd.DataFrame.from_records(rows, columns=columns)
 
 class CSGODatabase:
-    def __init__(self, db_path='csgo_items.db'):
-        """初始化数据库连接"""
+    def __init__(self, db_path='csgo_items.db', chunk_size=500, cache_size=128, archive_dir=None):
+        """初始化数据库连接，cache_size 为缓存的查询结果数（0 表示不缓存），archive_dir 为价格历史的归档分区目录"""
         self.conn = sqlite3.connect(db_path)
+        self.archive_dir = archive_dir or default_archive_dir(db_path)
         self.cursor = self.conn.cursor()
+        self.chunk_size = chunk_size
+        self.cache = QueryCache(self.conn, cache_size)
     
     def close(self):
         """关闭数据库连接"""
         if self.conn:
             self.conn.close()
     
+    def _iter_query(self, name, params=()):
+        """执行查询并返回 (列名, 行迭代器)，行按 chunk_size 分批从游标读取"""
+        cursor = self.conn.cursor()
+        cursor.execute(QUERIES[name], params)
+        columns = [desc[0] for desc in cursor.description]
+        
+        def rows():
+            while True:
+                chunk = cursor.fetchmany(self.chunk_size)
+                if not chunk:
+                    break
+                yield from chunk
+        
+        return columns, rows()
+    
+    def iter_all_items(self, limit=100):
+        """逐行返回价格最高的物品: (列名, 行迭代器)"""
+        return self._iter_query("get_all_items", (limit,))
+    
+    def iter_items_by_category(self, category):
+        """逐行返回某类别的物品（按价格从高到低）"""
+        return self._iter_query("get_items_by_category", (category,))
+    
+    def iter_categories(self):
+        """逐行返回类别及物品数"""
+        return self._iter_query("get_categories")
+    
+    def iter_item_price_history(self, item_id):
+        """逐行返回物品的价格历史：先按月份读取已归档的分区，再读取主库中的近期数据"""
+        columns, rows = self._iter_query("get_item_price_history", (item_id,))
+        return columns, itertools.chain(iter_archived_history(self.archive_dir, item_id), rows)
+    
+    def iter_search_items(self, keyword, limit=100):
+        """逐行返回全文搜索结果"""
+        match = build_match_query(keyword)
+        if not match:
+            return list(SEARCH_COLUMNS), iter(())
+        return self._iter_query("search_items", (match, limit))
+    
+    def get_items_page(self, category=None, limit=100, after=None):
+        """键集分页读取物品，返回 (列名, 行列表, 下一页游标)"""
+        return fetch_items_page(self.conn, category, limit, after)
+    
+    def iter_item_ohlc(self, item_id, start=None, end=None, resolution=None, max_points=500):
+        """逐行返回物品在 [start, end) 内的OHLC汇总: (列名, 行迭代器, 使用的粒度)
+        
+        start/end 为datetime或ISO格式字符串，省略时使用该物品全部数据的范围；粒度的选择见 choose_resolution。
+        """
+        start, end = _parse_time(start), _parse_time(end)
+        if start is None or end is None:
+            first, last = self.conn.execute(QUERIES["get_item_rollup_range"], (item_id,)).fetchone()
+            if first is None:
+                return list(OHLC_COLUMNS), iter(()), choose_resolution(None, None, resolution or "week")
+            start = start or datetime.strptime(first, TIMESTAMP_FORMAT)
+            end = end or datetime.strptime(last, TIMESTAMP_FORMAT) + timedelta(days=7)
+        name = choose_resolution(start, end, resolution, max_points)
+        columns, rows = self._iter_query("get_item_ohlc", (item_id, name,
+                                                           rollup_bucket(name, start).strftime(TIMESTAMP_FORMAT),
+                                                           end.strftime(TIMESTAMP_FORMAT)))
+        return columns, rows, name
+    
+    def get_item_id(self, market_hash_name):
+        """按market_hash_name查找物品ID，不存在时返回None"""
+        def compute():
+            self.cursor.execute(QUERIES["get_item_id"], (market_hash_name,))
+            row = self.cursor.fetchone()
+            return row[0] if row else None
+        return self.cache.get("get_item_id", (market_hash_name,), compute)
+    
+    # 以下方法的结果会缓存到下一次导入或回填为止，返回的DataFrame和列表是缓存结果的副本
+    
     def get_all_items(self, limit=100):
         """获取所有物品"""
-        query = """
-        SELECT id, name, market_hash_name, item_type, category, rarity, price, volume 
-        FROM csgo_items 
-        ORDER BY price DESC
-        LIMIT ?
-        """
-        self.cursor.execute(query, (limit,))
-        columns = [desc[0] for desc in self.cursor.description]
-        return pd.DataFrame(self.cursor.fetchall(), columns=columns)
+        return self.cache.get("get_all_items", (limit,), lambda: _dataframe(*self.iter_all_items(limit))).copy()
     
     def get_items_by_category(self, category):
         """按类别获取物品"""
-        query = """
-        SELECT id, name, market_hash_name, item_type, rarity, price, volume 
-        FROM csgo_items 
-        WHERE category = ?
-        ORDER BY price DESC
-        """
-        self.cursor.execute(query, (category,))
-        columns = [desc[0] for desc in self.cursor.description]
-        return pd.DataFrame(self.cursor.fetchall(), columns=columns)
+        return self.cache.get("get_items_by_category", (category,),
+                              lambda: _dataframe(*self.iter_items_by_category(category))).copy()
     
     def get_categories(self):
         """获取所有物品类别"""
-        query = """
-        SELECT DISTINCT category, COUNT(*) as count
-        FROM csgo_items
-        GROUP BY category
-        ORDER BY count DESC
-        """
-        self.cursor.execute(query)
-        return self.cursor.fetchall()
+        def compute():
+            self.cursor.execute(QUERIES["get_categories"])
+            return self.cursor.fetchall()
+        return list(self.cache.get("get_categories", (), compute))
     
     def get_item_price_history(self, item_id):
         """获取物品价格历史"""
-        query = """
-        SELECT ph.price, ph.volume, ph.timestamp
-        FROM price_history ph
-        WHERE ph.item_id = ?
-        ORDER BY ph.timestamp
-        """
-        self.cursor.execute(query, (item_id,))
-        columns = [desc[0] for desc in self.cursor.description]
-        return pd.DataFrame(self.cursor.fetchall(), columns=columns)
+        return self.cache.get("get_item_price_history", (item_id,),
+                              lambda: _dataframe(*self.iter_item_price_history(item_id))).copy()
     
-    def search_items(self, keyword):
-        """搜索物品"""
-        query = """
-        SELECT id, name, market_hash_name, item_type, category, rarity, price, volume 
-        FROM csgo_items 
-        WHERE name LIKE ? OR market_hash_name LIKE ?
-        ORDER BY price DESC
-        """
-        keyword = f"%{keyword}%"
-        self.cursor.execute(query, (keyword, keyword))
-        columns = [desc[0] for desc in self.cursor.description]
-        return pd.DataFrame(self.cursor.fetchall(), columns=columns)
-
-def main():
-    """主函数，测试数据库查询"""
-    db = CSGODatabase()
+    def search_items(self, keyword, limit=100):
+        """搜索物品（全文索引，按相关度排序）"""
+        return self.cache.get("search_items", (keyword, limit),
+                              lambda: _dataframe(*self.iter_search_items(keyword, limit))).copy()
     
+    def get_item_ohlc(self, item_id, start=None, end=None, resolution=None, max_points=500):
+        """获取物品的OHLC汇总，自动选择满足范围和粒度要求的最粗汇总表，使用的粒度记录在 attrs["resolution"]"""
+        def compute():
+            columns, rows, name = self.iter_item_ohlc(item_id, start, end, resolution, max_points)
+            frame = _dataframe(columns, rows)
+            frame.attrs["resolution"] = name
+            return frame
+        return self.cache.get("get_item_ohlc", (item_id, start, end, resolution, max_points), compute).copy()
+
+def write_rows(columns, rows, output_format="table", out=None):
+    """把查询结果写到标准输出；csv和jsonl逐行写出，适合管道处理，table需要读取全部结果"""
+    out = out or sys.stdout
+    count = 0
+    if output_format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    elif output_format == "jsonl":
+        for row in rows:
+            out.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+            count += 1
+    else:
+        from tabulate import tabulate
+        rows = list(rows)
+        count = len(rows)
+        if rows:
+            out.write(tabulate(rows, headers=columns, tablefmt='psql') + "\n")
+    return count
+
+def show_overview(db):
+    """不带子命令时的概览：类别、最贵的物品和一个搜索示例"""
     # 获取所有类别
     print("CSGO物品类别:")
     categories = db.get_categories()
@@ -86,22 +433,82 @@ def main():
     
     # 获取所有物品
     print("\n所有物品 (前10个):")
-    all_items = db.get_all_items(10)
-    if not all_items.empty:
-        print(tabulate(all_items, headers='keys', tablefmt='psql'))
-    else:
+    if not write_rows(*db.iter_all_items(10)):
         print("没有找到物品")
     
     # 搜索物品
     keyword = "knife"
     print(f"\n搜索 '{keyword}':")
-    search_results = db.search_items(keyword)
-    if not search_results.empty:
-        print(tabulate(search_results, headers='keys', tablefmt='psql'))
-    else:
+    if not write_rows(*db.iter_search_items(keyword)):
         print(f"没有找到包含 '{keyword}' 的物品")
+
+def run_command(db, args):
+    """执行子命令，返回 (列名, 行迭代器)"""
+    if args.command == "categories":
+        return db.iter_categories()
+    if args.command == "top":
+        if args.category:
+            columns, rows = db.iter_items_by_category(args.category)
+            return columns, itertools.islice(rows, args.limit)
+        return db.iter_all_items(args.limit)
+    if args.command == "search":
+        return db.iter_search_items(" ".join(args.keyword), args.limit)
+    if args.command == "history":
+        item_id = int(args.item) if args.item.isdigit() else db.get_item_id(args.item)
+        if item_id is None:
+            raise SystemExit(f"找不到物品 '{args.item}'")
+        return db.iter_item_price_history(item_id)
+    if args.command == "ohlc":
+        item_id = int(args.item) if args.item.isdigit() else db.get_item_id(args.item)
+        if item_id is None:
+            raise SystemExit(f"找不到物品 '{args.item}'")
+        resolution = int(args.resolution) if args.resolution and args.resolution.isdigit() else args.resolution
+        columns, rows, _ = db.iter_item_ohlc(item_id, args.start, args.end, resolution, args.max_points)
+        return columns, rows
+    raise ValueError(f"未知命令 {args.command}")
+
+def main():
+    """命令行查询入口"""
+    parser = argparse.ArgumentParser(description="查询CSGO物品数据库")
+    parser.add_argument("--db", default="csgo_items.db", help="数据库文件")
+    parser.add_argument("--format", choices=["table", "csv", "jsonl"], default="table",
+                        help="输出格式，csv和jsonl逐行输出")
+    parser.add_argument("--chunk-size", type=int, default=500, help="每次从游标读取的行数")
+    subparsers = parser.add_subparsers(dest="command")
+    
+    subparsers.add_parser("categories", help="列出类别及物品数")
+    
+    top = subparsers.add_parser("top", help="价格最高的物品")
+    top.add_argument("--limit", type=int, default=20, help="返回的物品数")
+    top.add_argument("--category", help="只看某个类别")
+    
+    search = subparsers.add_parser("search", help="全文搜索物品")
+    search.add_argument("keyword", nargs="+", help="搜索关键字")
+    search.add_argument("--limit", type=int, default=100, help="返回的物品数")
+    
+    history = subparsers.add_parser("history", help="物品价格历史")
+    history.add_argument("item", help="物品ID或market_hash_name")
+    
+    ohlc = subparsers.add_parser("ohlc", help="物品的OHLC汇总（按范围自动选择小时、天或周）")
+    ohlc.add_argument("item", help="物品ID或market_hash_name")
+    ohlc.add_argument("--start", help="起始时间，例如 2025-01-01")
+    ohlc.add_argument("--end", help="结束时间（不包含）")
+    ohlc.add_argument("--resolution", help="粒度：hour、day、week，或期望的时间桶秒数")
+    ohlc.add_argument("--max-points", type=int, default=500, help="未指定粒度时最多返回的时间桶数")
+    
+    args = parser.parse_args()
     
-    db.close()
+    db = CSGODatabase(args.db, args.chunk_size)
+    try:
+        if args.command is None:
+            show_overview(db)
+        else:
+            write_rows(*run_command(db, args), output_format=args.format)
+    except BrokenPipeError:
+        # 输出被管道另一端提前关闭（例如 | head），丢弃剩余输出
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    finally:
+        db.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,120 +2,791 @@ import sqlite3
 import os
 import json
 import glob
+import logging
+import multiprocessing
+import time
+import argparse
+import re
+import sys
+from datetime import datetime
 from pathlib import Path
 
+from metrics import REGISTRY, add_arguments, close_exporters, configure_logging, start_exporters
+from records import iter_jsonl_items
+
+logger = logging.getLogger(__name__)
+
+IMPORT_ROWS = REGISTRY.counter("import_rows_total", "导入处理的行数", ("mode",))
+IMPORT_FILES = REGISTRY.counter("import_files_total", "导入的文件数（imported、skipped、failed）", ("result",))
+IMPORT_WRITE_SECONDS = REGISTRY.histogram("import_write_seconds", "每批行写入数据库的耗时")
+IMPORT_ROWS_PER_SECOND = REGISTRY.gauge("import_rows_per_second", "最近一次导入的整体速度（行/秒）")
+
+# 导入时使用的PRAGMA设置
+IMPORT_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",  # 约64MB页缓存
+    "PRAGMA temp_store=MEMORY",
+]
+
+# 价格汇总（price_rollups）的粒度: (名称, 由小时桶计算时间桶起点的表达式, 时间桶长度)，周从周一开始
+ROLLUP_RESOLUTIONS = [
+    ("hour", "hour", "+1 hour"),
+    ("day", "date(hour) || ' 00:00:00'", "+1 day"),
+    ("week", "date(hour, '-6 days', 'weekday 1') || ' 00:00:00'", "+7 days"),
+]
+
+# 重新计算 price_rollup_dirty 中记录的小时所在的各粒度时间桶，开盘/收盘价通过 (item_id, timestamp) 索引取得；
+# 早于归档边界（partitions.compact_partitions，YYYYMMDD，总是周一）的时间桶已经完整且部分数据在归档分区中，不重新计算
+ROLLUP_REFRESH_STATEMENTS = ['''
+    DELETE FROM price_rollup_dirty
+    WHERE hour < (SELECT printf('%04d-%02d-%02d 00:00:00', value / 10000, value / 100 % 100, value % 100)
+                  FROM db_meta WHERE key = 'archive_before')
+    '''] + ['''
+    INSERT OR REPLACE INTO price_rollups (item_id, resolution, bucket, open, high, low, close, volume, points)
+    SELECT b.item_id, '{name}', b.bucket,
+        (SELECT price FROM price_history WHERE item_id = b.item_id AND timestamp >= b.bucket
+         AND timestamp < b.bucket_end ORDER BY timestamp LIMIT 1),
+        MAX(ph.price), MIN(ph.price),
+        (SELECT price FROM price_history WHERE item_id = b.item_id AND timestamp >= b.bucket
+         AND timestamp < b.bucket_end ORDER BY timestamp DESC LIMIT 1),
+        SUM(ph.volume), COUNT(*)
+    FROM (SELECT DISTINCT item_id, {bucket} AS bucket, datetime({bucket}, '{span}') AS bucket_end
+          FROM price_rollup_dirty) b
+    JOIN price_history ph ON ph.item_id = b.item_id AND ph.timestamp >= b.bucket AND ph.timestamp < b.bucket_end
+    GROUP BY b.item_id, b.bucket
+    '''.format(name=name, bucket=bucket, span=span) for name, bucket, span in ROLLUP_RESOLUTIONS] + [
+    "DELETE FROM price_rollup_dirty",
+]
+
+# 写入价格历史时记录受影响的小时；触发器中的 OR IGNORE 会被外层 UPSERT 语句的冲突处理覆盖，所以用 ON CONFLICT DO NOTHING
+ROLLUP_DIRTY_TRIGGERS = ['''
+    CREATE TRIGGER IF NOT EXISTS price_history_rollup_{event} AFTER {clause} ON price_history BEGIN
+        INSERT INTO price_rollup_dirty (item_id, hour)
+        VALUES (new.item_id, strftime('%Y-%m-%d %H:00:00', new.timestamp))
+        ON CONFLICT DO NOTHING;
+    END
+    '''.format(event=event, clause=clause) for event, clause in (("insert", "INSERT"), ("update", "UPDATE OF price, volume"))]
+
+# 修改 csgo_items、price_history 已有的行时记录到 export_changes，seq 为所在事务提交后的数据代数；
+# 两张表的ID是AUTOINCREMENT，新增的行按ID大于上次导出的最大ID识别，不需要记录。
+# 同一行在两次导出之间再次修改时更新 seq（不用 OR REPLACE，原因同 ROLLUP_DIRTY_TRIGGERS）
+EXPORT_CHANGE_TRIGGERS = ['''
+    CREATE TRIGGER IF NOT EXISTS {table}_export_update AFTER UPDATE ON {table} BEGIN
+        INSERT INTO export_changes (source, row_id, seq)
+        VALUES ('{table}', new.id, (SELECT value + 1 FROM db_meta WHERE key = 'generation'))
+        ON CONFLICT (source, row_id) DO UPDATE SET seq = excluded.seq;
+    END
+    '''.format(table=table) for table in ("csgo_items", "price_history")]
+
+# 数据库结构迁移，按版本号顺序执行，已执行到的版本记录在 PRAGMA user_version 中
+MIGRATIONS = [
+    (1, [
+        # 创建CSGO物品表
+        '''
+        CREATE TABLE IF NOT EXISTS csgo_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            market_hash_name TEXT NOT NULL UNIQUE,
+            item_type TEXT,
+            category TEXT,
+            rarity TEXT,
+            image_url TEXT,
+            price REAL,
+            volume INTEGER,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # 创建价格历史表
+        '''
+        CREATE TABLE IF NOT EXISTS price_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id INTEGER,
+            price REAL,
+            volume INTEGER,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (item_id) REFERENCES csgo_items (id)
+        )
+        ''',
+        # 每个物品每个时间点只保留一条价格记录，重复导入同一快照不会产生重复行；
+        # 同时服务于按 item_id 过滤、按 timestamp 排序的价格历史查询
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_price_history_item_time
+        ON price_history (item_id, timestamp)
+        ''',
+        # 已导入文件清单，用于增量导入时跳过未变化的文件
+        '''
+        CREATE TABLE IF NOT EXISTS import_manifest (
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime REAL,
+            item_type TEXT,
+            snapshot_time TIMESTAMP,
+            rows INTEGER,
+            imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, [
+        # get_items_by_category: WHERE category = ? ORDER BY price DESC；
+        # 同时是 get_categories 按类别分组计数的覆盖索引
+        '''
+        CREATE INDEX IF NOT EXISTS idx_items_category_price
+        ON csgo_items (category, price DESC)
+        ''',
+        # get_all_items: ORDER BY price DESC LIMIT ?
+        '''
+        CREATE INDEX IF NOT EXISTS idx_items_price
+        ON csgo_items (price DESC)
+        ''',
+        'ANALYZE',
+    ]),
+    (3, [
+        # 物品全文索引（外部内容表，数据仍保存在 csgo_items 中），供 CSGODatabase.search_items 使用
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS csgo_items_fts USING fts5(
+            name, market_hash_name, item_type, rarity,
+            content='csgo_items', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+        ''',
+        # 通过触发器与 csgo_items 保持同步，导入路径无需额外处理
+        '''
+        CREATE TRIGGER IF NOT EXISTS csgo_items_fts_insert AFTER INSERT ON csgo_items BEGIN
+            INSERT INTO csgo_items_fts (rowid, name, market_hash_name, item_type, rarity)
+            VALUES (new.id, new.name, new.market_hash_name, new.item_type, new.rarity);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS csgo_items_fts_delete AFTER DELETE ON csgo_items BEGIN
+            INSERT INTO csgo_items_fts (csgo_items_fts, rowid, name, market_hash_name, item_type, rarity)
+            VALUES ('delete', old.id, old.name, old.market_hash_name, old.item_type, old.rarity);
+        END
+        ''',
+        # 快照导入每次都会更新价格，只有被索引的列变化时才重建该行的索引
+        '''
+        CREATE TRIGGER IF NOT EXISTS csgo_items_fts_update AFTER UPDATE ON csgo_items
+        WHEN old.name IS NOT new.name OR old.market_hash_name IS NOT new.market_hash_name
+          OR old.item_type IS NOT new.item_type OR old.rarity IS NOT new.rarity
+        BEGIN
+            INSERT INTO csgo_items_fts (csgo_items_fts, rowid, name, market_hash_name, item_type, rarity)
+            VALUES ('delete', old.id, old.name, old.market_hash_name, old.item_type, old.rarity);
+            INSERT INTO csgo_items_fts (rowid, name, market_hash_name, item_type, rarity)
+            VALUES (new.id, new.name, new.market_hash_name, new.item_type, new.rarity);
+        END
+        ''',
+        # 为已有数据建立索引
+        "INSERT INTO csgo_items_fts (csgo_items_fts) VALUES ('rebuild')",
+    ]),
+    (4, [
+        # 价格历史回填进度，每个物品一行，用于断点续传和按新鲜度排序
+        '''
+        CREATE TABLE IF NOT EXISTS price_history_backfill (
+            item_id INTEGER PRIMARY KEY,
+            last_fetched TIMESTAMP,
+            last_point TIMESTAMP,
+            points INTEGER DEFAULT 0,
+            status TEXT,
+            attempts INTEGER DEFAULT 0,
+            FOREIGN KEY (item_id) REFERENCES csgo_items (id)
+        )
+        ''',
+    ]),
+    (5, [
+        # 数据库级别的元数据；generation 在每次导入或回填提交时加一，读取方据此判断缓存的结果是否过期
+        '''
+        CREATE TABLE IF NOT EXISTS db_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+        ''',
+        "INSERT OR IGNORE INTO db_meta (key, value) VALUES ('generation', 0)",
+    ]),
+    (6, [
+        # 每个物品按小时、天、周汇总的OHLC，长时间范围的图表读取汇总行而不是原始价格点
+        '''
+        CREATE TABLE IF NOT EXISTS price_rollups (
+            item_id INTEGER NOT NULL,
+            resolution TEXT NOT NULL,
+            bucket TIMESTAMP NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            volume INTEGER,
+            points INTEGER,
+            PRIMARY KEY (item_id, resolution, bucket)
+        ) WITHOUT ROWID
+        ''',
+        # 写入价格历史时由触发器记录受影响的小时，refresh_rollups 只重新计算这些时间桶
+        '''
+        CREATE TABLE IF NOT EXISTS price_rollup_dirty (
+            item_id INTEGER NOT NULL,
+            hour TIMESTAMP NOT NULL,
+            PRIMARY KEY (item_id, hour)
+        ) WITHOUT ROWID
+        ''',
+        *ROLLUP_DIRTY_TRIGGERS,
+        # 为已有的价格历史建立汇总
+        '''
+        INSERT OR IGNORE INTO price_rollup_dirty (item_id, hour)
+        SELECT item_id, strftime('%Y-%m-%d %H:00:00', timestamp) FROM price_history
+        ''',
+        *ROLLUP_REFRESH_STATEMENTS,
+    ]),
+    (7, [
+        # 修改过的行，每行一条，exporter.py 据此增量导出；迁移前的修改不记录，首次导出为完整快照
+        '''
+        CREATE TABLE IF NOT EXISTS export_changes (
+            source TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            PRIMARY KEY (source, row_id)
+        ) WITHOUT ROWID
+        ''',
+        *EXPORT_CHANGE_TRIGGERS,
+    ]),
+    (8, [
+        # 重建版本6、7中使用 OR IGNORE / OR REPLACE 的触发器，否则 UPSERT 再次写入同一小时或同一行会违反唯一约束
+        "DROP TRIGGER IF EXISTS price_history_rollup_insert",
+        "DROP TRIGGER IF EXISTS price_history_rollup_update",
+        "DROP TRIGGER IF EXISTS csgo_items_export_update",
+        "DROP TRIGGER IF EXISTS price_history_export_update",
+        *ROLLUP_DIRTY_TRIGGERS,
+        *EXPORT_CHANGE_TRIGGERS,
+    ]),
+    (9, [
+        # attempts 改为连续失败次数（成功后清零），last_failed 为最近一次失败的时间，回填据此退避重试
+        "ALTER TABLE price_history_backfill ADD COLUMN last_failed TIMESTAMP",
+        "UPDATE price_history_backfill SET attempts = CASE WHEN status = 'failed' THEN 1 ELSE 0 END",
+    ]),
+]
+
+def migrate(conn):
+    """把数据库结构升级到最新版本，每个版本在一个事务中执行"""
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(f"数据库结构已升级到版本 {version}")
+    return conn
+
 # 创建数据库连接
-def create_database():
-    """创建SQLite数据库并设置表结构"""
-    conn = sqlite3.connect('csgo_items.db')
-    cursor = conn.cursor()
+def create_database(db_path='csgo_items.db'):
+    """创建SQLite数据库并把表结构迁移到最新版本"""
+    conn = sqlite3.connect(db_path)
+    return migrate(conn)
+
+def _is_table_scan(detail, limited=False):
+    """判断EXPLAIN QUERY PLAN的一行是否等同于全表扫描
     
-    # 创建CSGO物品表
+    不带索引的SCAN是全表扫描；不带LIMIT的非覆盖索引SCAN会按索引顺序回表读取每一行，同样视为全表扫描。
+    """
+    if not detail.startswith("SCAN "):
+        return False
+    rest = detail[len("SCAN "):]
+    if rest.startswith("TABLE "):
+        rest = rest[len("TABLE "):]
+    if rest.startswith("(") or "VIRTUAL TABLE" in rest or "CONSTANT ROW" in rest:
+        return False
+    if "COVERING INDEX" in rest:
+        return False
+    if "USING" in rest:
+        return not limited
+    return True
+
+def check_query_plans(db_path='csgo_items.db', queries=None, params=None, allowed_scans=()):
+    """对CSGODatabase的每个查询运行EXPLAIN QUERY PLAN，出现全表扫描时返回False"""
+    if queries is None:
+        from db_query import QUERIES, QUERY_PLAN_PARAMS, ALLOWED_TABLE_SCANS
+        queries, params, allowed_scans = QUERIES, QUERY_PLAN_PARAMS, ALLOWED_TABLE_SCANS
+    params = params or {}
+    
+    conn = create_database(db_path)
+    ok = True
+    for name, query in queries.items():
+        plan = conn.execute("EXPLAIN QUERY PLAN " + query, params.get(name, ())).fetchall()
+        details = [row[-1] for row in plan]
+        limited = "LIMIT" in query.upper()
+        scans = [detail for detail in details if _is_table_scan(detail, limited)]
+        sorts = [detail for detail in details if detail.startswith("USE TEMP B-TREE")]
+        
+        if scans and name not in allowed_scans:
+            ok = False
+            status = "失败: 全表扫描"
+        elif scans:
+            status = "允许的全表扫描"
+        elif sorts:
+            status = "通过 (使用临时B树排序)"
+        else:
+            status = "通过"
+        print(f"{name}: {status}")
+        for detail in details:
+            print(f"    {detail}")
+    conn.close()
+    return ok
+
+def configure_connection(conn):
+    """为批量导入设置WAL、synchronous=NORMAL和更大的缓存"""
+    for pragma in IMPORT_PRAGMAS:
+        conn.execute(pragma)
+
+def _document_items(data):
+    """处理不同格式的JSON文档：物品数组、search/render响应或单个物品"""
+    if isinstance(data, list):
+        return data
+    elif isinstance(data, dict) and 'results' in data:
+        return data.get('results', [])
+    else:
+        return [data]
+
+def load_items(json_file):
+    """读取JSON文件并返回物品列表"""
+    with open(json_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return _document_items(data)
+
+def iter_items(json_file, chunk_size=1 << 16):
+    """逐个读取文件中的物品，内存占用与文件大小无关
+    
+    JSON数组按块读取并用 raw_decode 逐个解析元素；.jsonl 文件逐行读取；
+    顶层不是数组的JSON文件（例如保存的search/render原始响应）退回到整体解析。
+    """
+    with open(json_file, 'r', encoding='utf-8') as f:
+        if str(json_file).endswith('.jsonl'):
+            yield from iter_jsonl_items(f)
+            return
+        
+        decoder = json.JSONDecoder()
+        buf = f.read(chunk_size)
+        pos = len(buf) - len(buf.lstrip())
+        if buf[pos:pos + 1] != '[':
+            yield from _document_items(json.loads(buf + f.read()))
+            return
+        pos += 1
+        eof = False
+        while True:
+            # 跳过元素之间的空白和逗号，缓冲区用完时继续读取
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buf):
+                if eof:
+                    raise ValueError(f"{json_file} 不是完整的JSON数组")
+                buf = f.read(chunk_size)
+                pos = 0
+                eof = not buf
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                end = None
+            # 元素可能被块边界截断，读入更多数据后重新解析
+            if end is None or (end == len(buf) and not eof):
+                if eof:
+                    raise ValueError(f"{json_file} 末尾的元素不完整或格式错误")
+                more = f.read(chunk_size)
+                eof = not more
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+            yield item
+            pos = end
+            if pos > chunk_size:
+                buf = buf[pos:]
+                pos = 0
+
+def iter_row_batches(json_file, category, batch_size=1000):
+    """流式读取文件，按批返回提取后的行"""
+    batch = []
+    for item in iter_items(json_file):
+        batch.append(extract_item_fields(item, category))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# 收集器生成的文件名: {item_type}_{YYYYMMDD}.json（未压实的检查点为 .jsonl）
+SNAPSHOT_FILE_PATTERN = re.compile(r'^(?P<item_type>.+)_(?P<date>\d{8})\.jsonl?$')
+
+def parse_snapshot_file(json_file):
+    """从文件名解析物品类型和快照时间，无法解析时使用父目录名和文件修改日期"""
+    json_file = Path(json_file)
+    match = SNAPSHOT_FILE_PATTERN.match(json_file.name)
+    if match:
+        snapshot = datetime.strptime(match.group('date'), '%Y%m%d')
+        return match.group('item_type'), snapshot.strftime('%Y-%m-%d %H:%M:%S')
+    snapshot = datetime.fromtimestamp(json_file.stat().st_mtime).replace(hour=0, minute=0, second=0, microsecond=0)
+    return json_file.parent.name, snapshot.strftime('%Y-%m-%d %H:%M:%S')
+
+def extract_item_fields(item, category):
+    """提取物品信息，返回与csgo_items列顺序一致的元组
+    
+    同时支持扁平格式和Steam search/render的原始结果（hash_name、sell_price、asset_description）。
+    """
+    description = item.get('asset_description') or {}
+    name = item.get('name', '')
+    market_hash_name = (item.get('market_hash_name') or item.get('hash_name')
+                        or description.get('market_hash_name') or name)
+    item_type = item.get('type') or description.get('type', '')
+    rarity = item.get('rarity', '')
+    image_url = item.get('icon_url') or description.get('icon_url', '')
+    if item.get('price'):
+        price = float(item['price'])
+    elif item.get('sell_price'):
+        price = int(item['sell_price']) / 100  # Steam返回的价格单位为分
+    else:
+        price = 0
+    if item.get('volume'):
+        volume = int(item['volume'])
+    elif item.get('sell_listings'):
+        volume = int(item['sell_listings'])
+    else:
+        volume = 0
+    return (name, market_hash_name, item_type, category, rarity, image_url, price, volume)
+
+def _create_staging_table(cursor):
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS csgo_items (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        market_hash_name TEXT NOT NULL UNIQUE,
+    CREATE TEMP TABLE IF NOT EXISTS import_staging (
+        seq INTEGER PRIMARY KEY,
+        name TEXT,
+        market_hash_name TEXT,
         item_type TEXT,
         category TEXT,
         rarity TEXT,
         image_url TEXT,
         price REAL,
-        volume INTEGER,
-        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        volume INTEGER
     )
     ''')
+
+def _stage_rows(cursor, rows, batch_size):
+    """用executemany分批写入临时表，只保留每个market_hash_name第一次出现的行"""
+    cursor.execute("DELETE FROM import_staging")
+    for i in range(0, len(rows), batch_size):
+        cursor.executemany('''
+        INSERT INTO import_staging
+        (name, market_hash_name, item_type, category, rarity, image_url, price, volume)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows[i:i + batch_size])
     
-    # 创建价格历史表
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS price_history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        item_id INTEGER,
-        price REAL,
-        volume INTEGER,
-        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (item_id) REFERENCES csgo_items (id)
-    )
+    DELETE FROM import_staging
+    WHERE seq NOT IN (SELECT MIN(seq) FROM import_staging GROUP BY market_hash_name)
     ''')
-    
-    conn.commit()
-    return conn
 
-# 导入数据函数
-def import_data():
-    """从JSON文件导入CSGO物品数据到SQLite数据库"""
-    conn = create_database()
-    cursor = conn.cursor()
+def _import_rows_bulk(cursor, rows, batch_size):
+    """批量导入一个文件的所有行（只插入新物品），返回新增物品数
     
-    # 获取数据文件路径
-    data_dir = Path('data')
-    if not data_dir.exists():
-        print(f"数据目录 {data_dir} 不存在")
-        return
+    先用executemany分批写入临时表，再用集合操作插入新物品，
+    并通过一次连接查询解析item_id写入价格历史，不再逐行依赖lastrowid。
+    """
+    _stage_rows(cursor, rows, batch_size)
     
-    # 查找所有JSON文件
-    json_files = list(data_dir.glob('**/*.json'))
-    if not json_files:
-        print(f"在 {data_dir} 中未找到JSON文件")
-        return
+    # 只保留数据库中尚不存在的行，与INSERT OR IGNORE的语义一致
+    cursor.execute('''
+    DELETE FROM import_staging
+    WHERE market_hash_name IN (SELECT market_hash_name FROM csgo_items)
+    ''')
+    
+    cursor.execute('''
+    INSERT OR IGNORE INTO csgo_items
+    (name, market_hash_name, item_type, category, rarity, image_url, price, volume)
+    SELECT name, market_hash_name, item_type, category, rarity, image_url, price, volume
+    FROM import_staging ORDER BY seq
+    ''')
+    items_added = cursor.rowcount
+    
+    # 添加价格历史记录
+    cursor.execute('''
+    INSERT OR IGNORE INTO price_history (item_id, price, volume)
+    SELECT c.id, s.price, s.volume
+    FROM import_staging s JOIN csgo_items c ON c.market_hash_name = s.market_hash_name
+    WHERE s.price > 0
+    ''')
+    return items_added
+
+def _import_rows_snapshot(cursor, rows, batch_size, snapshot_time):
+    """按快照导入：更新物品的最新价格和数量，并以快照时间追加价格历史，返回写入的物品数"""
+    _stage_rows(cursor, rows, batch_size)
     
-    print(f"找到 {len(json_files)} 个JSON文件")
+    # 较早的快照不会覆盖较新的价格
+    cursor.execute('''
+    INSERT INTO csgo_items
+    (name, market_hash_name, item_type, category, rarity, image_url, price, volume, last_updated)
+    SELECT name, market_hash_name, item_type, category, rarity, image_url, price, volume, ?
+    FROM import_staging WHERE 1 ORDER BY seq
+    ON CONFLICT (market_hash_name) DO UPDATE SET
+        price = excluded.price,
+        volume = excluded.volume,
+        last_updated = excluded.last_updated,
+        item_type = COALESCE(NULLIF(excluded.item_type, ''), csgo_items.item_type),
+        category = COALESCE(NULLIF(excluded.category, ''), csgo_items.category),
+        image_url = COALESCE(NULLIF(excluded.image_url, ''), csgo_items.image_url)
+    WHERE date(excluded.last_updated) >= date(csgo_items.last_updated)
+    ''', (snapshot_time,))
+    items_written = cursor.rowcount
     
-    # 导入每个文件的数据
-    items_added = 0
-    for json_file in json_files:
+    # 每个快照一条价格历史，同一快照重复导入时覆盖
+    cursor.execute('''
+    INSERT INTO price_history (item_id, price, volume, timestamp)
+    SELECT c.id, s.price, s.volume, ?
+    FROM import_staging s JOIN csgo_items c ON c.market_hash_name = s.market_hash_name
+    WHERE s.price > 0
+    ON CONFLICT (item_id, timestamp) DO UPDATE SET
+        price = excluded.price,
+        volume = excluded.volume
+    ''', (snapshot_time,))
+    return items_written
+
+def write_price_history(cursor, rows):
+    """批量写入价格历史行 (item_id, price, volume, timestamp)，同一时间点已存在时覆盖"""
+    cursor.executemany('''
+    INSERT INTO price_history (item_id, price, volume, timestamp)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (item_id, timestamp) DO UPDATE SET
+        price = excluded.price,
+        volume = excluded.volume
+    ''', rows)
+
+def refresh_rollups(cursor):
+    """重新计算新写入的价格历史所在的汇总时间桶，与数据写入在同一个事务中提交"""
+    for statement in ROLLUP_REFRESH_STATEMENTS:
+        cursor.execute(statement)
+
+def bump_generation(cursor):
+    """把数据代数加一，与数据写入在同一个事务中提交"""
+    cursor.execute("UPDATE db_meta SET value = value + 1 WHERE key = 'generation'")
+
+def _file_unchanged(cursor, json_file):
+    """文件是否已导入且之后没有变化"""
+    stat = json_file.stat()
+    cursor.execute("SELECT size, mtime FROM import_manifest WHERE path = ?", (str(json_file),))
+    row = cursor.fetchone()
+    return row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime
+
+def _record_manifest(cursor, json_file, item_type, snapshot_time, rows):
+    stat = json_file.stat()
+    cursor.execute('''
+    INSERT OR REPLACE INTO import_manifest (path, size, mtime, item_type, snapshot_time, rows)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', (str(json_file), stat.st_size, stat.st_mtime, item_type, snapshot_time, rows))
+
+def _write_rows(cursor, rows, mode, batch_size, snapshot_time):
+    """把一批行写入数据库，返回写入的物品数"""
+    started = time.perf_counter()
+    if mode == 'snapshot':
+        written = _import_rows_snapshot(cursor, rows, batch_size, snapshot_time)
+    else:
+        written = _import_rows_bulk(cursor, rows, batch_size)
+    IMPORT_WRITE_SECONDS.observe(time.perf_counter() - started)
+    IMPORT_ROWS.inc(len(rows), mode=mode)
+    return written
+
+def _import_file(conn, cursor, json_file, mode, batch_size):
+    """在当前进程中流式导入单个文件（一个事务），返回 (行数, 写入的物品数)"""
+    item_type, snapshot_time = parse_snapshot_file(json_file)
+    rows_read = 0
+    written = 0
+    # 每个文件一个事务，清单记录与数据一起提交
+    with conn:
+        for rows in iter_row_batches(json_file, item_type, batch_size):
+            written += _write_rows(cursor, rows, mode, batch_size, snapshot_time)
+            rows_read += len(rows)
+        if mode == 'snapshot':
+            _record_manifest(cursor, json_file, item_type, snapshot_time, rows_read)
+        refresh_rollups(cursor)
+        bump_generation(cursor)
+    return rows_read, written
+
+def _parse_worker(tasks, results, batch_size):
+    """解析进程：按顺序流式读取分配给它的文件并提取字段，把行按批放入自己的结果队列"""
+    for file_index, json_file, item_type in tasks:
         try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-            # 处理不同格式的JSON文件
-            if isinstance(data, list):
-                items = data
-            elif isinstance(data, dict) and 'results' in data:
-                items = data.get('results', [])
-            else:
-                items = [data]
-            
-            for item in items:
-                # 提取物品信息
-                name = item.get('name', '')
-                market_hash_name = item.get('market_hash_name', name)
-                item_type = item.get('type', '')
-                category = json_file.parent.name  # 使用父目录名作为分类
-                rarity = item.get('rarity', '')
-                image_url = item.get('icon_url', '')
-                price = float(item.get('price', 0)) if item.get('price') else 0
-                volume = int(item.get('volume', 0)) if item.get('volume') else 0
-                
-                # 插入数据
-                try:
-                    cursor.execute('''
-                    INSERT OR IGNORE INTO csgo_items 
-                    (name, market_hash_name, item_type, category, rarity, image_url, price, volume)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (name, market_hash_name, item_type, category, rarity, image_url, price, volume))
-                    
-                    if cursor.rowcount > 0:
-                        items_added += 1
-                        
-                        # 获取插入的物品ID
-                        item_id = cursor.lastrowid
-                        
-                        # 添加价格历史记录
-                        if price > 0:
-                            cursor.execute('''
-                            INSERT INTO price_history (item_id, price, volume)
-                            VALUES (?, ?, ?)
-                            ''', (item_id, price, volume))
-                except sqlite3.Error as e:
-                    print(f"插入数据时出错: {e}, 物品: {market_hash_name}")
-                    
+            rows_read = 0
+            for rows in iter_row_batches(json_file, item_type, batch_size):
+                results.put(("rows", file_index, rows))
+                rows_read += len(rows)
+            results.put(("done", file_index, rows_read))
         except Exception as e:
-            print(f"处理文件 {json_file} 时出错: {e}")
+            results.put(("error", file_index, repr(e)))
+
+def _import_files_parallel(conn, cursor, json_files, mode, batch_size, workers):
+    """多进程解析、单一写入进程导入多个文件，返回 (行数, 写入的物品数, 失败的文件数)
     
-    conn.commit()
-    print(f"成功导入 {items_added} 个物品")
-    conn.close()
+    文件按顺序轮流分配给 workers 个解析进程，每个进程有自己的有界结果队列；当前进程按文件顺序
+    从对应的队列读取行并写入SQLite，其他进程同时解析后面的文件。与逐个文件导入相同，每个文件一个事务，
+    清单记录与数据一起提交；解析或写入出错时整个文件回滚，不记入导入清单，下次运行会重新导入。
+    内存占用只取决于队列长度和批大小。
+    """
+    context = multiprocessing.get_context()
+    snapshots = [parse_snapshot_file(json_file) for json_file in json_files]
+    queues = [context.Queue(maxsize=4) for _ in range(workers)]
+    processes = []
+    for worker in range(workers):
+        tasks = [(file_index, str(json_files[file_index]), snapshots[file_index][0])
+                 for file_index in range(worker, len(json_files), workers)]
+        processes.append(context.Process(target=_parse_worker, args=(tasks, queues[worker], batch_size),
+                                         name=f"import-parser-{worker}", daemon=True))
+    for process in processes:
+        process.start()
+    
+    rows_read = 0
+    items_written = 0
+    failed = 0
+    try:
+        for file_index, json_file in enumerate(json_files):
+            results = queues[file_index % workers]
+            item_type, snapshot_time = snapshots[file_index]
+            file_rows = 0
+            file_items = 0
+            finished = False
+            try:
+                with conn:
+                    while not finished:
+                        kind, _, payload = results.get()
+                        if kind == "rows":
+                            file_items += _write_rows(cursor, payload, mode, batch_size, snapshot_time)
+                            file_rows += len(payload)
+                            continue
+                        finished = True
+                        if kind == "error":
+                            raise RuntimeError(payload)
+                    if mode == 'snapshot':
+                        _record_manifest(cursor, json_file, item_type, snapshot_time, file_rows)
+                    refresh_rollups(cursor)
+                    bump_generation(cursor)
+            except Exception as e:
+                # 写入出错时跳过该文件剩余的批次，队列中的下一条消息属于该进程的下一个文件
+                while not finished:
+                    finished = results.get()[0] != "rows"
+                failed += 1
+                IMPORT_FILES.inc(result="failed")
+                logger.error(f"处理文件 {json_file} 时出错: {e}")
+                continue
+            rows_read += file_rows
+            items_written += file_items
+            IMPORT_FILES.inc(result="imported")
+            logger.info(f"{json_file}: {file_rows} 行")
+    except BaseException:
+        for process in processes:
+            process.terminate()
+        raise
+    for process in processes:
+        process.join()
+    return rows_read, items_written, failed
+
+def find_data_files(data_dir):
+    """查找要导入的文件，按文件名排序使较早的快照先导入；已压实为 .json 的检查点不重复导入 .jsonl"""
+    data_dir = Path(data_dir)
+    json_files = set(data_dir.glob('**/*.json'))
+    jsonl_files = {path for path in data_dir.glob('**/*.jsonl') if path.with_suffix('.json') not in json_files}
+    return sorted(json_files | jsonl_files)
+
+# 导入数据函数
+def import_data(data_dir='data', db_path='csgo_items.db', batch_size=1000, mode='snapshot', workers=1):
+    """从JSON文件导入CSGO物品数据到SQLite数据库（流式读取，批量写入）
+    
+    mode='snapshot'：增量导入，跳过清单中未变化的文件，更新最新价格并按文件日期追加价格历史；
+    mode='insert'：旧行为，只插入尚不存在的物品。
+    workers>1 时用多个进程解析文件，当前进程负责写入；workers=1 时每个文件一个事务。
+    """
+    empty = {"files": 0, "rows": 0, "items": 0, "seconds": 0.0}
+    conn = create_database(db_path)
+    try:
+        configure_connection(conn)
+        cursor = conn.cursor()
+        _create_staging_table(cursor)
+        
+        # 获取数据文件路径
+        data_dir = Path(data_dir)
+        if not data_dir.exists():
+            logger.error(f"数据目录 {data_dir} 不存在")
+            return empty
+        
+        json_files = find_data_files(data_dir)
+        if not json_files:
+            logger.warning(f"在 {data_dir} 中未找到JSON文件")
+            return empty
+        
+        logger.info(f"找到 {len(json_files)} 个JSON文件")
+        
+        started = time.perf_counter()
+        pending = []
+        files_skipped = 0
+        for json_file in json_files:
+            if mode == 'snapshot' and _file_unchanged(cursor, json_file):
+                files_skipped += 1
+                IMPORT_FILES.inc(result="skipped")
+            else:
+                pending.append(json_file)
+        
+        # 导入每个文件的数据
+        items_written = 0
+        rows_read = 0
+        failed = 0
+        if workers > 1 and len(pending) > 1:
+            rows_read, items_written, failed = _import_files_parallel(
+                conn, cursor, pending, mode, batch_size, min(workers, len(pending)))
+        else:
+            for json_file in pending:
+                try:
+                    file_started = time.perf_counter()
+                    rows, written = _import_file(conn, cursor, json_file, mode, batch_size)
+                    elapsed = time.perf_counter() - file_started
+                    items_written += written
+                    rows_read += rows
+                    IMPORT_FILES.inc(result="imported")
+                    rate = rows / elapsed if elapsed > 0 else 0
+                    logger.info(f"{json_file}: {rows} 行，写入 {written} 个物品，{rate:.0f} 行/秒")
+                except Exception as e:
+                    failed += 1
+                    IMPORT_FILES.inc(result="failed")
+                    logger.error(f"处理文件 {json_file} 时出错: {e}")
+        
+        elapsed = time.perf_counter() - started
+        rate = rows_read / elapsed if elapsed > 0 else 0
+        IMPORT_ROWS_PER_SECOND.set(rate)
+        if files_skipped:
+            logger.info(f"跳过 {files_skipped} 个已导入且未变化的文件")
+        logger.info(f"成功导入 {items_written} 个物品，共处理 {rows_read} 行，用时 {elapsed:.2f} 秒，{rate:.0f} 行/秒")
+        return {"files": len(pending) - failed, "rows": rows_read, "items": items_written, "seconds": elapsed}
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="导入CSGO物品数据到SQLite数据库")
+    parser.add_argument("--data-dir", default="data", help="数据目录")
+    parser.add_argument("--db", default="csgo_items.db", help="数据库文件")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每批executemany的行数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="解析文件的进程数，1表示在当前进程中逐个文件导入")
+    parser.add_argument("--mode", choices=["snapshot", "insert"], default="snapshot",
+                        help="snapshot: 增量导入并记录价格历史; insert: 只插入新物品")
+    parser.add_argument("--check-plans", action="store_true",
+                        help="检查CSGODatabase查询的执行计划，出现全表扫描时以非零状态退出")
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    if args.check_plans:
+        sys.exit(0 if check_query_plans(args.db) else 1)
+    exporters = start_exporters(args.metrics_port, args.metrics_file, metrics_host=args.metrics_host)
+    try:
+        import_data(args.data_dir, args.db, args.batch_size, args.mode, args.workers)
+    finally:
+        close_exporters(exporters)
 
 if __name__ == "__main__":
-    import_data()
\ No newline at end of file
+    main()
@@ -0,0 +1,308 @@
+import argparse
+import json
+import logging
+import operator
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+import numpy as np
+
+from analytics import parse_timestamps
+from db_setup import create_database
+from metrics import REGISTRY, add_arguments, close_exporters, configure_logging, start_exporters
+from partitions import get_archive_boundary
+
+logger = logging.getLogger(__name__)
+
+EXPORT_ROWS = REGISTRY.counter("export_rows_total", "导出的行数（按表和导出类型）", ("source", "kind"))
+EXPORT_SECONDS = REGISTRY.histogram("export_seconds", "每次导出的耗时", ("kind",))
+
+# 导出格式版本，与清单中的不同时下一次导出写完整快照
+FORMAT_VERSION = 1
+
+MANIFEST = "manifest.json"
+
+# 各表导出的列和类型：int64、float64 为数值列（NULL价格为NaN），datetime 为UTC秒数（int64），
+# category 为字典编码（int32编号 + 取值列表），string 为UTF-8字节和偏移量
+EXPORT_COLUMNS = {
+    "csgo_items": [
+        ("id", "int64"), ("name", "string"), ("market_hash_name", "string"), ("item_type", "category"),
+        ("category", "category"), ("rarity", "category"), ("image_url", "string"), ("price", "float64"),
+        ("volume", "int64"), ("last_updated", "datetime"),
+    ],
+    "price_history": [
+        ("id", "int64"), ("item_id", "int64"), ("price", "float64"), ("volume", "int64"), ("timestamp", "datetime"),
+    ],
+}
+
+# 完整快照中的行顺序；price_history 按物品分组，与 analytics.load_price_history 的布局相同
+SNAPSHOT_ORDER = {"csgo_items": "id", "price_history": "item_id, timestamp"}
+
+def default_export_dir(db_path):
+    """数据库对应的导出目录，例如 csgo_items.db -> csgo_items_export/"""
+    return os.path.splitext(db_path)[0] + "_export"
+
+def _select_list(source):
+    """导出列的SELECT表达式，NULL替换为各类型的默认值（价格保留NULL，读出后为NaN）"""
+    defaults = {"int64": "0", "datetime": "'1970-01-01 00:00:00'", "category": "''", "string": "''"}
+    return ", ".join(name if kind == "float64" else f"COALESCE({name}, {defaults[kind]})"
+                     for name, kind in EXPORT_COLUMNS[source])
+
+def _read_columns(cursor, columns, chunk_size=65536):
+    """分批读取查询结果，返回 {列名: 数组}，字符串列为Python列表"""
+    chunks = {name: [] for name, _ in columns}
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for index, (name, kind) in enumerate(columns):
+            values = list(map(operator.itemgetter(index), rows))
+            if kind == "datetime":
+                chunks[name].append(parse_timestamps(values))
+            elif kind in ("int64", "float64"):
+                chunks[name].append(np.array(values, dtype=kind))
+            else:
+                chunks[name].extend(values)
+    result = {}
+    for name, kind in columns:
+        if kind in ("string", "category"):
+            result[name] = chunks[name]
+        elif chunks[name]:
+            result[name] = np.concatenate(chunks[name])
+        else:
+            result[name] = np.empty(0, dtype=np.int64 if kind == "datetime" else kind)
+    return result
+
+def _write_table(directory, columns, values):
+    """把一张表的各列写为 .npy 文件"""
+    os.makedirs(directory)
+    for name, kind in columns:
+        data = values[name]
+        if kind == "string":
+            encoded = [text.encode("utf-8") for text in data]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+            np.save(os.path.join(directory, f"{name}.offsets.npy"), offsets)
+            np.save(os.path.join(directory, f"{name}.data.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        elif kind == "category":
+            index = {}
+            codes = np.fromiter((index.setdefault(value, len(index)) for value in data), dtype=np.int32,
+                                count=len(data))
+            np.save(os.path.join(directory, f"{name}.npy"), codes)
+            with open(os.path.join(directory, f"{name}.values.json"), "w", encoding="utf-8") as f:
+                json.dump(list(index), f, ensure_ascii=False)
+        else:
+            np.save(os.path.join(directory, f"{name}.npy"), data)
+
+class StringColumn:
+    """以UTF-8字节和偏移量保存的字符串列，按下标读取时才解码"""
+    
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, index):
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]]).decode("utf-8")
+    
+    def tolist(self):
+        return [self[index] for index in range(len(self))]
+
+class CategoryColumn:
+    """字典编码的列：codes 为各行的int32编号，values 为编号对应的取值"""
+    
+    def __init__(self, codes, values):
+        self.codes = codes
+        self.values = values
+    
+    def __len__(self):
+        return len(self.codes)
+    
+    def __getitem__(self, index):
+        return self.values[self.codes[index]]
+    
+    def tolist(self):
+        return [self.values[code] for code in self.codes]
+    
+    def mask(self, value):
+        """等于 value 的行的布尔数组，不解码字符串"""
+        if value not in self.values:
+            return np.zeros(len(self.codes), dtype=bool)
+        return self.codes == self.values.index(value)
+
+def load_part(directory, mmap_mode="r"):
+    """读取一个导出目录（快照或增量），返回 {表名: {列名: 数组}}，数值列默认内存映射，不复制数据"""
+    tables = {}
+    for source, columns in EXPORT_COLUMNS.items():
+        table_dir = os.path.join(directory, source)
+        table = {}
+        for name, kind in columns:
+            base = os.path.join(table_dir, name)
+            if kind == "string":
+                table[name] = StringColumn(np.load(base + ".offsets.npy", mmap_mode=mmap_mode),
+                                           np.load(base + ".data.npy", mmap_mode=mmap_mode))
+            elif kind == "category":
+                with open(base + ".values.json", encoding="utf-8") as f:
+                    table[name] = CategoryColumn(np.load(base + ".npy", mmap_mode=mmap_mode), json.load(f))
+            else:
+                table[name] = np.load(base + ".npy", mmap_mode=mmap_mode)
+        tables[source] = table
+    return tables
+
+def read_manifest(export_dir):
+    """读取导出清单，目录中还没有导出时返回None"""
+    try:
+        with open(os.path.join(export_dir, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def open_export(export_dir, mmap_mode="r"):
+    """读取最新的导出：返回 (清单, 完整快照, [增量...])
+    
+    增量按导出顺序排列，每个增量包含上一次导出后新增或修改的行；同一个ID以最后出现的行为准。
+    """
+    manifest = read_manifest(export_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"{export_dir} 中没有导出清单")
+    snapshot = load_part(os.path.join(export_dir, manifest["snapshot"]), mmap_mode)
+    deltas = [load_part(os.path.join(export_dir, name), mmap_mode) for name in manifest["deltas"]]
+    return manifest, snapshot, deltas
+
+def _write_manifest(export_dir, manifest):
+    """先写临时文件再替换，读取方总是看到完整的清单"""
+    path = os.path.join(export_dir, MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+def run_export(db_path='csgo_items.db', export_dir=None, full=False, snapshot_every=24):
+    """把上次导出后新增或修改的行导出为列式 .npy 文件，返回 {"kind", "name", "generation", "rows"}
+    
+    水位线（数据代数和各表的最大ID）保存在导出目录的清单中。新增的行按ID大于水位线中的最大ID识别，
+    修改的行从 export_changes 读取；没有清单、已有 snapshot_every 个增量、full=True 或数据库被替换
+    （代数变小）时写完整快照。所有读取在同一个读事务中，导出的是一致的快照。
+    导出只包含主库中的数据（保留期内的价格历史），不包含归档分区；归档边界变化后写完整快照，
+    已归档的价格点不会留在快照和增量中。
+    导出后删除已导出的变更记录，因此每个数据库只应有一个导出目录。没有变化时不写入，kind 为None。
+    """
+    export_dir = export_dir or default_export_dir(db_path)
+    os.makedirs(export_dir, exist_ok=True)
+    manifest = read_manifest(export_dir)
+    started = time.perf_counter()
+    
+    conn = create_database(db_path)
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN")
+        try:
+            generation = conn.execute("SELECT value FROM db_meta WHERE key = 'generation'").fetchone()[0]
+            max_ids = {source: conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {source}").fetchone()[0]
+                       for source in EXPORT_COLUMNS}
+            archive_before = get_archive_boundary(conn)
+            snapshot = (full or manifest is None or manifest["format"] != FORMAT_VERSION
+                        or len(manifest["deltas"]) >= snapshot_every or generation < manifest["generation"]
+                        or archive_before != manifest.get("archive_before"))
+            if not snapshot and generation == manifest["generation"] and max_ids == manifest["max_ids"]:
+                logger.info(f"数据代数 {generation} 之后没有变化，不导出")
+                return {"kind": None, "name": None, "generation": generation, "rows": {}}
+            
+            tables = {}
+            for source, columns in EXPORT_COLUMNS.items():
+                if snapshot:
+                    cursor = conn.execute(f"SELECT {_select_list(source)} FROM {source} "
+                                          f"ORDER BY {SNAPSHOT_ORDER[source]}")
+                else:
+                    # 分为新增和修改两部分，各自按主键读取，不扫描整张表
+                    last_id = manifest["max_ids"][source]
+                    cursor = conn.execute(f'''
+                    SELECT {_select_list(source)} FROM {source} WHERE id > ?
+                    UNION ALL
+                    SELECT {_select_list(source)} FROM {source}
+                    WHERE id IN (SELECT row_id FROM export_changes WHERE source = ? AND seq > ?) AND id <= ?
+                    ORDER BY 1
+                    ''', (last_id, source, manifest["generation"], last_id))
+                tables[source] = _read_columns(cursor, columns)
+        finally:
+            conn.execute("COMMIT")
+        if not snapshot and not any(len(tables[source]["id"]) for source in EXPORT_COLUMNS):
+            # 只有删除（例如删除过期分区）时数据代数也会变化，没有需要导出的行
+            logger.info(f"数据代数 {generation} 没有新增或修改的行，不导出")
+            return {"kind": None, "name": None, "generation": generation, "rows": {}}
+        
+        kind = "snapshot" if snapshot else "delta"
+        sequence = manifest["sequence"] + 1 if manifest else 1
+        name = f"{kind}_{sequence:06d}"
+        temp_dir = os.path.join(export_dir, f".{name}.tmp")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        for source, columns in EXPORT_COLUMNS.items():
+            _write_table(os.path.join(temp_dir, source), columns, tables[source])
+        os.rename(temp_dir, os.path.join(export_dir, name))
+        
+        # 新快照写好后，上一个快照周期的文件再保留一个周期，正在读取旧清单的一方仍能打开
+        previous = [manifest["snapshot"], *manifest["deltas"]] if manifest else []
+        _write_manifest(export_dir, {
+            "format": FORMAT_VERSION,
+            "sequence": sequence,
+            "generation": generation,
+            "max_ids": max_ids,
+            "archive_before": archive_before,
+            "exported_at": datetime.now().isoformat(timespec="seconds"),
+            "columns": {source: [list(column) for column in columns] for source, columns in EXPORT_COLUMNS.items()},
+            "snapshot": name if snapshot else manifest["snapshot"],
+            "deltas": [] if snapshot else manifest["deltas"] + [name],
+            "previous": previous if snapshot else manifest["previous"],
+        })
+        if snapshot and manifest:
+            for old in manifest["previous"]:
+                shutil.rmtree(os.path.join(export_dir, old), ignore_errors=True)
+        
+        try:
+            conn.execute("DELETE FROM export_changes WHERE seq <= ?", (generation,))
+        except sqlite3.OperationalError as e:
+            # 未删除的记录在下一次导出时按代数过滤，不影响结果
+            logger.warning(f"清理已导出的变更记录失败: {e}")
+    finally:
+        conn.close()
+    
+    rows = {source: len(tables[source]["id"]) for source in EXPORT_COLUMNS}
+    for source, count in rows.items():
+        EXPORT_ROWS.inc(count, source=source, kind=kind)
+    elapsed = time.perf_counter() - started
+    EXPORT_SECONDS.observe(elapsed, kind=kind)
+    logger.info(f"已导出{'完整快照' if snapshot else '增量'} {name}（数据代数 {generation}）: "
+                f"{rows['csgo_items']} 个物品，{rows['price_history']} 行价格历史，用时 {elapsed:.2f} 秒")
+    return {"kind": kind, "name": name, "generation": generation, "rows": rows}
+
+def main():
+    parser = argparse.ArgumentParser(description="把物品和价格历史增量导出为可内存映射的列式NumPy文件")
+    parser.add_argument("--db", default="csgo_items.db", help="数据库文件")
+    parser.add_argument("--export-dir", default=None, help="导出目录（默认为 数据库名_export/）")
+    parser.add_argument("--full", action="store_true", help="写完整快照")
+    parser.add_argument("--snapshot-every", type=int, default=24, help="每隔多少个增量写一次完整快照")
+    parser.add_argument("--interval", type=float, default=None, help="每隔多少秒导出一次（默认只导出一次）")
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    exporters = start_exporters(args.metrics_port, args.metrics_file, metrics_host=args.metrics_host)
+    
+    try:
+        full = args.full
+        while True:
+            run_export(args.db, args.export_dir, full, args.snapshot_every)
+            if not args.interval:
+                break
+            full = False
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_exporters(exporters)
+
+if __name__ == "__main__":
+    main()
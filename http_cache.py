@@ -0,0 +1,183 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# 各接口响应的缓存时间（秒）：搜索结果每次收集变化不大，价格历史最多每小时更新一次
+DEFAULT_TTLS = {
+    "search": 6 * 3600,
+    "pricehistory": 3600,
+}
+
+DEFAULT_CACHE_PATH = "data/http_cache.db"
+
+CACHE_REQUESTS = REGISTRY.counter("http_cache_requests_total", "响应缓存查询次数（hit、miss、expired）",
+                                  ("endpoint", "result"))
+CACHE_BYTES = REGISTRY.gauge("http_cache_bytes", "响应缓存中压缩后的数据大小")
+
+def normalize_request(url, params):
+    """把请求规范化为字符串：参数按名称排序，值统一转为字符串"""
+    items = sorted((str(key), str(value)) for key, value in (params or {}).items())
+    return json.dumps([url, items], ensure_ascii=False, separators=(",", ":"))
+
+class ResponseCache:
+    """基于SQLite的持久化响应缓存：按接口设置TTL，zlib压缩存储，超过大小上限时按LRU淘汰
+    
+    多个工作线程共享同一个实例，内部用锁串行化对连接的访问。
+    """
+    
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttls=None, max_bytes=256 * 1024 * 1024, compress_level=6):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            endpoint TEXT NOT NULL,
+            request TEXT NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL,
+            size INTEGER NOT NULL,
+            body BLOB NOT NULL
+        )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed)")
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        CACHE_BYTES.set(self.total_bytes)
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+    
+    def _key(self, request):
+        return hashlib.sha1(request.encode("utf-8")).hexdigest()
+    
+    def get(self, endpoint, url, params):
+        """返回未过期的缓存响应，没有时返回None"""
+        key = self._key(normalize_request(url, params))
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT created, body FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                CACHE_REQUESTS.inc(endpoint=endpoint, result="miss")
+                return None
+            if now - row[0] > self.ttls.get(endpoint, 0):
+                CACHE_REQUESTS.inc(endpoint=endpoint, result="expired")
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        CACHE_REQUESTS.inc(endpoint=endpoint, result="hit")
+        return json.loads(zlib.decompress(row[1]))
+    
+    def set(self, endpoint, url, params, data):
+        """写入一条响应，超过大小上限时淘汰最久未访问的条目"""
+        request = normalize_request(url, params)
+        body = zlib.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+                             self.compress_level)
+        key = self._key(request)
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute('''
+            INSERT OR REPLACE INTO responses (key, endpoint, request, created, accessed, size, body)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (key, endpoint, request, now, now, len(body), body))
+            self.total_bytes += len(body) - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+            CACHE_BYTES.set(self.total_bytes)
+    
+    def _evict(self, target_bytes):
+        """按最近访问时间淘汰，直到总大小降到 target_bytes 以下"""
+        victims = []
+        freed = 0
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if self.total_bytes - freed <= target_bytes:
+                break
+            victims.append((key,))
+            freed += size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.total_bytes -= freed
+        logger.debug(f"响应缓存淘汰 {len(victims)} 条，释放 {freed} 字节")
+    
+    def purge_expired(self):
+        """删除所有已过期的条目，返回删除的条数"""
+        now = time.time()
+        deleted = 0
+        with self.lock:
+            for endpoint in {row[0] for row in self.conn.execute("SELECT DISTINCT endpoint FROM responses")}:
+                cursor = self.conn.execute("DELETE FROM responses WHERE endpoint = ? AND created < ?",
+                                           (endpoint, now - self.ttls.get(endpoint, 0)))
+                deleted += cursor.rowcount
+            self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            CACHE_BYTES.set(self.total_bytes)
+        return deleted
+    
+    def clear(self, endpoint=None):
+        """清空缓存（可只清空某个接口）"""
+        with self.lock:
+            if endpoint:
+                self.conn.execute("DELETE FROM responses WHERE endpoint = ?", (endpoint,))
+            else:
+                self.conn.execute("DELETE FROM responses")
+            self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            CACHE_BYTES.set(self.total_bytes)
+    
+    def stats(self):
+        """每个接口的条目数和压缩后大小"""
+        with self.lock:
+            rows = self.conn.execute('''
+            SELECT endpoint, COUNT(*), SUM(size) FROM responses GROUP BY endpoint ORDER BY endpoint
+            ''').fetchall()
+        return {endpoint: {"entries": count, "bytes": size} for endpoint, count, size in rows}
+
+def add_arguments(parser):
+    """为收集脚本添加响应缓存参数"""
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="响应缓存数据库文件")
+    parser.add_argument("--no-cache", action="store_true", help="不读取也不写入响应缓存")
+    parser.add_argument("--refresh-cache", action="store_true", help="忽略已缓存的响应，重新请求并更新缓存")
+
+def open_cache(args):
+    """按命令行参数打开响应缓存，--no-cache 时返回None"""
+    if args.no_cache:
+        return None
+    return ResponseCache(args.cache)
+
+def main():
+    parser = argparse.ArgumentParser(description="管理Steam响应缓存")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="响应缓存数据库文件")
+    parser.add_argument("--purge", action="store_true", help="删除已过期的条目")
+    parser.add_argument("--clear", nargs="?", const="", default=None, metavar="ENDPOINT",
+                        help="清空缓存，可指定只清空某个接口（search、pricehistory）")
+    args = parser.parse_args()
+    
+    cache = ResponseCache(args.cache)
+    try:
+        if args.purge:
+            print(f"删除了 {cache.purge_expired()} 条过期响应")
+        if args.clear is not None:
+            cache.clear(args.clear or None)
+            print("缓存已清空")
+        for endpoint, stats in cache.stats().items():
+            print(f"{endpoint}: {stats['entries']} 条，{stats['bytes'] / 1024 / 1024:.1f} MB")
+    finally:
+        cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 直方图默认分桶（秒），覆盖本地请求到慢代理的范围
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"
+
+def configure_logging(level="INFO"):
+    """配置日志格式，每行带时间、级别和线程名，便于区分并发收集的各个类型"""
+    logging.basicConfig(level=getattr(logging, str(level).upper(), logging.INFO), format=LOG_FORMAT)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """带标签的指标基类，线程安全"""
+    kind = None
+    
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self._values = {}
+    
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames) or set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+    
+    def samples(self):
+        """返回 (样本名, 标签名, 标签值, 数值) 列表"""
+        with self.lock:
+            return [(self.name, self.labelnames, key, value) for key, value in sorted(self._values.items())]
+
+class Counter(Metric):
+    kind = "counter"
+    
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def value(self, **labels):
+        with self.lock:
+            return self._values.get(self._key(labels), 0.0)
+
+class Gauge(Counter):
+    kind = "gauge"
+    
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self._values[key] = value
+    
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+    
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+    
+    @contextmanager
+    def time(self, **labels):
+        """记录代码块的耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+    
+    def count(self, **labels):
+        with self.lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+    
+    def samples(self):
+        with self.lock:
+            items = [(key, list(state[0]), state[1], state[2]) for key, state in sorted(self._values.items())]
+        samples = []
+        labelnames = self.labelnames + ("le",)
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append((self.name + "_bucket", labelnames, key + (_format_value(bound),), cumulative))
+            samples.append((self.name + "_sum", self.labelnames, key, total))
+            samples.append((self.name + "_count", self.labelnames, key, count))
+        return samples
+
+class Registry:
+    """指标注册表：同名指标只创建一次，可导出为Prometheus文本格式或JSON快照"""
+    
+    def __init__(self):
+        self._metrics = {}
+        self.lock = threading.Lock()
+    
+    def _register(self, cls, name, help_text, labelnames, **kwargs):
+        with self.lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"指标 {name} 已注册为 {metric.kind}")
+            return metric
+    
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter, name, help_text, labelnames)
+    
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Gauge, name, help_text, labelnames)
+    
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, labelnames, buckets=buckets)
+    
+    def metrics(self):
+        with self.lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+    
+    def render(self):
+        """Prometheus文本格式"""
+        lines = []
+        for metric in self.metrics():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labelnames, values, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labelnames, values)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+    
+    def snapshot(self):
+        """JSON友好的快照: {样本名: [{labels, value}, ...]}"""
+        result = {"timestamp": time.time()}
+        for metric in self.metrics():
+            for name, labelnames, values, value in metric.samples():
+                result.setdefault(name, []).append({"labels": dict(zip(labelnames, values)), "value": value})
+        return result
+    
+    def write_snapshot(self, path):
+        """原子地写入快照文件，.json 后缀写JSON，其他写Prometheus文本"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            if path.endswith(".json"):
+                json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+            else:
+                f.write(self.render())
+        os.replace(tmp_path, path)
+
+# 收集器、导入器等模块共用的默认注册表
+REGISTRY = Registry()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+    
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        data = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class MetricsServer:
+    """在后台线程中提供 /metrics 接口，供Prometheus抓取；默认只监听本机"""
+    
+    def __init__(self, port=9100, host="127.0.0.1", registry=None):
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.registry = registry or REGISTRY
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+    
+    @property
+    def port(self):
+        return self.server.server_port
+    
+    def start(self):
+        self._thread.start()
+        return self
+    
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class SnapshotWriter:
+    """定期把指标写入快照文件，关闭时再写一次最终结果"""
+    
+    def __init__(self, path, interval=10, registry=None):
+        self.path = path
+        self.interval = interval
+        self.registry = registry or REGISTRY
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.registry.write_snapshot(self.path)
+            except OSError as e:
+                logging.getLogger(__name__).warning(f"写入指标快照 {self.path} 时出错: {e}")
+    
+    def start(self):
+        self._thread.start()
+        return self
+    
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self.registry.write_snapshot(self.path)
+
+def add_arguments(parser):
+    """为命令行脚本添加日志级别和指标导出参数"""
+    parser.add_argument("--log-level", default="INFO", help="日志级别: DEBUG、INFO、WARNING、ERROR")
+    parser.add_argument("--metrics-port", type=int, default=None, help="在该端口提供Prometheus格式的 /metrics 接口")
+    parser.add_argument("--metrics-host", default="127.0.0.1",
+                        help="指标接口监听的地址，默认只监听本机；需要从其他机器抓取时设为 0.0.0.0")
+    parser.add_argument("--metrics-file", default=None,
+                        help="定期把指标快照写入该文件（.json 后缀写JSON，否则写Prometheus文本）")
+
+def start_exporters(metrics_port=None, metrics_file=None, interval=10, metrics_host="127.0.0.1"):
+    """按命令行参数启动指标导出，返回需要在结束时关闭的导出器列表"""
+    exporters = []
+    if metrics_port:
+        exporters.append(MetricsServer(metrics_port, metrics_host).start())
+        logging.getLogger(__name__).info(f"指标接口: http://{metrics_host}:{metrics_port}/metrics")
+    if metrics_file:
+        exporters.append(SnapshotWriter(metrics_file, interval).start())
+    return exporters
+
+def close_exporters(exporters):
+    for exporter in exporters:
+        exporter.close()
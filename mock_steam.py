@@ -0,0 +1,231 @@
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from collector import get_item_types
+
+class MockSteamMarket:
+    """本地模拟的Steam市场接口，用于离线测试和性能基准
+    
+    提供 /market/search/render/ 和 /market/pricehistory/，可配置延迟、429注入和每个类型的物品总数。
+    额外监听的端口作为"假代理"：请求以绝对URI发到这些端口时同样由本服务处理，
+    其中 bad_proxies 个代理按 bad_proxy_throttle_rate 返回429，用于检验代理池的隔离逻辑。
+    """
+    
+    def __init__(self, items_per_type=500, item_types=None, latency=0.0, jitter=0.0,
+                 throttle_rate=0.0, retry_after=1, proxies=0, bad_proxies=0,
+                 bad_proxy_throttle_rate=0.5, history_points=240, host="127.0.0.1", port=0, seed=0):
+        self.items_per_type = items_per_type
+        self.item_types = list(item_types or get_item_types(all_items=True))
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.bad_proxy_throttle_rate = bad_proxy_throttle_rate
+        self.history_points = history_points
+        self.host = host
+        self.seed = seed
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        
+        # 第一个服务是市场本身，其余是假代理，最后 bad_proxies 个代理会频繁返回429
+        self.servers = [self._create_server(port, None)]
+        for index in range(proxies):
+            throttle_rate = bad_proxy_throttle_rate if index >= proxies - bad_proxies else None
+            self.servers.append(self._create_server(0, throttle_rate))
+        self._threads = []
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+    
+    def _create_server(self, port, throttle_rate):
+        server = ThreadingHTTPServer((self.host, port), MockSteamHandler)
+        server.daemon_threads = True
+        server.market = self
+        server.throttle_rate = throttle_rate
+        return server
+    
+    @property
+    def base_url(self):
+        """传给收集器的 base_url"""
+        return f"http://{self.host}:{self.servers[0].server_port}/market"
+    
+    @property
+    def proxies(self):
+        """假代理列表，格式与 ProxyPool 使用的代理一致"""
+        return [{"http": f"http://{self.host}:{server.server_port}",
+                 "https": f"http://{self.host}:{server.server_port}"} for server in self.servers[1:]]
+    
+    def start(self):
+        for server in self.servers:
+            thread = threading.Thread(target=server.serve_forever, name="mock-steam", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+    
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+    
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+    
+    def snapshot(self):
+        """返回请求计数（按接口和状态码）"""
+        with self.lock:
+            return dict(self.stats)
+    
+    def item(self, item_type, index):
+        """按 (类型, 序号) 确定性地生成一个search/render结果"""
+        rng = random.Random(f"{self.seed}:{item_type}:{index}")
+        name = f"{item_type} | Mock {index:05d}"
+        sell_price = rng.randint(3, 500000)
+        return {
+            "name": name,
+            "hash_name": name,
+            "sell_listings": rng.randint(1, 5000),
+            "sell_price": sell_price,
+            "sell_price_text": f"${sell_price / 100:.2f}",
+            "app_icon": "",
+            "app_name": "Counter-Strike 2",
+            "asset_description": {
+                "appid": 730,
+                "classid": str(rng.randint(10 ** 8, 10 ** 9)),
+                "instanceid": "0",
+                "icon_url": f"mock/{index}",
+                "tradable": 1,
+                "name": name,
+                "type": item_type,
+                "market_name": name,
+                "market_hash_name": name,
+                "commodity": 0,
+            },
+            "sale_price_text": f"${sell_price / 100:.2f}",
+        }
+    
+    def search(self, params):
+        category = next((values[0] for key, values in params.items() if key.startswith("category_")), None)
+        start = int(params.get("start", ["0"])[0])
+        count = min(100, int(params.get("count", ["10"])[0]))
+        total = self.items_per_type if category is None or category in self.item_types else 0
+        types = [category] if category else self.item_types[:1]
+        stop = min(total, start + count)
+        return {
+            "success": True,
+            "start": start,
+            "pagesize": count,
+            "total_count": total,
+            "searchdata": {"query": params.get("query", [""])[0], "total_count": total},
+            "results": [self.item(types[0], index) for index in range(start, stop)],
+        }
+    
+    def price_history(self, params):
+        name = params.get("market_hash_name", [""])[0]
+        if not name:
+            return {"success": False}
+        rng = random.Random(f"{self.seed}:history:{name}")
+        price = rng.uniform(0.03, 500)
+        end = datetime(2026, 1, 1)
+        prices = []
+        for hours in range(self.history_points, 0, -1):
+            price = max(0.03, price * rng.uniform(0.97, 1.03))
+            point = end - timedelta(hours=hours)
+            prices.append([point.strftime("%b %d %Y %H: +0"), round(price, 3), str(rng.randint(1, 2000))])
+        return {"success": True, "price_prefix": "$", "price_suffix": "", "prices": prices}
+
+class MockSteamHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 保持连接，使收集器的连接池能够复用连接
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _send(self, status, body, content_type="application/json", headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def do_GET(self):
+        market = self.server.market
+        # 通过假代理发来的请求使用绝对URI，只取路径部分
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        
+        if market.latency or market.jitter:
+            time.sleep(market.latency + random.uniform(0, market.jitter))
+        
+        if url.path.startswith("/market/search/render"):
+            endpoint = "search"
+        elif url.path.startswith("/market/pricehistory"):
+            endpoint = "pricehistory"
+        elif url.path.rstrip("/") == "/market":
+            # 代理池验证代理时访问的页面
+            market.count("validate:200")
+            self._send(200, "<html><body>Steam Community Market</body></html>", "text/html")
+            return
+        else:
+            market.count("unknown:404")
+            self._send(404, json.dumps({"success": False}))
+            return
+        
+        throttle_rate = self.server.throttle_rate
+        if throttle_rate is None:
+            throttle_rate = market.throttle_rate
+        if throttle_rate and random.random() < throttle_rate:
+            market.count(f"{endpoint}:429")
+            self._send(429, json.dumps(None), headers={"Retry-After": str(market.retry_after)})
+            return
+        
+        if endpoint == "search":
+            body = market.search(params)
+        else:
+            body = market.price_history(params)
+        market.count(f"{endpoint}:200")
+        self._send(200, json.dumps(body))
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟Steam市场接口")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    parser.add_argument("--items-per-type", type=int, default=500, help="每个物品类型的物品总数")
+    parser.add_argument("--latency", type=float, default=0.05, help="每个请求的固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.02, help="额外的随机延迟上限（秒）")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回429的概率")
+    parser.add_argument("--proxies", type=int, default=0, help="假代理数量")
+    parser.add_argument("--bad-proxies", type=int, default=0, help="其中频繁返回429的代理数量")
+    args = parser.parse_args()
+    
+    market = MockSteamMarket(args.items_per_type, latency=args.latency, jitter=args.jitter,
+                             throttle_rate=args.throttle_rate, proxies=args.proxies,
+                             bad_proxies=args.bad_proxies, port=args.port).start()
+    print(f"模拟Steam市场: {market.base_url}")
+    for proxy in market.proxies:
+        print(f"假代理: {proxy['http']}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        market.stop()
+
+if __name__ == "__main__":
+    main()
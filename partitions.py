@@ -0,0 +1,204 @@
+import argparse
+import glob
+import logging
+import os
+import re
+import sqlite3
+from datetime import date, datetime, timedelta
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# 归档分区文件名: price_history_YYYY_MM.db，每个文件保存一个已结束月份的原始价格点
+PARTITION_PATTERN = re.compile(r'^price_history_(\d{4})_(\d{2})\.db$')
+
+PARTITION_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.price_history (
+        id INTEGER PRIMARY KEY,
+        item_id INTEGER,
+        price REAL,
+        volume INTEGER,
+        timestamp TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE UNIQUE INDEX IF NOT EXISTS {schema}.idx_price_history_item_time
+    ON price_history (item_id, timestamp)
+    ''',
+]
+
+def default_archive_dir(db_path):
+    """数据库对应的归档目录，例如 csgo_items.db -> csgo_items_archive/"""
+    return os.path.splitext(db_path)[0] + "_archive"
+
+def month_key(year, month):
+    """月份编号 YYYYMM"""
+    return year * 100 + month
+
+def shift_month(year, month, months):
+    index = year * 12 + month - 1 + months
+    return index // 12, index % 12 + 1
+
+def month_start(year, month):
+    return f"{year:04d}-{month:02d}-01 00:00:00"
+
+def week_start(year, month):
+    """该月第一天所在周的周一，与 price_rollups 的周时间桶起点一致"""
+    first = date(year, month, 1)
+    return first - timedelta(days=first.weekday())
+
+def partition_path(archive_dir, year, month):
+    return os.path.join(archive_dir, f"price_history_{year:04d}_{month:02d}.db")
+
+def list_partitions(archive_dir):
+    """按时间顺序返回已归档的分区: [(年, 月, 路径)]"""
+    partitions = []
+    for path in glob.glob(os.path.join(archive_dir, "price_history_*.db")):
+        match = PARTITION_PATTERN.match(os.path.basename(path))
+        if match:
+            partitions.append((int(match.group(1)), int(match.group(2)), path))
+    return sorted(partitions)
+
+def iter_archived_history(archive_dir, item_id):
+    """按时间顺序逐行返回物品在各归档分区中的价格历史 (price, volume, timestamp)，分区只在读到时打开"""
+    for _, _, path in list_partitions(archive_dir):
+        conn = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True)
+        try:
+            yield from conn.execute('''
+            SELECT price, volume, timestamp FROM price_history WHERE item_id = ? ORDER BY timestamp
+            ''', (item_id,))
+        finally:
+            conn.close()
+
+def get_archive_boundary(conn):
+    """归档边界日期 YYYYMMDD：早于该日的价格点都在归档分区中，没有归档时返回None"""
+    try:
+        row = conn.execute("SELECT value FROM db_meta WHERE key = 'archive_before'").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+def archive_boundary_timestamp(conn):
+    """归档边界对应的时间戳字符串，没有归档时返回None"""
+    boundary = get_archive_boundary(conn)
+    if not boundary:
+        return None
+    return f"{boundary // 10000:04d}-{boundary // 100 % 100:02d}-{boundary % 100:02d} 00:00:00"
+
+def _archive_month(conn, archive_dir, year, month, cutoff):
+    """把一个月中早于 cutoff 的价格点复制到分区文件后从主库删除，返回移动的行数
+    
+    复制和删除在同一个事务中提交并增加数据代数；分区按 (item_id, timestamp) 去重，不沿用主库的行ID，重复运行结果不变。
+    """
+    from db_setup import bump_generation
+    
+    path = partition_path(archive_dir, year, month)
+    start = month_start(year, month)
+    end = min(month_start(*shift_month(year, month, 1)), cutoff)
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    try:
+        with conn:
+            for statement in PARTITION_SCHEMA:
+                conn.execute(statement.format(schema="archive"))
+            conn.execute('''
+            INSERT OR REPLACE INTO archive.price_history (item_id, price, volume, timestamp)
+            SELECT item_id, price, volume, timestamp FROM main.price_history
+            WHERE timestamp >= ? AND timestamp < ?
+            ''', (start, end))
+            moved = conn.execute('''
+            DELETE FROM main.price_history WHERE timestamp >= ? AND timestamp < ?
+            ''', (start, end)).rowcount
+            bump_generation(conn)
+    finally:
+        conn.execute("DETACH DATABASE archive")
+    
+    # 归档分区只在整理时写入：整理为单个紧凑文件（非WAL），便于直接复制备份
+    archive = sqlite3.connect(path)
+    try:
+        archive.execute("PRAGMA journal_mode=DELETE")
+        archive.execute("VACUUM")
+    finally:
+        archive.close()
+    return moved
+
+def compact_partitions(db_path='csgo_items.db', keep_months=3, archive_dir=None, drop_after_months=None,
+                       vacuum=False, now=None):
+    """按保留策略整理价格历史分区，返回 {"archived": {月份: 行数}, "dropped": [路径]}
+    
+    主库只保留最近 keep_months 个月（含当前月）的原始价格点，更早的数据移动到归档目录中的月份分区。
+    归档边界对齐到周一，任何小时、天、周汇总的时间桶都不会跨越边界：边界之前的汇总已经完整，不再重新计算，
+    边界之后的时间桶只由主库中的数据计算。边界所在月份的前几天留在主库中，下一次运行时再归入该月的分区；
+    drop_after_months 不为None时删除早于该月数的归档分区。按小时、天、周的汇总（price_rollups）保留在主库中，
+    不受归档和删除影响。vacuum=True 时在归档后整理主库文件。
+    """
+    from db_setup import bump_generation, create_database
+    
+    archive_dir = archive_dir or default_archive_dir(db_path)
+    os.makedirs(archive_dir, exist_ok=True)
+    now = now or datetime.now()
+    cut_day = week_start(*shift_month(now.year, now.month, -(keep_months - 1)))
+    cutoff = f"{cut_day.isoformat()} 00:00:00"
+    
+    conn = create_database(db_path)
+    archived = {}
+    try:
+        months = [row[0] for row in conn.execute('''
+        SELECT DISTINCT substr(timestamp, 1, 7) FROM price_history WHERE timestamp < ? ORDER BY 1
+        ''', (cutoff,))]
+        for text in months:
+            year, month = int(text[:4]), int(text[5:7])
+            archived[text] = _archive_month(conn, archive_dir, year, month, cutoff)
+            logger.info(f"已归档 {text}: {archived[text]} 行")
+        
+        # 之后写入早于边界的价格点时，回填会跳过，汇总也不会按不完整的数据重新计算
+        boundary = int(cut_day.strftime("%Y%m%d"))
+        with conn:
+            conn.execute('''
+            INSERT INTO db_meta (key, value) VALUES ('archive_before', ?)
+            ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)
+            ''', (boundary,))
+        
+        dropped = []
+        if drop_after_months is not None:
+            drop_before = month_key(*shift_month(now.year, now.month, -drop_after_months))
+            for year, month, path in list_partitions(archive_dir):
+                if month_key(year, month) < drop_before:
+                    os.remove(path)
+                    dropped.append(path)
+                    logger.info(f"已删除过期分区 {path}")
+            if dropped:
+                # 价格历史查询会读取归档分区，缓存的结果需要失效
+                with conn:
+                    bump_generation(conn)
+        
+        if vacuum and archived:
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+    return {"archived": archived, "dropped": dropped}
+
+def main():
+    from metrics import configure_logging
+    
+    parser = argparse.ArgumentParser(description="把早期的价格历史归档到按月分区的SQLite文件")
+    parser.add_argument("--db", default="csgo_items.db", help="数据库文件")
+    parser.add_argument("--archive-dir", default=None, help="归档目录（默认为 数据库名_archive/）")
+    parser.add_argument("--keep-months", type=int, default=3, help="主库保留的月数（含当前月）")
+    parser.add_argument("--drop-after-months", type=int, default=None, help="删除早于该月数的归档分区")
+    parser.add_argument("--vacuum", action="store_true", help="归档后整理主库文件")
+    parser.add_argument("--list", action="store_true", help="只列出已有的分区")
+    parser.add_argument("--log-level", default="INFO", help="日志级别")
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    
+    archive_dir = args.archive_dir or default_archive_dir(args.db)
+    if not args.list:
+        result = compact_partitions(args.db, args.keep_months, archive_dir, args.drop_after_months, args.vacuum)
+        print(f"归档 {len(result['archived'])} 个月，共 {sum(result['archived'].values())} 行，"
+              f"删除 {len(result['dropped'])} 个过期分区")
+    for year, month, path in list_partitions(archive_dir):
+        print(f"{year:04d}-{month:02d}: {os.path.getsize(path) / 1024 / 1024:.1f} MB  {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+from db_query import QUERIES, SEARCH_COLUMNS, build_match_query, fetch_items_page
+from metrics import REGISTRY, add_arguments, close_exporters, configure_logging, start_exporters
+from partitions import default_archive_dir, iter_archived_history
+
+logger = logging.getLogger(__name__)
+
+QUERY_SECONDS = REGISTRY.histogram("query_service_seconds", "查询服务各接口的处理耗时", ("endpoint",))
+REQUESTS = REGISTRY.counter("query_service_requests_total", "查询服务请求数（按接口和状态码）", ("endpoint", "status"))
+POOL_WAIT_SECONDS = REGISTRY.histogram("query_service_pool_wait_seconds", "等待空闲只读连接的时间")
+
+# 单页最多返回的行数
+MAX_PAGE_SIZE = 1000
+
+class PoolTimeout(Exception):
+    """在等待时间内没有空闲连接"""
+
+class ReadPool:
+    """只读SQLite连接池：每个连接以 mode=ro 打开并设置 query_only，复用预编译语句
+    
+    数据库使用WAL模式，读连接不会阻塞导入写入，写入也不会阻塞读取。
+    每次借出连接都在一个读事务中执行，同一次借出中的多条查询看到同一个快照。
+    """
+    
+    def __init__(self, db_path, size=4, timeout=5.0, cached_statements=64):
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(f"数据库文件不存在: {db_path}")
+        self.db_path = db_path
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        uri = f"file:{quote(os.path.abspath(db_path))}?mode=ro"
+        for _ in range(size):
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None,
+                                   cached_statements=cached_statements)
+            conn.execute("PRAGMA query_only=ON")
+            self._connections.append(conn)
+            self._idle.put(conn)
+    
+    @contextmanager
+    def connection(self):
+        """借出一个连接，在读事务（一致快照）中使用，归还时结束事务"""
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"{self.timeout} 秒内没有空闲的数据库连接")
+        POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+        try:
+            conn.execute("BEGIN")
+            try:
+                yield conn
+            finally:
+                conn.execute("COMMIT")
+        finally:
+            self._idle.put(conn)
+    
+    def close(self):
+        for conn in self._connections:
+            conn.close()
+
+class QueryService:
+    """CSGODatabase常用查询的线程安全版本，返回可直接序列化为JSON的字典"""
+    
+    def __init__(self, pool, archive_dir=None):
+        self.pool = pool
+        self.archive_dir = archive_dir or default_archive_dir(pool.db_path)
+    
+    def categories(self):
+        with self.pool.connection() as conn:
+            rows = conn.execute(QUERIES["get_categories"]).fetchall()
+        return {"categories": [{"category": category, "count": count} for category, count in rows]}
+    
+    def items(self, category=None, limit=100, after=None):
+        """按价格从高到低分页，next 为下一页游标"""
+        with self.pool.connection() as conn:
+            columns, rows, next_cursor = fetch_items_page(conn, category, limit, after)
+        return {"items": [dict(zip(columns, row)) for row in rows], "next": next_cursor}
+    
+    def search(self, keyword, limit=100):
+        match = build_match_query(keyword)
+        if not match:
+            return {"items": []}
+        with self.pool.connection() as conn:
+            rows = conn.execute(QUERIES["search_items"], (match, limit)).fetchall()
+        return {"items": [dict(zip(SEARCH_COLUMNS, row)) for row in rows]}
+    
+    def history(self, item_id=None, market_hash_name=None):
+        """物品的价格历史（包括已归档的月份），可按ID或market_hash_name查询，物品不存在时返回None"""
+        with self.pool.connection() as conn:
+            if item_id is None:
+                row = conn.execute(QUERIES["get_item_id"], (market_hash_name,)).fetchone()
+                if row is None:
+                    return None
+                item_id = row[0]
+            rows = conn.execute(QUERIES["get_item_price_history"], (item_id,)).fetchall()
+        rows = list(iter_archived_history(self.archive_dir, item_id)) + rows
+        return {"item_id": item_id,
+                "history": [{"price": price, "volume": volume, "timestamp": timestamp}
+                            for price, volume, timestamp in rows]}
+
+def _page_size(params, default=100):
+    limit = int(params.get("limit", default))
+    if limit < 1:
+        raise ValueError("limit 必须大于0")
+    return min(limit, MAX_PAGE_SIZE)
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """只读JSON接口: /categories、/items、/search、/history、/healthz、/metrics"""
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _send_json(self, endpoint, status, data):
+        REQUESTS.inc(endpoint=endpoint, status=str(status))
+        self._send(status, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+    
+    def do_GET(self):
+        url = urlsplit(self.path)
+        endpoint = url.path.strip("/") or "healthz"
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        service = self.server.service
+        if endpoint == "metrics":
+            self._send(200, REGISTRY.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+            return
+        started = time.perf_counter()
+        try:
+            if endpoint == "healthz":
+                data = {"status": "ok"}
+            elif endpoint == "categories":
+                data = service.categories()
+            elif endpoint == "items":
+                data = service.items(params.get("category"), _page_size(params), params.get("after"))
+            elif endpoint == "search":
+                data = service.search(params.get("q", ""), _page_size(params))
+            elif endpoint == "history":
+                item_id = int(params["item_id"]) if "item_id" in params else None
+                if item_id is None and "name" not in params:
+                    raise ValueError("需要 item_id 或 name 参数")
+                data = service.history(item_id, params.get("name"))
+                if data is None:
+                    self._send_json(endpoint, 404, {"error": "物品不存在"})
+                    return
+            else:
+                self._send_json("unknown", 404, {"error": f"未知接口: {url.path}"})
+                return
+        except ValueError as e:
+            self._send_json(endpoint, 400, {"error": str(e)})
+            return
+        except PoolTimeout as e:
+            self._send_json(endpoint, 503, {"error": str(e)})
+            return
+        except sqlite3.Error as e:
+            logger.error(f"查询 {self.path} 时出错: {e}")
+            self._send_json(endpoint, 500, {"error": str(e)})
+            return
+        QUERY_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+        self._send_json(endpoint, 200, data)
+
+class QueryServer:
+    """在后台线程中提供只读查询接口"""
+    
+    def __init__(self, service, port=8790, host="127.0.0.1"):
+        self.server = ThreadingHTTPServer((host, port), QueryHandler)
+        self.server.daemon_threads = True
+        self.server.service = service
+        self._thread = threading.Thread(target=self.server.serve_forever, name="query-server", daemon=True)
+    
+    @property
+    def port(self):
+        return self.server.server_port
+    
+    def start(self):
+        self._thread.start()
+        return self
+    
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="CSGO物品数据库的本地只读HTTP查询接口")
+    parser.add_argument("--db", default="csgo_items.db", help="数据库文件")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8790, help="监听端口")
+    parser.add_argument("--pool-size", type=int, default=4, help="只读连接数")
+    parser.add_argument("--pool-timeout", type=float, default=5.0, help="等待空闲连接的最长时间（秒），超时返回503")
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    exporters = start_exporters(args.metrics_port, args.metrics_file, metrics_host=args.metrics_host)
+    
+    pool = ReadPool(args.db, args.pool_size, args.pool_timeout)
+    server = QueryServer(QueryService(pool), args.port, args.host).start()
+    logger.info(f"查询接口: http://{args.host}:{server.port}/items")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        pool.close()
+        close_exporters(exporters)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# 各接口的默认速率 (初始速率, 最大速率)，单位: 请求/秒，按每个代理分别计算
+DEFAULT_ENDPOINT_RATES = {
+    "search": (0.5, 2.0),
+    "pricehistory": (0.3, 1.0),
+}
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """带抖动的指数退避（full jitter）"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def parse_retry_after(value):
+    """解析Retry-After响应头，支持秒数和HTTP日期两种格式"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+def proxy_key(proxy):
+    """把代理配置转换为限速器使用的键"""
+    if not proxy:
+        return "direct"
+    if isinstance(proxy, dict):
+        return proxy.get("https") or proxy.get("http") or "direct"
+    return str(proxy)
+
+class TokenBucket:
+    """线程安全的令牌桶，速率按AIMD规则调整"""
+    
+    def __init__(self, rate, max_rate, capacity=1.0, min_rate=0.02,
+                 increase=0.02, decrease=0.5):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.capacity = capacity
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.successes = 0
+        self.throttles = 0
+        self.lock = threading.Lock()
+    
+    def _refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+    
+    def reserve(self, tokens=1.0):
+        """预留令牌并返回需要等待的秒数，本身不阻塞，线程和asyncio都可以使用"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= tokens
+            # updated 可能位于未来（Retry-After期间不补充令牌）
+            wait = max(0.0, self.updated - now)
+            if self.tokens < 0:
+                wait += -self.tokens / self.rate
+            return wait
+    
+    def on_success(self):
+        """加性增：每次成功略微提高速率"""
+        with self.lock:
+            self.successes += 1
+            self.rate = min(self.max_rate, self.rate + self.increase)
+    
+    def on_throttle(self, retry_after=None):
+        """乘性减：遇到429时降低速率，并在Retry-After（或一个请求间隔）内暂停发放令牌"""
+        with self.lock:
+            self.throttles += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            pause = retry_after if retry_after is not None else 1.0 / self.rate
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = max(self.updated, now + pause)
+    
+    def snapshot(self):
+        with self.lock:
+            now = time.monotonic()
+            return {
+                "rate": round(self.rate, 4),
+                "max_rate": self.max_rate,
+                "tokens": round(self.tokens, 3),
+                "paused_for": round(max(0.0, self.updated - now), 2),
+                "successes": self.successes,
+                "throttles": self.throttles,
+            }
+
+class RateLimiter:
+    """按 (代理, 接口) 维护令牌桶的全局限速器，供所有工作线程共享"""
+    
+    def __init__(self, endpoint_rates=None, capacity=1.0, min_rate=0.02, increase=0.02, decrease=0.5):
+        self.endpoint_rates = dict(DEFAULT_ENDPOINT_RATES)
+        if endpoint_rates:
+            self.endpoint_rates.update(endpoint_rates)
+        self.capacity = capacity
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.buckets = {}
+        self.lock = threading.Lock()
+    
+    def bucket(self, endpoint, proxy=None):
+        key = (proxy_key(proxy), endpoint)
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                rate, max_rate = self.endpoint_rates.get(endpoint, DEFAULT_ENDPOINT_RATES["search"])
+                bucket = TokenBucket(rate, max_rate, self.capacity, self.min_rate,
+                                     self.increase, self.decrease)
+                self.buckets[key] = bucket
+            return bucket
+    
+    def reserve(self, endpoint, proxy=None):
+        """预留一次请求，返回需要等待的秒数"""
+        return self.bucket(endpoint, proxy).reserve()
+    
+    def acquire(self, endpoint, proxy=None):
+        """阻塞直到可以发送请求，返回实际等待的秒数"""
+        wait = self.reserve(endpoint, proxy)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+    
+    def record_success(self, endpoint, proxy=None):
+        self.bucket(endpoint, proxy).on_success()
+    
+    def record_throttle(self, endpoint, proxy=None, retry_after=None):
+        self.bucket(endpoint, proxy).on_throttle(retry_after)
+    
+    def snapshot(self):
+        """返回当前所有令牌桶的实时速率"""
+        with self.lock:
+            items = list(self.buckets.items())
+        return [dict(proxy=proxy, endpoint=endpoint, **bucket.snapshot())
+                for (proxy, endpoint), bucket in sorted(items)]
+    
+    def total_rate(self, endpoint=None):
+        """当前允许的总请求速率（请求/秒）"""
+        return sum(entry["rate"] for entry in self.snapshot()
+                   if endpoint is None or entry["endpoint"] == endpoint)
+    
+    def report(self):
+        """输出各令牌桶的实时速率，便于调参"""
+        for entry in self.snapshot():
+            logger.info(f"[{entry['endpoint']}] {entry['proxy']}: {entry['rate']:.3f} 请求/秒 "
+                        f"(上限 {entry['max_rate']}, 成功 {entry['successes']}, 429 {entry['throttles']})")
+        logger.info(f"总速率: {self.total_rate():.3f} 请求/秒")
@@ -0,0 +1,110 @@
+import json
+import sys
+
+# 紧凑记录行的字段顺序：item_type 和 rarity 写为字符串表中的编号，market_hash_name 与 name 相同时写为 null，
+# price 以分为单位
+RECORD_FIELDS = ("name", "market_hash_name", "item_type", "rarity", "icon_url", "price", "volume")
+
+class StringTable:
+    """重复出现的字符串（类型、稀有度）的编号表，同一个值在内存中只保留一份"""
+    
+    def __init__(self, values=()):
+        self.values = []
+        self.index = {}
+        for value in values:
+            self.add(value)
+    
+    def __len__(self):
+        return len(self.values)
+    
+    def add(self, value):
+        """返回值的编号，新值追加到表末尾"""
+        number = self.index.get(value)
+        if number is None:
+            value = sys.intern(value)
+            number = len(self.values)
+            self.values.append(value)
+            self.index[value] = number
+        return number
+    
+    def intern(self, value):
+        """返回表中与 value 相等的字符串对象"""
+        return self.values[self.add(value)]
+
+class ItemRecord:
+    """收集阶段保留的物品字段，只包含导入数据库需要的信息"""
+    
+    __slots__ = RECORD_FIELDS
+    
+    def __init__(self, name, market_hash_name, item_type, rarity, icon_url, price, volume):
+        self.name = name
+        self.market_hash_name = market_hash_name
+        self.item_type = item_type
+        self.rarity = rarity
+        self.icon_url = icon_url
+        self.price = price
+        self.volume = volume
+    
+    @classmethod
+    def from_result(cls, item, strings):
+        """从Steam search/render返回的单个结果创建记录，重复的字符串通过 strings 共享"""
+        description = item.get("asset_description") or {}
+        name = item.get("name", "")
+        market_hash_name = item.get("hash_name") or description.get("market_hash_name") or name
+        return cls(name, market_hash_name, strings.intern(description.get("type", "")),
+                   strings.intern(item.get("rarity", "")), description.get("icon_url", ""),
+                   int(item.get("sell_price") or 0), int(item.get("sell_listings") or 0))
+    
+    def encode(self, strings):
+        """编码为JSONL中的一行数组，新出现的字符串加入 strings"""
+        return [self.name, None if self.market_hash_name == self.name else self.market_hash_name,
+                strings.add(self.item_type), strings.add(self.rarity), self.icon_url, self.price, self.volume]
+    
+    @classmethod
+    def decode(cls, row, strings):
+        name, market_hash_name, item_type, rarity, icon_url, price, volume = row
+        return cls(name, market_hash_name or name, strings.values[item_type], strings.values[rarity],
+                   icon_url, price, volume)
+    
+    def as_dict(self):
+        """转换为 db_setup.extract_item_fields 可读取的扁平格式"""
+        return {"name": self.name, "market_hash_name": self.market_hash_name, "type": self.item_type,
+                "rarity": self.rarity, "icon_url": self.icon_url, "price": self.price / 100,
+                "volume": self.volume}
+
+def encode_lines(records, strings):
+    """把一批记录编码为JSONL行，本批新出现的字符串先写为一行 {"strings": [...]}"""
+    defined = len(strings)
+    rows = [record.encode(strings) for record in records]
+    lines = []
+    if len(strings) > defined:
+        lines.append(json.dumps({"strings": strings.values[defined:]}, ensure_ascii=False))
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+    return lines
+
+def _iter_jsonl(lines, strings):
+    """逐行解析检查点JSONL：紧凑记录返回 ItemRecord，原始结果返回字典，字符串表行加入 strings"""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        value = json.loads(line)
+        if isinstance(value, list):
+            yield ItemRecord.decode(value, strings)
+        elif "strings" in value:
+            for text in value["strings"]:
+                strings.add(text)
+        else:
+            yield value
+
+def iter_jsonl_records(lines):
+    """逐行读取检查点中的 ItemRecord，旧版检查点中的原始search/render结果在读取时转换"""
+    strings = StringTable()
+    for value in _iter_jsonl(lines, strings):
+        yield value if isinstance(value, ItemRecord) else ItemRecord.from_result(value, strings)
+
+def iter_jsonl_items(lines):
+    """逐行读取检查点中的物品，紧凑记录转换为扁平字典，原始结果按原样返回"""
+    for value in _iter_jsonl(lines, StringTable()):
+        yield value.as_dict() if isinstance(value, ItemRecord) else value
@@ -0,0 +1,23 @@
+from analytics import MarketAnalytics
+from db_setup import bump_generation, create_database, refresh_rollups, write_price_history
+
+def test_in_place_price_update_invalidates_cached_frame(tmp_path):
+    db_path = str(tmp_path / "csgo_items.db")
+    conn = create_database(db_path)
+    with conn:
+        conn.execute("INSERT INTO csgo_items (name, market_hash_name, price) VALUES ('AK', 'AK', 1.0)")
+        write_price_history(conn, [(1, 1.0, 1, "2026-10-01 00:00:00"), (1, 2.0, 1, "2026-10-02 00:00:00")])
+        refresh_rollups(conn)
+        bump_generation(conn)
+    
+    analytics = MarketAnalytics(db_path)
+    assert list(analytics.frame()["price"]) == [1.0, 2.0]
+    
+    # 同一时间点的价格被覆盖：MAX(id) 不变
+    with conn:
+        write_price_history(conn, [(1, 5.0, 1, "2026-10-02 00:00:00")])
+        refresh_rollups(conn)
+        bump_generation(conn)
+    conn.close()
+    assert list(analytics.frame()["price"]) == [1.0, 5.0]
+    analytics.close()
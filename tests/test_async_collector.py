@@ -0,0 +1,85 @@
+import asyncio
+
+from async_collector import AsyncSteamMarketCollector
+from mock_steam import MockSteamMarket
+
+class RecordingProxyPool:
+    """只使用一个代理，记录反馈给代理池的结果"""
+    
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.successes = 0
+        self.failures = []
+    
+    def get_proxy(self):
+        return self.proxy
+    
+    def report_success(self, proxy, latency):
+        self.successes += 1
+    
+    def report_failure(self, proxy, kind):
+        self.failures.append(kind)
+
+def fetch_history(base_url, proxy_pool, market_hash_name):
+    async def run():
+        async with AsyncSteamMarketCollector(proxy_pool=proxy_pool, base_url=base_url, max_retries=3) as collector:
+            return await collector.get_item_price_history(730, market_hash_name)
+    return asyncio.run(run())
+
+def test_client_error_is_not_retried_or_blamed_on_the_proxy():
+    with MockSteamMarket(proxies=1) as market:
+        pool = RecordingProxyPool(market.proxies[0])
+        # 不存在的路径返回404
+        assert fetch_history(market.base_url + "/missing", pool, "AK-47 | Redline (Field-Tested)") is None
+        assert market.snapshot() == {"unknown:404": 1}
+    assert pool.failures == []
+    assert pool.successes == 1
+
+def test_unsuccessful_price_history_returns_none():
+    with MockSteamMarket(proxies=1) as market:
+        pool = RecordingProxyPool(market.proxies[0])
+        assert fetch_history(market.base_url, pool, "") is None
+        data = fetch_history(market.base_url, pool, "AK-47 | Redline (Field-Tested)")
+    assert data["success"] and data["prices"]
+
+def test_checkpoint_writes_do_not_block_the_event_loop(tmp_path, monkeypatch):
+    import time
+    
+    from async_collector import async_crawl_item_types
+    from checkpoint import CategoryCheckpoint
+    
+    append_page = CategoryCheckpoint.append_page
+    
+    def slow_append_page(self, *args, **kwargs):
+        time.sleep(0.2)
+        return append_page(self, *args, **kwargs)
+    
+    monkeypatch.setattr(CategoryCheckpoint, "append_page", slow_append_page)
+    
+    class FakeCollector:
+        async def search_items(self, appid, category=None, start=0, count=10):
+            await asyncio.sleep(0.01)
+            results = [{"name": f"{category} {i}", "hash_name": f"{category} {i}"} for i in range(start, start + count)]
+            return {"success": True, "total_count": 3 * count, "results": results}
+    
+    async def run():
+        # 写入期间事件循环应能继续处理其他任务
+        gaps = []
+        
+        async def ticker():
+            last = time.perf_counter()
+            while True:
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+        
+        tick = asyncio.ensure_future(ticker())
+        counts = await async_crawl_item_types(FakeCollector(), ["Rifle"], items_per_page=5, save_dir=str(tmp_path),
+                                              pages_in_flight=1)
+        tick.cancel()
+        return counts, max(gaps)
+    
+    counts, longest_gap = asyncio.run(run())
+    assert counts == {"Rifle": 15}
+    assert longest_gap < 0.15
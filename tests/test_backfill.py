@@ -0,0 +1,71 @@
+import sqlite3
+import threading
+
+from backfill import backfill_price_history, select_backfill_items
+from db_setup import create_database
+
+class FakeCollector:
+    """名称以 bad 开头的物品抛出异常，其余返回一个价格点"""
+    
+    def __init__(self):
+        self.requested = []
+        self.lock = threading.Lock()
+    
+    def get_item_price_history(self, appid, market_hash_name):
+        with self.lock:
+            self.requested.append(market_hash_name)
+        if market_hash_name.startswith("bad"):
+            raise RuntimeError("连接被重置")
+        return {"success": True, "prices": [["Oct 10 2026 01: +0", 1.5, "3"]]}
+
+def test_failed_tasks_are_counted_and_do_not_drop_pending_items(tmp_path):
+    db_path = str(tmp_path / "csgo_items.db")
+    names = [f"bad{i}" if i % 3 == 0 else f"good{i}" for i in range(30)]
+    conn = create_database(db_path)
+    with conn:
+        conn.executemany("INSERT INTO csgo_items (name, market_hash_name, volume) VALUES (?, ?, ?)",
+                         [(name, name, 100 - i) for i, name in enumerate(names)])
+    conn.close()
+    
+    collector = FakeCollector()
+    result = backfill_price_history(collector, db_path, max_workers=2, commit_every=5)
+    
+    assert sorted(collector.requested) == sorted(names)
+    assert result["items"] == 30
+    assert result["failed"] == 10
+    assert result["points"] == 20
+    conn = sqlite3.connect(db_path)
+    statuses = dict(conn.execute("SELECT status, COUNT(*) FROM price_history_backfill GROUP BY status").fetchall())
+    conn.close()
+    assert statuses == {"ok": 20, "failed": 10}
+
+def test_failed_items_back_off_behind_never_fetched_items(tmp_path):
+    db_path = str(tmp_path / "csgo_items.db")
+    conn = create_database(db_path)
+    with conn:
+        conn.executemany("INSERT INTO csgo_items (name, market_hash_name, volume) VALUES (?, ?, ?)",
+                         [("bad", "bad", 1000), ("good", "good", 1)])
+    conn.close()
+    
+    backfill_price_history(FakeCollector(), db_path, limit=1)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT status, attempts FROM price_history_backfill").fetchall() == [("failed", 1)]
+    
+    # 失败的物品在退避期内不会再排在从未回填的物品前面
+    collector = FakeCollector()
+    backfill_price_history(collector, db_path, limit=1)
+    assert collector.requested == ["good"]
+    assert select_backfill_items(conn) == []
+    
+    # 退避期过后重试，连续失败 max_failures 次后不再选出
+    for attempts in (2, 3):
+        with conn:
+            conn.execute("UPDATE price_history_backfill SET last_failed = datetime('now', '-1 day') WHERE item_id = 1")
+        assert select_backfill_items(conn, max_failures=3) == [(1, "bad")]
+        backfill_price_history(FakeCollector(), db_path, max_failures=3)
+        assert conn.execute("SELECT attempts FROM price_history_backfill WHERE item_id = 1").fetchone() == (attempts,)
+    with conn:
+        conn.execute("UPDATE price_history_backfill SET last_failed = datetime('now', '-1 day') WHERE item_id = 1")
+    assert select_backfill_items(conn, max_failures=3) == []
+    assert select_backfill_items(conn, max_failures=4) == [(1, "bad")]
+    conn.close()
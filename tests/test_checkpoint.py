@@ -0,0 +1,35 @@
+import json
+
+from checkpoint import CategoryCheckpoint
+from records import ItemRecord
+
+def page(start, count):
+    return [ItemRecord(f"item {i}", f"item {i}", "Rifle", "Covert", "", 100 * i, i) for i in range(start, start + count)]
+
+def test_resume_from_cursor_drops_partial_page(tmp_path):
+    checkpoint = CategoryCheckpoint(str(tmp_path), "rifle", "20261017")
+    checkpoint.set_total(30)
+    checkpoint.append_page(page(0, 10), 10, start=0)
+    checkpoint.append_page(page(20, 10), 30, start=20)
+    # 写入途中进程被终止，游标之后留下半页
+    with open(checkpoint.data_path, "a", encoding="utf-8") as f:
+        f.write('["item 10", null, 0, 1')
+    
+    resumed = CategoryCheckpoint(str(tmp_path), "rifle", "20261017")
+    assert resumed.item_count == 20 and resumed.total == 30
+    assert resumed.completed_starts(10) == {0, 20}
+    assert [record.name for record in resumed.iter_records()][-1] == "item 29"
+    
+    resumed.append_page(page(10, 10), 20, start=10)
+    assert resumed.compact() == 30
+    with open(resumed.json_path, encoding="utf-8") as f:
+        items = json.load(f)
+    assert items[0] == {"name": "item 0", "market_hash_name": "item 0", "type": "Rifle", "rarity": "Covert",
+                        "icon_url": "", "price": 0.0, "volume": 0}
+    assert sorted(item["volume"] for item in items) == list(range(30))
+
+def test_legacy_cursor_treats_earlier_pages_as_done(tmp_path):
+    checkpoint = CategoryCheckpoint(str(tmp_path), "rifle", "20261017")
+    checkpoint.append_page(page(0, 10), 20)
+    checkpoint.cursor["done"] = []
+    assert checkpoint.completed_starts(10) == {0, 10}
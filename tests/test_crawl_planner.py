@@ -0,0 +1,75 @@
+import json
+
+from crawl_planner import CrawlPlanner
+
+def page(names, total=None):
+    result = {"success": True, "results": [{"name": name, "hash_name": name} for name in names]}
+    if total is not None:
+        result["total_count"] = total
+    return result
+
+def names(start, count, prefix="item"):
+    return [f"{prefix} {i}" for i in range(start, start + count)]
+
+def test_failed_pages_are_retried_up_to_max_attempts(tmp_path):
+    planner = CrawlPlanner(["Rifle"], str(tmp_path), items_per_page=2, max_pages=10, max_attempts=2)
+    plan = planner.plans["Rifle"]
+    # 第一页返回总数之前只请求第一页
+    assert planner.next_requests(10) == [("Rifle", 0)]
+    assert planner.next_requests(10) == []
+    planner.record("Rifle", 0, page(names(0, 2), total=6))
+    assert planner.next_requests(10) == [("Rifle", 2), ("Rifle", 4)]
+    
+    planner.record("Rifle", 2, page(names(2, 2), total=6))
+    planner.record("Rifle", 4, None)
+    assert planner.next_requests(10) == [("Rifle", 4)]
+    planner.record("Rifle", 4, {"success": False})
+    assert planner.next_requests(10) == []
+    assert plan.missing() == [4]
+    assert plan.compacted and not planner.has_work()
+    with open(plan.checkpoint.json_path, encoding="utf-8") as f:
+        assert [item["name"] for item in json.load(f)] == names(0, 4)
+    
+    # 重新运行时从检查点继续，只补抓缺少的页
+    planner = CrawlPlanner(["Rifle"], str(tmp_path), items_per_page=2, max_pages=10, max_attempts=2)
+    assert planner.next_requests(10) == [("Rifle", 4)]
+    planner.record("Rifle", 4, page(names(4, 2), total=6))
+    assert planner.plans["Rifle"].missing() == []
+    assert planner.finish() == {"Rifle": 6}
+
+def test_plan_extends_when_total_count_grows(tmp_path):
+    planner = CrawlPlanner(["Rifle"], str(tmp_path), items_per_page=2, max_pages=4)
+    planner.next_requests(10)
+    planner.record("Rifle", 0, page(names(0, 2), total=4))
+    assert planner.next_requests(10) == [("Rifle", 2)]
+    planner.record("Rifle", 2, page(names(2, 2), total=7))
+    # 总数增加后计划扩展，但不超过 max_pages 页
+    assert planner.next_requests(10) == [("Rifle", 4), ("Rifle", 6)]
+    planner.record("Rifle", 6, page(names(6, 1)))
+    assert planner.plans["Rifle"].missing() == [4]
+    # 短页（少于 items_per_page）也算完成
+    planner.record("Rifle", 4, page([], total=7))
+    assert planner.plans["Rifle"].missing() == []
+    assert planner.finish() == {"Rifle": 5}
+
+def test_pages_without_total_count_are_fetched_one_by_one(tmp_path):
+    planner = CrawlPlanner(["Rifle"], str(tmp_path), items_per_page=2, max_pages=10)
+    planner.next_requests(10)
+    planner.record("Rifle", 0, page(names(0, 2)))
+    assert planner.next_requests(10) == [("Rifle", 2)]
+    planner.record("Rifle", 2, page(names(2, 1)))
+    assert planner.next_requests(10) == []
+    assert planner.finish() == {"Rifle": 3}
+
+def test_items_are_deduplicated_across_categories(tmp_path):
+    planner = CrawlPlanner(["Weapon Case", "Container"], str(tmp_path), items_per_page=2, max_pages=10)
+    assert planner.next_requests(10) == [("Weapon Case", 0), ("Container", 0)]
+    assert planner.record("Weapon Case", 0, page(["case 1", "case 2"], total=2)) == 2
+    assert planner.record("Container", 0, page(["case 2", "capsule"], total=2)) == 1
+    assert planner.finish() == {"Weapon Case": 2, "Container": 1}
+    
+    # 恢复时从检查点重建去重集合
+    planner = CrawlPlanner(["Sticker"], str(tmp_path), items_per_page=2, max_pages=10)
+    assert planner.seen == {}
+    planner = CrawlPlanner(["Weapon Case", "Container"], str(tmp_path), items_per_page=2, max_pages=10)
+    assert planner.seen == {"case 1": "Weapon Case", "case 2": "Weapon Case", "capsule": "Container"}
@@ -0,0 +1,73 @@
+import pytest
+
+from db_query import CSGODatabase, build_match_query
+from db_setup import create_database
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "csgo_items.db")
+    conn = create_database(path)
+    with conn:
+        conn.executemany('''
+        INSERT INTO csgo_items (name, market_hash_name, item_type, category, rarity, price) VALUES (?, ?, ?, ?, ?, ?)
+        ''', [
+            ("AK-47 | Redline (Field-Tested)", "AK-47 | Redline (Field-Tested)", "Rifle", "Rifle", "Classified", 10.0),
+            ("AK-47 | Redwood", "AK-47 | Redwood", "Rifle", "Rifle", "Restricted", 1.0),
+            ("Pokémon Sticker", "Pokémon Sticker", "Sticker", "Sticker", "High Grade", 0.5),
+            ("Redline Case", "Redline Case", "Container", "Container", "Base Grade", 20.0),
+        ])
+    conn.close()
+    db = CSGODatabase(path)
+    yield db
+    db.close()
+
+def test_build_match_query():
+    assert build_match_query("AK-47 | Redline") == ('("ak" OR "ak"*) AND ("47" OR "47"*) AND '
+                                                   '("redline" OR "redline"*)')
+    # 引号、括号等FTS5语法字符不会进入查询
+    assert build_match_query('"red" OR (NEAR*') == '("red" OR "red"*) AND ("or" OR "or"*) AND ("near" OR "near"*)'
+    assert build_match_query(" |-* ") == ""
+
+def test_search_items_matches_every_word_by_prefix(db):
+    assert set(db.search_items("ak red")["name"]) == {"AK-47 | Redline (Field-Tested)", "AK-47 | Redwood"}
+    assert set(db.search_items("redline")["name"]) == {"AK-47 | Redline (Field-Tested)", "Redline Case"}
+    # 去除变音符号后匹配，类型列也被索引
+    assert list(db.search_items("pokemon")["name"]) == ["Pokémon Sticker"]
+    assert list(db.search_items("container")["name"]) == ["Redline Case"]
+    assert len(db.search_items("ak", limit=1)) == 1
+    assert db.search_items("awp").empty
+
+def test_query_cache_is_invalidated_by_generation(db, tmp_path):
+    from db_setup import bump_generation
+    
+    first = db.get_items_by_category("Rifle")
+    first.loc[0, "name"] = "modified"
+    assert db.cache.misses == 1
+    # 返回的是缓存结果的副本
+    assert db.get_items_by_category("Rifle")["name"][0] != "modified"
+    assert db.cache.hits == 1
+    
+    conn = create_database(str(tmp_path / "csgo_items.db"))
+    with conn:
+        conn.execute("UPDATE csgo_items SET price = 99.0 WHERE name = 'AK-47 | Redwood'")
+        bump_generation(conn)
+    conn.close()
+    assert 99.0 in set(db.get_items_by_category("Rifle")["price"])
+    assert db.cache.misses == 2
+    
+    db.cache.maxsize = 1
+    db.search_items("ak")
+    db.get_items_by_category("Rifle")
+    assert list(db.cache.entries) == [("get_items_by_category", ("Rifle",))]
+
+@pytest.mark.parametrize("limit", [0, -1, 2.5, None])
+def test_items_page_rejects_invalid_limit(db, limit):
+    with pytest.raises(ValueError):
+        db.get_items_page(limit=limit)
+
+def test_items_page_walks_category(db):
+    columns, rows, after = db.get_items_page("Rifle", limit=1)
+    assert [row[columns.index("price")] for row in rows] == [10.0] and after
+    columns, rows, after = db.get_items_page("Rifle", limit=1, after=after)
+    assert [row[columns.index("price")] for row in rows] == [1.0]
+    assert db.get_items_page("Rifle", limit=1, after=after)[1:] == ([], None)
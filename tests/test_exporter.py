@@ -0,0 +1,27 @@
+from db_setup import bump_generation, create_database, refresh_rollups, write_price_history
+from exporter import open_export, run_export
+
+def write(path, rows):
+    conn = create_database(path)
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO csgo_items (name, market_hash_name, price) VALUES ('AK', 'AK', 1.0)")
+        write_price_history(conn, [(1, price, 1, timestamp) for timestamp, price in rows])
+        refresh_rollups(conn)
+        bump_generation(conn)
+    conn.close()
+
+def test_delta_contains_new_and_updated_rows(tmp_path):
+    db_path, export_dir = str(tmp_path / "csgo_items.db"), str(tmp_path / "export")
+    write(db_path, [("2026-10-01 00:00:00", 1.0)])
+    assert run_export(db_path, export_dir)["kind"] == "snapshot"
+    assert run_export(db_path, export_dir)["kind"] is None
+    
+    # 两次导出之间同一行修改两次，另有一行新增
+    write(db_path, [("2026-10-01 00:00:00", 2.0)])
+    write(db_path, [("2026-10-01 00:00:00", 3.0), ("2026-10-02 00:00:00", 4.0)])
+    result = run_export(db_path, export_dir)
+    assert result["kind"] == "delta" and result["rows"]["price_history"] == 2
+    
+    _, snapshot, deltas = open_export(export_dir)
+    assert list(snapshot["price_history"]["price"]) == [1.0]
+    assert list(deltas[0]["price_history"]["price"]) == [3.0, 4.0]
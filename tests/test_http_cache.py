@@ -0,0 +1,68 @@
+import http_cache
+from collector import SteamMarketCollector
+from http_cache import ResponseCache
+from mock_steam import MockSteamMarket
+
+URL = "https://steamcommunity.com/market/search/render/"
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+    
+    def __call__(self):
+        return self.now
+
+def test_entries_expire_per_endpoint(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(http_cache.time, "time", clock)
+    cache = ResponseCache(str(tmp_path / "cache.db"), ttls={"search": 100, "pricehistory": 10})
+    cache.set("search", URL, {"start": 0, "count": 10}, {"success": True, "page": 0})
+    cache.set("pricehistory", URL, {"market_hash_name": "AK"}, {"success": True})
+    
+    clock.now += 50
+    # 参数顺序和类型不影响缓存键
+    assert cache.get("search", URL, {"count": "10", "start": "0"}) == {"success": True, "page": 0}
+    assert cache.get("pricehistory", URL, {"market_hash_name": "AK"}) is None
+    assert cache.purge_expired() == 1
+    
+    clock.now += 51
+    assert cache.get("search", URL, {"start": 0, "count": 10}) is None
+    cache.close()
+
+def test_lru_eviction_by_size(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(http_cache.time, "time", clock)
+    cache = ResponseCache(str(tmp_path / "cache.db"), compress_level=0)
+    body = {"success": True, "results": "x" * 1000}
+    for start in range(3):
+        clock.now += 1
+        cache.set("search", URL, {"start": start}, body)
+    cache.max_bytes = cache.total_bytes
+    
+    # 读取第一条后它成为最近访问的条目，写入第四条时淘汰第二条
+    clock.now += 1
+    assert cache.get("search", URL, {"start": 0}) is not None
+    clock.now += 1
+    cache.set("search", URL, {"start": 3}, body)
+    assert [cache.get("search", URL, {"start": start}) is not None for start in range(4)] == [True, False, False, True]
+    assert cache.total_bytes <= cache.max_bytes
+    cache.close()
+    
+    # 重新打开时从数据库恢复总大小
+    assert ResponseCache(str(tmp_path / "cache.db")).stats()["search"]["entries"] == 2
+
+def test_refresh_cache_bypasses_reads_but_updates_entries(tmp_path):
+    with MockSteamMarket(items_per_type=20, item_types=["Rifle"]) as market:
+        def search(refresh_cache):
+            collector = SteamMarketCollector(base_url=market.base_url, cache=ResponseCache(str(tmp_path / "cache.db")),
+                                             refresh_cache=refresh_cache)
+            try:
+                return collector.search_items(730, category="Rifle", start=0, count=10)
+            finally:
+                collector.close()
+        
+        first = search(False)
+        assert search(False) == first
+        assert sum(market.snapshot().values()) == 1
+        assert search(True) == first
+        assert sum(market.snapshot().values()) == 2
@@ -0,0 +1,119 @@
+import json
+import sqlite3
+
+import pytest
+
+import db_setup
+
+def write_file(path, names, truncated=False):
+    items = [{"name": name, "hash_name": name, "sell_listings": 1, "sell_price": 100,
+              "asset_description": {"type": "Rifle", "market_hash_name": name}} for name in names]
+    text = json.dumps(items)
+    path.write_text(text[:-40] if truncated else text, encoding="utf-8")
+
+@pytest.fixture
+def data_dir(tmp_path):
+    directory = tmp_path / "data" / "categories"
+    directory.mkdir(parents=True)
+    write_file(directory / "Rifle_20261001.json", [f"a{i}" for i in range(7)])
+    write_file(directory / "Rifle_20261002.json", [f"b{i}" for i in range(7)], truncated=True)
+    write_file(directory / "Rifle_20261003.json", [f"c{i}" for i in range(7)])
+    write_file(directory / "Rifle_20261004.json", [f"d{i}" for i in range(7)])
+    return directory.parent
+
+def imported(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        names = {row[0][0] for row in conn.execute("SELECT market_hash_name FROM csgo_items")}
+        manifest = sorted(path.rsplit("_", 1)[1] for path, in conn.execute("SELECT path FROM import_manifest"))
+        return names, manifest
+    finally:
+        conn.close()
+
+@pytest.mark.parametrize("workers", [1, 2, 3])
+def test_file_with_parse_error_is_rolled_back(data_dir, tmp_path, workers):
+    db_path = str(tmp_path / "csgo_items.db")
+    result = db_setup.import_data(str(data_dir), db_path, batch_size=2, workers=workers)
+    
+    assert result["files"] == 3 and result["rows"] == 21
+    names, manifest = imported(db_path)
+    assert names == {"a", "c", "d"}
+    assert manifest == ["20261001.json", "20261003.json", "20261004.json"]
+
+def test_parallel_write_error_rolls_back_only_that_file(data_dir, tmp_path, monkeypatch):
+    write_file(data_dir / "categories" / "Rifle_20261002.json", [f"b{i}" for i in range(7)])
+    write_rows = db_setup._write_rows
+    calls = []
+    
+    def failing_write_rows(cursor, rows, mode, batch_size, snapshot_time):
+        if snapshot_time.startswith("2026-10-03"):
+            calls.append(len(rows))
+            if len(calls) == 2:
+                raise sqlite3.OperationalError("disk I/O error")
+        return write_rows(cursor, rows, mode, batch_size, snapshot_time)
+    
+    monkeypatch.setattr(db_setup, "_write_rows", failing_write_rows)
+    db_path = str(tmp_path / "csgo_items.db")
+    result = db_setup.import_data(str(data_dir), db_path, batch_size=2, workers=2)
+    
+    assert result["files"] == 3
+    names, manifest = imported(db_path)
+    assert names == {"a", "b", "d"}
+    assert manifest == ["20261001.json", "20261002.json", "20261004.json"]
+
+def test_reimport_replaces_placeholder_category(tmp_path):
+    legacy = tmp_path / "legacy" / "categories"
+    legacy.mkdir(parents=True)
+    # 旧版导入使用父目录名作为类别
+    write_file(legacy / "items.json", ["a0", "a1"])
+    db_path = str(tmp_path / "csgo_items.db")
+    db_setup.import_data(str(legacy.parent), db_path)
+    
+    data = tmp_path / "data" / "categories"
+    data.mkdir(parents=True)
+    write_file(data / "Rifle_20991231.json", ["a0"])
+    db_setup.import_data(str(data.parent), db_path)
+    
+    conn = sqlite3.connect(db_path)
+    categories = dict(conn.execute("SELECT market_hash_name, category FROM csgo_items").fetchall())
+    conn.close()
+    assert categories == {"a0": "Rifle", "a1": "categories"}
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 16])
+def test_iter_items_across_chunk_boundaries(tmp_path, chunk_size):
+    items = [{"name": "AK-47 | 红线 ]},\"[", "tags": [{"a": [1, 2]}, {}], "price": 1.5}, [], "", 0, None,
+             {"name": "M4A4", "nested": {"x": "\\u00e9"}}]
+    path = tmp_path / "items.json"
+    path.write_text("  \n" + json.dumps(items, ensure_ascii=False, indent=1), encoding="utf-8")
+    assert list(db_setup.iter_items(path, chunk_size)) == items
+
+def test_iter_items_documents(tmp_path):
+    path = tmp_path / "render.json"
+    path.write_text(json.dumps({"success": True, "results": [{"name": "a"}]}), encoding="utf-8")
+    assert list(db_setup.iter_items(path, 4)) == [{"name": "a"}]
+    
+    path.write_text('[{"name": "a"}, {"name": "b"', encoding="utf-8")
+    with pytest.raises(ValueError):
+        list(db_setup.iter_items(path, 4))
+
+@pytest.mark.parametrize("make_dir", [False, True])
+def test_empty_data_dir_returns_zero_stats_and_closes(tmp_path, monkeypatch, make_dir):
+    connections = []
+    
+    class TrackedConnection(sqlite3.Connection):
+        closed = False
+        
+        def close(self):
+            self.closed = True
+            super().close()
+    
+    def create_database(db_path):
+        connections.append(sqlite3.connect(db_path, factory=TrackedConnection))
+        return db_setup.migrate(connections[-1])
+    
+    monkeypatch.setattr(db_setup, "create_database", create_database)
+    if make_dir:
+        (tmp_path / "data").mkdir()
+    stats = db_setup.import_data(str(tmp_path / "data"), str(tmp_path / "csgo_items.db"))
+    assert stats == {"files": 0, "rows": 0, "items": 0, "seconds": 0.0}
+    assert [conn.closed for conn in connections] == [True]
@@ -0,0 +1,21 @@
+import argparse
+import urllib.request
+
+from metrics import MetricsServer, Registry, add_arguments
+
+def test_metrics_server_listens_on_localhost_by_default():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    assert parser.parse_args([]).metrics_host == "127.0.0.1"
+    assert parser.parse_args(["--metrics-host", "0.0.0.0"]).metrics_host == "0.0.0.0"
+    
+    registry = Registry()
+    registry.counter("pages_total", "页数", ("result",)).inc(3, result="ok")
+    server = MetricsServer(0, registry=registry).start()
+    try:
+        assert server.server.server_address[0] == "127.0.0.1"
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=5) as response:
+            text = response.read().decode("utf-8")
+        assert 'pages_total{result="ok"} 3' in text
+    finally:
+        server.close()
@@ -0,0 +1,33 @@
+import sqlite3
+
+import db_setup
+
+def test_old_database_is_upgraded_in_place(tmp_path):
+    path = str(tmp_path / "csgo_items.db")
+    conn = sqlite3.connect(path)
+    version, statements = db_setup.MIGRATIONS[0]
+    for statement in statements:
+        conn.execute(statement)
+    conn.execute(f"PRAGMA user_version = {version}")
+    conn.execute("INSERT INTO csgo_items (name, market_hash_name, price) VALUES ('AK-47 | Redline', 'AK-47 | Redline', 10.0)")
+    conn.execute("INSERT INTO price_history (item_id, price, volume, timestamp) VALUES (1, 10.0, 3, '2026-10-02 10:30:00')")
+    conn.commit()
+    conn.close()
+    
+    conn = db_setup.create_database(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == db_setup.MIGRATIONS[-1][0]
+    # 已有数据补建全文索引和汇总
+    assert conn.execute("SELECT rowid FROM csgo_items_fts WHERE csgo_items_fts MATCH 'redline'").fetchall() == [(1,)]
+    assert conn.execute("SELECT resolution, close, points FROM price_rollups ORDER BY resolution").fetchall() == [
+        ("day", 10.0, 1), ("hour", 10.0, 1), ("week", 10.0, 1)]
+    # 再次打开不重复执行迁移
+    db_setup.migrate(conn)
+    conn.close()
+
+def test_query_plans_use_indexes(tmp_path):
+    path = str(tmp_path / "csgo_items.db")
+    db_setup.create_database(path).close()
+    assert db_setup.check_query_plans(path)
+    assert not db_setup.check_query_plans(path, {"by_volume": "SELECT id FROM csgo_items WHERE volume > 10"})
+    assert db_setup.check_query_plans(path, {"by_volume": "SELECT id FROM csgo_items WHERE volume > 10"},
+                                      allowed_scans={"by_volume"})
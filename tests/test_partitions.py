@@ -0,0 +1,116 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from db_setup import bump_generation, create_database, refresh_rollups, write_price_history
+from partitions import archive_boundary_timestamp, compact_partitions, list_partitions
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "csgo_items.db")
+    conn = create_database(path)
+    with conn:
+        conn.execute("INSERT INTO csgo_items (name, market_hash_name, price) VALUES ('AK', 'AK', 1.0)")
+    conn.close()
+    return path
+
+def write(path, rows):
+    conn = create_database(path)
+    with conn:
+        write_price_history(conn, [(1, price, volume, timestamp) for timestamp, price, volume in rows])
+        refresh_rollups(conn)
+        bump_generation(conn)
+    conn.close()
+
+def week_rollup(path, bucket):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('''
+        SELECT open, high, low, close, volume, points FROM price_rollups
+        WHERE item_id = 1 AND resolution = 'week' AND bucket = ?
+        ''', (bucket,)).fetchone()
+    finally:
+        conn.close()
+
+def test_boundary_is_week_aligned_and_spanning_week_keeps_archived_points(db_path):
+    write(db_path, [("2026-07-10 00:00:00", 5.0, 1), ("2026-07-28 00:00:00", 10.0, 5),
+                    ("2026-08-02 00:00:00", 20.0, 3)])
+    result = compact_partitions(db_path, keep_months=3, now=datetime(2026, 10, 17))
+    
+    # 2026-08-01 是周六，边界退到所在周的周一，07-28 的价格点留在主库
+    assert result["archived"] == {"2026-07": 1}
+    conn = sqlite3.connect(db_path)
+    assert archive_boundary_timestamp(conn) == "2026-07-27 00:00:00"
+    assert conn.execute("SELECT MIN(timestamp) FROM price_history").fetchone()[0] == "2026-07-28 00:00:00"
+    conn.close()
+    
+    write(db_path, [("2026-08-02 18:00:00", 30.0, 5)])
+    assert week_rollup(db_path, "2026-07-27 00:00:00") == (10.0, 30.0, 10.0, 30.0, 13, 3)
+
+def test_points_before_boundary_do_not_rebuild_finalized_buckets(db_path):
+    write(db_path, [("2026-07-06 00:00:00", 5.0, 1), ("2026-07-07 00:00:00", 6.0, 2)])
+    before = week_rollup(db_path, "2026-07-06 00:00:00")
+    compact_partitions(db_path, keep_months=3, now=datetime(2026, 10, 17))
+    
+    write(db_path, [("2026-07-08 00:00:00", 100.0, 9)])
+    assert week_rollup(db_path, "2026-07-06 00:00:00") == before == (5.0, 6.0, 5.0, 6.0, 3, 2)
+
+def test_partial_month_is_completed_on_next_run(db_path, tmp_path):
+    write(db_path, [("2026-07-20 00:00:00", 1.0, 1), ("2026-07-30 00:00:00", 2.0, 1)])
+    compact_partitions(db_path, keep_months=3, now=datetime(2026, 10, 17))
+    result = compact_partitions(db_path, keep_months=3, now=datetime(2026, 11, 17))
+    
+    assert result["archived"] == {"2026-07": 1}
+    partitions = list_partitions(str(tmp_path / "csgo_items_archive"))
+    assert [(year, month) for year, month, _ in partitions] == [(2026, 7)]
+    archive = sqlite3.connect(partitions[0][2])
+    assert archive.execute("SELECT COUNT(*) FROM price_history").fetchone()[0] == 2
+    archive.close()
+
+def generation(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT value FROM db_meta WHERE key = 'generation'").fetchone()[0]
+    finally:
+        conn.close()
+
+def test_compaction_and_drop_invalidate_cached_history(db_path):
+    from db_query import CSGODatabase
+    
+    write(db_path, [("2026-03-10 00:00:00", 1.0, 1), ("2026-07-10 00:00:00", 2.0, 1), ("2026-10-10 00:00:00", 3.0, 1)])
+    db = CSGODatabase(db_path)
+    assert len(db.get_item_price_history(1)) == 3
+    
+    before = generation(db_path)
+    compact_partitions(db_path, keep_months=3, now=datetime(2026, 10, 17))
+    assert generation(db_path) == before + 2
+    assert list(db.get_item_price_history(1)["price"]) == [1.0, 2.0, 3.0]
+    
+    compact_partitions(db_path, keep_months=3, now=datetime(2026, 10, 17), drop_after_months=6)
+    assert generation(db_path) == before + 3
+    assert list(db.get_item_price_history(1)["price"]) == [2.0, 3.0]
+    db.close()
+
+def test_export_after_compaction_is_a_snapshot_of_the_retention_window(db_path, tmp_path):
+    from exporter import open_export, run_export
+    
+    export_dir = str(tmp_path / "export")
+    write(db_path, [("2026-03-10 00:00:00", 1.0, 1), ("2026-10-10 00:00:00", 3.0, 1)])
+    assert run_export(db_path, export_dir)["kind"] == "snapshot"
+    
+    compact_partitions(db_path, keep_months=3, now=datetime(2026, 10, 17))
+    assert run_export(db_path, export_dir)["kind"] == "snapshot"
+    _, snapshot, deltas = open_export(export_dir)
+    assert list(snapshot["price_history"]["price"]) == [3.0] and deltas == []
+    
+    compact_partitions(db_path, keep_months=3, now=datetime(2026, 10, 17), drop_after_months=6)
+    assert run_export(db_path, export_dir)["kind"] is None
+
+def test_archived_history_with_special_characters_in_path(db_path, tmp_path):
+    from partitions import iter_archived_history
+    
+    archive_dir = str(tmp_path / "归档 ?#%25")
+    write(db_path, [("2026-03-10 00:00:00", 1.0, 1)])
+    compact_partitions(db_path, keep_months=3, archive_dir=archive_dir, now=datetime(2026, 10, 17))
+    assert [price for price, _, _ in iter_archived_history(archive_dir, 1)] == [1.0]
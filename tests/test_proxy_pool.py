@@ -0,0 +1,43 @@
+from collector import ProxyPool
+
+GOOD = {"http": "http://10.0.0.1:8080", "https": "http://10.0.0.1:8080"}
+BAD = {"http": "http://10.0.0.2:8080", "https": "http://10.0.0.2:8080"}
+
+def make_pool(**kwargs):
+    # min_proxies=0：后台线程不去网上获取代理
+    return ProxyPool(min_proxies=0, proxies=[GOOD, BAD], quarantine_base=600, quarantine_max=3600, **kwargs)
+
+def test_consecutive_failures_quarantine_with_growing_duration():
+    pool = make_pool(max_consecutive_failures=3, max_quarantines=2)
+    try:
+        pool.report_failure(BAD, "429")
+        pool.report_failure(BAD, "ssl")
+        pool.report_success(BAD, 0.2)
+        pool.report_failure(BAD, "error")
+        pool.report_failure(BAD, "error")
+        assert pool.active_count() == 2
+        pool.report_failure(BAD, "error")
+        assert pool.active_count() == 1
+        assert {pool.get_proxy()["http"] for _ in range(50)} == {GOOD["http"]}
+        
+        stats = pool.stats[BAD["https"]]
+        first = stats.quarantined_until
+        pool._quarantine(stats, 0.0)
+        assert stats.quarantined_until == 1200.0 and first > 0
+        # 隔离次数达到上限后移除
+        pool._quarantine(stats, 0.0)
+        assert BAD["https"] not in pool.stats and pool.proxies == [GOOD]
+    finally:
+        pool.close()
+
+def test_recent_errors_lower_the_score():
+    pool = make_pool(max_consecutive_failures=10, max_recent_errors=10)
+    try:
+        pool.report_success(GOOD, 0.1)
+        pool.report_success(BAD, 0.1)
+        pool.report_failure(BAD, "429")
+        pool.report_success(BAD, 0.1)
+        scores = {entry["proxy"]: entry["score"] for entry in pool.snapshot()}
+        assert scores[GOOD["https"]] > 2 * scores[BAD["https"]]
+    finally:
+        pool.close()
@@ -0,0 +1,49 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from db_setup import create_database
+from query_service import QueryServer, QueryService, ReadPool
+
+@pytest.fixture
+def service(tmp_path):
+    path = str(tmp_path / "csgo_items.db")
+    conn = create_database(path)
+    with conn:
+        conn.executemany("INSERT INTO csgo_items (name, market_hash_name, category, price) VALUES (?, ?, ?, ?)",
+                         [(f"item {i}", f"item {i}", "Rifle" if i % 2 else "Knife", price)
+                          for i, price in enumerate([5.0, None, 3.0, 5.0, None, 1.0, 3.0, 5.0, None])])
+    conn.close()
+    pool = ReadPool(path, size=2)
+    yield QueryService(pool)
+    pool.close()
+
+def walk(service, category, limit):
+    names, after = [], None
+    while True:
+        page = service.items(category, limit, after)
+        assert len(page["items"]) <= limit
+        names += [item["name"] for item in page["items"]]
+        after = page["next"]
+        if after is None:
+            return names
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7, 100])
+def test_keyset_pages_cover_every_item_once(service, limit):
+    # 价格从高到低，相同价格按ID，没有价格的物品在最后
+    assert walk(service, None, limit) == [f"item {i}" for i in (0, 3, 7, 2, 6, 5, 1, 4, 8)]
+    assert walk(service, "Rifle", limit) == [f"item {i}" for i in (3, 7, 5, 1)]
+
+def test_invalid_cursor_is_a_bad_request(service):
+    server = QueryServer(service, port=0).start()
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"http://127.0.0.1:{server.port}/items?after=bm9wZQ", timeout=5)
+        assert error.value.code == 400
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/items?limit=4", timeout=5) as response:
+            page = json.load(response)
+        assert len(page["items"]) == 4 and page["next"]
+    finally:
+        server.close()
@@ -0,0 +1,38 @@
+import pytest
+
+from rate_limiter import RateLimiter, TokenBucket, parse_retry_after, proxy_key
+
+def test_bucket_spaces_requests_at_the_rate():
+    bucket = TokenBucket(rate=2.0, max_rate=4.0)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.5, abs=0.01)
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.01)
+
+def test_aimd_rate_adjustment():
+    bucket = TokenBucket(rate=1.0, max_rate=1.05, increase=0.02, decrease=0.5, min_rate=0.3)
+    for _ in range(5):
+        bucket.on_success()
+    assert bucket.rate == 1.05
+    bucket.on_throttle()
+    assert bucket.rate == pytest.approx(0.525)
+    bucket.on_throttle()
+    assert bucket.rate == 0.3
+
+def test_throttle_pauses_for_retry_after():
+    bucket = TokenBucket(rate=10.0, max_rate=10.0)
+    bucket.on_throttle(retry_after=5.0)
+    assert bucket.reserve() == pytest.approx(5.0 + 1 / 5.0, abs=0.05)
+
+def test_parse_retry_after():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+def test_limiter_keeps_one_bucket_per_proxy_and_endpoint():
+    limiter = RateLimiter({"search": (1.0, 2.0)})
+    proxy = {"https": "http://10.0.0.1:8080"}
+    assert limiter.bucket("search", proxy) is limiter.bucket("search", "http://10.0.0.1:8080")
+    assert limiter.bucket("search") is not limiter.bucket("search", proxy)
+    assert limiter.bucket("search").rate == 1.0
+    assert proxy_key(None) == "direct"
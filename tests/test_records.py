@@ -0,0 +1,42 @@
+import io
+import json
+
+from records import ItemRecord, StringTable, encode_lines, iter_jsonl_items, iter_jsonl_records
+
+def result(name, item_type="Rifle", rarity="Covert", hash_name=None):
+    return {"name": name, "hash_name": hash_name or name, "sell_price": 1234, "sell_listings": 5, "rarity": rarity,
+            "asset_description": {"type": item_type, "icon_url": "icon", "market_hash_name": hash_name or name}}
+
+def test_round_trip_through_jsonl():
+    # 与 CrawlPlanner 和 CategoryCheckpoint 一样，收集和写入各用一个字符串表
+    interned, written = StringTable(), StringTable()
+    first = [ItemRecord.from_result(result("AK-47"), interned), ItemRecord.from_result(result("M4A4"), interned)]
+    second = [ItemRecord.from_result(result("Case", "Container", "Base Grade", hash_name="Case 2"), interned)]
+    lines = encode_lines(first, written) + encode_lines(second, written)
+    
+    # 每批只写出新出现的字符串，name 与 market_hash_name 相同时不重复写
+    assert [json.loads(line) for line in lines] == [
+        {"strings": ["Rifle", "Covert"]},
+        ["AK-47", None, 0, 1, "icon", 1234, 5],
+        ["M4A4", None, 0, 1, "icon", 1234, 5],
+        {"strings": ["Container", "Base Grade"]},
+        ["Case", "Case 2", 2, 3, "icon", 1234, 5],
+    ]
+    records = list(iter_jsonl_records(io.StringIO("\n".join(lines) + "\n\n")))
+    assert [(r.name, r.market_hash_name, r.item_type, r.rarity, r.price, r.volume) for r in records] == [
+        ("AK-47", "AK-47", "Rifle", "Covert", 1234, 5),
+        ("M4A4", "M4A4", "Rifle", "Covert", 1234, 5),
+        ("Case", "Case 2", "Container", "Base Grade", 1234, 5),
+    ]
+    # 重复的字符串共享同一个对象
+    assert records[0].item_type is records[1].item_type
+
+def test_legacy_raw_results_are_converted():
+    lines = [json.dumps(result("AK-47")), json.dumps(["M4A4", None, 0, 0, "", 100, 1])]
+    lines.insert(1, json.dumps({"strings": ["Rifle"]}))
+    assert [record.name for record in iter_jsonl_records(lines)] == ["AK-47", "M4A4"]
+    assert list(iter_jsonl_items(lines)) == [
+        result("AK-47"),
+        {"name": "M4A4", "market_hash_name": "M4A4", "type": "Rifle", "rarity": "Rifle", "icon_url": "",
+         "price": 1.0, "volume": 1},
+    ]
@@ -0,0 +1,24 @@
+from db_setup import create_database, refresh_rollups, write_price_history
+
+def test_upsert_into_dirty_hour_refreshes_rollup(tmp_path):
+    conn = create_database(str(tmp_path / "csgo_items.db"))
+    with conn:
+        conn.execute("INSERT INTO csgo_items (name, market_hash_name, price) VALUES ('AK', 'AK', 1.0)")
+        write_price_history(conn, [(1, 1.0, 1, "2026-10-02 10:30:00")])
+        refresh_rollups(conn)
+    
+    # 新行和原地更新的行在同一小时
+    with conn:
+        write_price_history(conn, [(1, 2.0, 1, "2026-10-02 10:00:00"), (1, 3.0, 2, "2026-10-02 10:30:00")])
+        refresh_rollups(conn)
+    
+    rows = conn.execute(
+        "SELECT resolution, open, high, low, close, volume, points FROM price_rollups ORDER BY resolution"
+    ).fetchall()
+    assert rows == [("day", 2.0, 3.0, 2.0, 3.0, 3, 2), ("hour", 2.0, 3.0, 2.0, 3.0, 3, 2), ("week", 2.0, 3.0, 2.0, 3.0, 3, 2)]
+
+def test_migration_replaces_old_rollup_triggers(tmp_path):
+    conn = create_database(str(tmp_path / "csgo_items.db"))
+    triggers = dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%rollup%'"))
+    assert len(triggers) == 2
+    assert all("ON CONFLICT DO NOTHING" in sql for sql in triggers.values())
@@ -0,0 +1,53 @@
+import sqlite3
+
+import pytest
+import requests
+
+from work_queue import QueueClient, QueueServer, WorkQueue
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / "work_queue.db"))
+    yield queue
+    queue.close()
+
+def serve(queue, token=None):
+    return QueueServer(queue, port=0, token=token).start()
+
+def test_server_listens_on_localhost_by_default(queue):
+    server = serve(queue)
+    try:
+        assert server.server.server_address[0] == "127.0.0.1"
+        assert QueueClient(f"http://127.0.0.1:{server.port}").lease("w1") == []
+    finally:
+        server.close()
+
+def test_token_is_required_when_configured(queue):
+    server = serve(queue, token="s3cret")
+    url = f"http://127.0.0.1:{server.port}"
+    try:
+        for client in (QueueClient(url), QueueClient(url, token="wrong")):
+            with pytest.raises(requests.HTTPError) as error:
+                client.complete("w1", 1, {"results": []})
+            assert error.value.response.status_code == 401
+            with pytest.raises(requests.HTTPError):
+                client.stats()
+        assert QueueClient(url, token="s3cret").lease("w1") == []
+    finally:
+        server.close()
+
+def test_database_errors_return_503(queue, monkeypatch):
+    def locked(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+    
+    monkeypatch.setattr(queue, "lease", locked)
+    monkeypatch.setattr(queue, "stats", locked)
+    server = serve(queue)
+    client = QueueClient(f"http://127.0.0.1:{server.port}")
+    try:
+        for call in (lambda: client.lease("w1"), client.stats):
+            with pytest.raises(requests.HTTPError) as error:
+                call()
+            assert error.value.response.status_code == 503
+    finally:
+        server.close()
@@ -0,0 +1,629 @@
+import argparse
+import concurrent.futures
+import hmac
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from crawl_planner import CrawlPlanner
+from metrics import REGISTRY, add_arguments, close_exporters, configure_logging, start_exporters
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_PATH = "data/work_queue.db"
+
+# 队列接口的共享口令，协调进程和远程工作进程从该环境变量读取
+TOKEN_ENV = "WORK_QUEUE_TOKEN"
+
+TASK_EVENTS = REGISTRY.counter("work_queue_tasks_total",
+                               "工作队列任务事件（enqueued、leased、completed、retried、failed、expired）",
+                               ("kind", "event"))
+WORKER_TASKS = REGISTRY.counter("worker_tasks_total", "工作进程执行的任务数（ok、failed、lost）", ("kind", "result"))
+
+class WorkQueue:
+    """SQLite持久化的任务队列，任务以租约方式分配给工作进程
+    
+    工作进程用 lease() 取得任务，在可见性超时内用 heartbeat() 续约，完成后调用 complete()，
+    失败时调用 fail() 按指数退避重新排队。工作进程被杀死后租约过期，任务会被重新分配。
+    完成或放弃的任务由协调进程通过 results() 读取、处理后 ack()。
+    """
+    
+    def __init__(self, path=DEFAULT_QUEUE_PATH, visibility_timeout=60, max_attempts=5, retry_delay=5.0):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL UNIQUE,
+            payload TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at REAL NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_expires REAL,
+            result TEXT,
+            error TEXT,
+            acked INTEGER NOT NULL DEFAULT 0,
+            updated REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_tasks_pending ON tasks (state, available_at);
+        CREATE INDEX IF NOT EXISTS idx_tasks_results ON tasks (kind, acked, state);
+        CREATE TABLE IF NOT EXISTS queue_meta (
+            name TEXT PRIMARY KEY,
+            value TEXT
+        );
+        ''')
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+    
+    def _transaction(self):
+        # 多个进程可能同时打开同一个队列文件，BEGIN IMMEDIATE 保证租约分配不会冲突
+        self.conn.execute("BEGIN IMMEDIATE")
+    
+    def enqueue(self, tasks):
+        """添加任务 [(kind, key, payload), ...]；同一 key 的任务只有在已处理（ack）后才会重新排队"""
+        now = time.time()
+        added = 0
+        with self.lock:
+            self._transaction()
+            try:
+                for kind, key, payload in tasks:
+                    cursor = self.conn.execute('''
+                    INSERT INTO tasks (kind, key, payload, updated) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET
+                        payload = excluded.payload, state = 'pending', attempts = 0, available_at = 0,
+                        lease_owner = NULL, lease_expires = NULL, result = NULL, error = NULL,
+                        acked = 0, updated = excluded.updated
+                    WHERE tasks.acked = 1
+                    ''', (kind, key, json.dumps(payload, ensure_ascii=False), now))
+                    if cursor.rowcount:
+                        added += 1
+                        TASK_EVENTS.inc(kind=kind, event="enqueued")
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return added
+    
+    def _expire_leases(self, now):
+        """收回过期的租约：未超过最大尝试次数的重新排队，否则标记为失败"""
+        expired = self.conn.execute('''
+        SELECT id, kind, attempts, lease_owner FROM tasks WHERE state = 'leased' AND lease_expires < ?
+        ''', (now,)).fetchall()
+        for task_id, kind, attempts, owner in expired:
+            state = "failed" if attempts >= self.max_attempts else "pending"
+            self.conn.execute('''
+            UPDATE tasks SET state = ?, lease_owner = NULL, lease_expires = NULL,
+                error = ?, updated = ? WHERE id = ?
+            ''', (state, f"租约过期（{owner}）", now, task_id))
+            TASK_EVENTS.inc(kind=kind, event="expired")
+            logger.warning(f"任务 {task_id} 的租约已过期（{owner}），{'放弃' if state == 'failed' else '重新排队'}")
+    
+    def lease(self, owner, limit=10, visibility_timeout=None):
+        """为工作进程分配最多 limit 个任务，返回 [{id, kind, payload, attempts}, ...]"""
+        visibility_timeout = visibility_timeout or self.visibility_timeout
+        now = time.time()
+        with self.lock:
+            self._transaction()
+            try:
+                self._expire_leases(now)
+                rows = self.conn.execute('''
+                SELECT id, kind, payload, attempts FROM tasks
+                WHERE state = 'pending' AND available_at <= ?
+                ORDER BY id LIMIT ?
+                ''', (now, limit)).fetchall()
+                self.conn.executemany('''
+                UPDATE tasks SET state = 'leased', lease_owner = ?, lease_expires = ?,
+                    attempts = attempts + 1, updated = ? WHERE id = ?
+                ''', [(owner, now + visibility_timeout, now, row[0]) for row in rows])
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        tasks = []
+        for task_id, kind, payload, attempts in rows:
+            TASK_EVENTS.inc(kind=kind, event="leased")
+            tasks.append({"id": task_id, "kind": kind, "payload": json.loads(payload), "attempts": attempts + 1})
+        return tasks
+    
+    def heartbeat(self, owner, task_ids, visibility_timeout=None):
+        """延长工作进程持有的租约，返回仍然有效的任务ID（已被收回的任务不在其中）"""
+        visibility_timeout = visibility_timeout or self.visibility_timeout
+        now = time.time()
+        alive = []
+        with self.lock:
+            for task_id in task_ids:
+                cursor = self.conn.execute('''
+                UPDATE tasks SET lease_expires = ?, updated = ?
+                WHERE id = ? AND state = 'leased' AND lease_owner = ?
+                ''', (now + visibility_timeout, now, task_id, owner))
+                if cursor.rowcount:
+                    alive.append(task_id)
+        return alive
+    
+    def complete(self, owner, task_id, result):
+        """提交任务结果；租约已被收回时返回False，结果被丢弃"""
+        with self.lock:
+            cursor = self.conn.execute('''
+            UPDATE tasks SET state = 'done', result = ?, error = NULL, lease_owner = NULL,
+                lease_expires = NULL, updated = ?
+            WHERE id = ? AND state = 'leased' AND lease_owner = ?
+            ''', (json.dumps(result, ensure_ascii=False), time.time(), task_id, owner))
+            row = self.conn.execute("SELECT kind FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        if cursor.rowcount and row:
+            TASK_EVENTS.inc(kind=row[0], event="completed")
+        return bool(cursor.rowcount)
+    
+    def fail(self, owner, task_id, error):
+        """任务失败：未超过最大尝试次数时按指数退避重新排队，否则标记为失败"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute('''
+            SELECT kind, attempts FROM tasks WHERE id = ? AND state = 'leased' AND lease_owner = ?
+            ''', (task_id, owner)).fetchone()
+            if row is None:
+                return False
+            kind, attempts = row
+            if attempts >= self.max_attempts:
+                state, available_at, event = "failed", 0, "failed"
+            else:
+                state, available_at, event = "pending", now + self.retry_delay * 2 ** (attempts - 1), "retried"
+            self.conn.execute('''
+            UPDATE tasks SET state = ?, available_at = ?, error = ?, lease_owner = NULL,
+                lease_expires = NULL, updated = ?
+            WHERE id = ? AND state = 'leased' AND lease_owner = ?
+            ''', (state, available_at, str(error), now, task_id, owner))
+        TASK_EVENTS.inc(kind=kind, event=event)
+        return True
+    
+    def results(self, kind, limit=500):
+        """读取尚未处理的已完成或已放弃的任务"""
+        with self.lock:
+            rows = self.conn.execute('''
+            SELECT id, payload, state, result, error FROM tasks
+            WHERE kind = ? AND acked = 0 AND state IN ('done', 'failed')
+            ORDER BY id LIMIT ?
+            ''', (kind, limit)).fetchall()
+        return [{"id": task_id, "payload": json.loads(payload), "state": state,
+                 "result": json.loads(result) if result is not None else None, "error": error}
+                for task_id, payload, state, result, error in rows]
+    
+    def ack(self, task_ids):
+        """标记结果已处理，并释放结果占用的空间"""
+        with self.lock:
+            self.conn.executemany("UPDATE tasks SET acked = 1, result = NULL WHERE id = ?",
+                                  [(task_id,) for task_id in task_ids])
+    
+    def set_closed(self, closed):
+        """协调进程结束时关闭队列，空闲的工作进程随后退出"""
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO queue_meta (name, value) VALUES ('closed', ?)",
+                              ("1" if closed else "0",))
+    
+    def stats(self):
+        """各状态的任务数，以及队列是否已关闭"""
+        with self.lock:
+            rows = self.conn.execute('''
+            SELECT kind, state, COUNT(*) FROM tasks WHERE acked = 0 GROUP BY kind, state
+            ''').fetchall()
+            closed = self.conn.execute("SELECT value FROM queue_meta WHERE name = 'closed'").fetchone()
+        stats = {"closed": bool(closed and closed[0] == "1"), "tasks": {}}
+        for kind, state, count in rows:
+            stats["tasks"].setdefault(kind, {})[state] = count
+        return stats
+
+class QueueHandler(BaseHTTPRequestHandler):
+    """把 WorkQueue 的租约接口暴露为JSON HTTP接口，供其他机器上的工作进程使用"""
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _authorized(self):
+        """设置了口令时要求 Authorization: Bearer <口令>，否则返回401"""
+        token = self.server.token
+        if not token:
+            return True
+        header = self.headers.get("Authorization", "")
+        if hmac.compare_digest(header.encode("utf-8"), f"Bearer {token}".encode("utf-8")):
+            return True
+        self._send_json(401, {"error": "未授权"})
+        return False
+    
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path.split("?")[0] != "/stats":
+            self.send_error(404)
+            return
+        try:
+            data = self.server.queue.stats()
+        except sqlite3.Error as e:
+            logger.error(f"读取队列状态时出错: {e}")
+            self._send_json(503, {"error": str(e)})
+            return
+        self._send_json(200, data)
+    
+    def do_POST(self):
+        if not self._authorized():
+            return
+        queue = self.server.queue
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            path = self.path.split("?")[0]
+            if path == "/lease":
+                data = queue.lease(request["owner"], request.get("limit", 10), request.get("visibility_timeout"))
+            elif path == "/heartbeat":
+                data = queue.heartbeat(request["owner"], request["task_ids"], request.get("visibility_timeout"))
+            elif path == "/complete":
+                data = queue.complete(request["owner"], request["task_id"], request["result"])
+            elif path == "/fail":
+                data = queue.fail(request["owner"], request["task_id"], request.get("error", ""))
+            else:
+                self.send_error(404)
+                return
+        except (KeyError, ValueError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except sqlite3.Error as e:
+            # 例如队列数据库被锁定：返回503，工作进程稍后重试
+            logger.error(f"处理 {self.path} 时出错: {e}")
+            self._send_json(503, {"error": str(e)})
+            return
+        self._send_json(200, data)
+
+class QueueServer:
+    """在后台线程中提供工作队列的HTTP接口
+    
+    默认只监听本机；为其他机器提供接口时监听 0.0.0.0 并设置 token，请求需带上相同的口令。
+    """
+    
+    def __init__(self, queue, port=8780, host="127.0.0.1", token=None):
+        self.server = ThreadingHTTPServer((host, port), QueueHandler)
+        self.server.daemon_threads = True
+        self.server.queue = queue
+        self.server.token = token
+        self._thread = threading.Thread(target=self.server.serve_forever, name="queue-server", daemon=True)
+    
+    @property
+    def port(self):
+        return self.server.server_port
+    
+    def start(self):
+        self._thread.start()
+        return self
+    
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class QueueClient:
+    """通过HTTP访问远程工作队列，接口与 WorkQueue 的工作进程部分一致"""
+    
+    def __init__(self, url, timeout=30, token=None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+    
+    def close(self):
+        self.session.close()
+    
+    def _post(self, path, data):
+        response = self.session.post(f"{self.url}{path}", json=data, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+    
+    def lease(self, owner, limit=10, visibility_timeout=None):
+        return self._post("/lease", {"owner": owner, "limit": limit, "visibility_timeout": visibility_timeout})
+    
+    def heartbeat(self, owner, task_ids, visibility_timeout=None):
+        return self._post("/heartbeat", {"owner": owner, "task_ids": task_ids,
+                                         "visibility_timeout": visibility_timeout})
+    
+    def complete(self, owner, task_id, result):
+        return self._post("/complete", {"owner": owner, "task_id": task_id, "result": result})
+    
+    def fail(self, owner, task_id, error):
+        return self._post("/fail", {"owner": owner, "task_id": task_id, "error": str(error)})
+    
+    def stats(self):
+        response = self.session.get(f"{self.url}/stats", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+def open_queue(location, token=None):
+    """http(s):// 开头时连接远程队列（口令默认读取环境变量 WORK_QUEUE_TOKEN），否则直接打开本地SQLite队列文件"""
+    if location.startswith(("http://", "https://")):
+        return QueueClient(location, token=token or os.environ.get(TOKEN_ENV))
+    return WorkQueue(location)
+
+class TaskFailed(Exception):
+    pass
+
+class QueueWorker:
+    """从工作队列领取搜索页和价格历史任务并用收集器执行
+    
+    每个工作进程有自己的收集器（限速器、代理池、连接池）；后台线程定期为持有的任务续约，
+    进程被杀死后租约过期，任务由其他工作进程接手。
+    """
+    
+    def __init__(self, queue, collector, worker_id=None, threads=4, visibility_timeout=60, poll_interval=1.0):
+        self.queue = queue
+        self.collector = collector
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.threads = threads
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.leased = set()
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+    
+    def execute(self, task):
+        """执行一个任务，返回要提交给队列的结果"""
+        payload = task["payload"]
+        appid = payload.get("appid", 730)
+        if task["kind"] == "search":
+            result = self.collector.search_items(appid, category=payload["category"], start=payload["start"],
+                                                 count=payload["count"])
+            if not result.get("success", False):
+                raise TaskFailed(f"{payload['category']} 起始索引 {payload['start']} 请求失败")
+            return result
+        if task["kind"] == "pricehistory":
+            result = self.collector.get_item_price_history(appid, payload["market_hash_name"])
+            if result is None:
+                raise TaskFailed(f"{payload['market_hash_name']} 价格历史请求失败")
+            return result
+        raise TaskFailed(f"未知任务类型 {task['kind']}")
+    
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.visibility_timeout / 3):
+            with self.lock:
+                task_ids = list(self.leased)
+            if not task_ids:
+                continue
+            try:
+                alive = set(self.queue.heartbeat(self.worker_id, task_ids, self.visibility_timeout))
+            except Exception as e:
+                logger.warning(f"续约失败: {e}")
+                continue
+            lost = set(task_ids) - alive
+            if lost:
+                logger.warning(f"{len(lost)} 个任务的租约已被收回，结果将被丢弃")
+    
+    def _finish(self, task, future):
+        kind = task["kind"]
+        try:
+            result = future.result()
+        except Exception as e:
+            WORKER_TASKS.inc(kind=kind, result="failed")
+            self._report(self.queue.fail, task, e)
+            return
+        if self._report(self.queue.complete, task, result):
+            WORKER_TASKS.inc(kind=kind, result="ok")
+        else:
+            WORKER_TASKS.inc(kind=kind, result="lost")
+    
+    def _report(self, method, task, value):
+        """提交任务结果；队列暂时不可用（例如返回503）时放弃，租约过期后任务重新分配"""
+        try:
+            return method(self.worker_id, task["id"], value)
+        except Exception as e:
+            logger.warning(f"提交任务 {task['id']} 的结果时出错: {e}，任务将在租约过期后重新分配")
+            return False
+    
+    def run(self, exit_when_idle=True):
+        """领取并执行任务；exit_when_idle 时在队列关闭且没有待处理任务后退出，返回完成的任务数"""
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="queue-heartbeat", daemon=True)
+        heartbeat.start()
+        completed = 0
+        seen_open = False
+        logger.info(f"工作进程 {self.worker_id} 开始领取任务")
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.threads) as executor:
+                futures = {}
+                while not self._stop.is_set():
+                    # 多领取一倍的任务排队，线程空闲时不必等待下一次领取
+                    capacity = self.threads * 2 - len(futures)
+                    try:
+                        tasks = self.queue.lease(self.worker_id, capacity, self.visibility_timeout) if capacity > 0 else []
+                        stats = None if futures or tasks else self.queue.stats()
+                    except Exception as e:
+                        logger.warning(f"访问队列时出错: {e}，稍后重试")
+                        time.sleep(self.poll_interval)
+                        continue
+                    for task in tasks:
+                        with self.lock:
+                            self.leased.add(task["id"])
+                        futures[executor.submit(self.execute, task)] = task
+                    
+                    if not futures:
+                        busy = any(states.get("pending") or states.get("leased")
+                                   for states in stats["tasks"].values())
+                        # 先于协调进程启动时，队列可能还处于上一次运行结束后的关闭状态
+                        seen_open = seen_open or not stats["closed"]
+                        if exit_when_idle and stats["closed"] and not busy and (seen_open or completed):
+                            break
+                        time.sleep(self.poll_interval)
+                        continue
+                    
+                    done, _ = concurrent.futures.wait(futures, timeout=self.poll_interval,
+                                                      return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        task = futures.pop(future)
+                        self._finish(task, future)
+                        with self.lock:
+                            self.leased.discard(task["id"])
+                        completed += 1
+        finally:
+            self._stop.set()
+            heartbeat.join(timeout=5)
+        logger.info(f"工作进程 {self.worker_id} 结束，共处理 {completed} 个任务")
+        return completed
+    
+    def stop(self):
+        self._stop.set()
+
+def coordinate_crawl(queue, item_types, save_dir="data/categories", max_pages=500, items_per_page=100, appid=730,
+                     poll_interval=1.0, compact=True, archive_raw=False):
+    """协调分布式收集：按 total_count 规划页并放入队列，把工作进程提交的结果写入本地检查点
+    
+    规划和检查点与单进程收集相同（CrawlPlanner），队列负责重试，队列放弃的页记录为缺失。
+    协调进程中断后重新运行会从检查点和队列中的未处理结果继续。返回 {类型: 物品数}。
+    """
+    planner = CrawlPlanner(item_types, save_dir, items_per_page, max_pages, max_attempts=1, compact=compact,
+                           archive_raw=archive_raw)
+    queue.set_closed(False)
+    started = time.perf_counter()
+    try:
+        while True:
+            tasks = [("search", f"search:{item_type}:{start}",
+                      {"appid": appid, "category": item_type, "start": start, "count": items_per_page})
+                     for item_type, start in planner.next_requests(1 << 30)]
+            if tasks:
+                queue.enqueue(tasks)
+            
+            results = queue.results("search")
+            for task in results:
+                payload = task["payload"]
+                if payload["category"] not in planner.plans:
+                    continue
+                if task["state"] == "failed":
+                    logger.warning(f"{payload['category']} 起始索引 {payload['start']} 失败: {task['error']}")
+                planner.record(payload["category"], payload["start"], task["result"])
+            if results:
+                queue.ack([task["id"] for task in results])
+            
+            if not planner.has_work():
+                break
+            if not results:
+                time.sleep(poll_interval)
+    finally:
+        queue.set_closed(True)
+    counts = planner.finish()
+    logger.info(f"分布式收集完成: {len(counts)} 个类型，共 {sum(counts.values())} 个物品，"
+                f"用时 {time.perf_counter() - started:.1f} 秒")
+    return counts
+
+def coordinate_backfill(queue, db_path="csgo_items.db", appid=730, max_age_hours=24, limit=None, poll_interval=1.0):
+    """协调分布式价格历史回填：需要回填的物品放入队列，结果由本进程解析并写入数据库"""
+    from backfill import _record_results, parse_price_history, select_backfill_items
+    from db_setup import configure_connection, create_database
+    
+    conn = create_database(db_path)
+    configure_connection(conn)
+    items = select_backfill_items(conn, max_age_hours, limit)
+    queue.set_closed(False)
+    queue.enqueue([("pricehistory", f"pricehistory:{item_id}",
+                    {"appid": appid, "item_id": item_id, "market_hash_name": market_hash_name})
+                   for item_id, market_hash_name in items])
+    logger.info(f"已将 {len(items)} 个物品的价格历史任务放入队列")
+    
+    remaining = {item_id for item_id, _ in items}
+    done = 0
+    points = 0
+    try:
+        while remaining:
+            results = queue.results("pricehistory")
+            if not results:
+                time.sleep(poll_interval)
+                continue
+            batch = []
+            for task in results:
+                item_id = task["payload"]["item_id"]
+                batch.append((item_id, parse_price_history(task["result"]) if task["state"] == "done" else None))
+                remaining.discard(item_id)
+            points += _record_results(conn, batch)
+            queue.ack([task["id"] for task in results])
+            done += len(batch)
+            logger.info(f"已回填 {done}/{len(items)} 个物品，写入 {points} 个价格点")
+    finally:
+        queue.set_closed(True)
+        conn.close()
+    return {"items": done, "points": points}
+
+def main():
+    parser = argparse.ArgumentParser(description="分布式收集的工作队列和协调进程")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="队列数据库文件")
+    parser.add_argument("--port", type=int, default=8780, help="为其他机器上的工作进程提供队列接口的端口（0表示不提供）")
+    parser.add_argument("--host", default="127.0.0.1", help="队列接口的监听地址，其他机器访问时使用 0.0.0.0 并设置口令")
+    parser.add_argument("--token", default=os.environ.get(TOKEN_ENV),
+                        help=f"队列接口的共享口令（默认读取环境变量 {TOKEN_ENV}）")
+    parser.add_argument("--visibility-timeout", type=float, default=60, help="租约超时时间（秒），超时未续约的任务重新分配")
+    parser.add_argument("--max-attempts", type=int, default=5, help="每个任务最多尝试的次数")
+    add_arguments(parser)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    crawl = subparsers.add_parser("crawl", help="规划搜索页并收集结果到检查点")
+    crawl.add_argument("--save-dir", default="data/categories", help="检查点目录")
+    crawl.add_argument("--max-pages", type=int, default=500, help="每个类型最多请求的页数")
+    crawl.add_argument("--items-per-page", type=int, default=100, help="每页物品数")
+    crawl.add_argument("--basic-items", action="store_true", help="只收集基础类型")
+    crawl.add_argument("--archive-raw", action="store_true", help="另外把原始搜索结果归档到 .raw.jsonl.gz")
+    
+    backfill = subparsers.add_parser("backfill", help="把价格历史任务放入队列并写入数据库")
+    backfill.add_argument("--db", default="csgo_items.db", help="数据库文件")
+    backfill.add_argument("--max-age-hours", type=float, default=24, help="超过该时间未回填的物品会重新抓取")
+    backfill.add_argument("--limit", type=int, default=None, help="本次最多回填的物品数")
+    
+    subparsers.add_parser("stats", help="显示队列中各状态的任务数")
+    
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    queue = WorkQueue(args.queue, args.visibility_timeout, args.max_attempts)
+    if args.command == "stats":
+        print(json.dumps(queue.stats(), ensure_ascii=False, indent=2))
+        queue.close()
+        return
+    
+    exporters = start_exporters(args.metrics_port, args.metrics_file, metrics_host=args.metrics_host)
+    server = QueueServer(queue, args.port, args.host, args.token).start() if args.port else None
+    if server and args.host not in ("127.0.0.1", "localhost") and not args.token:
+        logger.warning(f"队列接口监听 {args.host} 但没有设置口令，网络中的任何人都可以提交结果")
+    if server:
+        logger.info(f"队列接口: http://{socket.gethostname()}:{server.port}，"
+                    f"工作进程: python collector.py --queue http://{socket.gethostname()}:{server.port}")
+    try:
+        if args.command == "crawl":
+            from collector import get_item_types
+            coordinate_crawl(queue, get_item_types(not args.basic_items), args.save_dir, args.max_pages,
+                             args.items_per_page, archive_raw=args.archive_raw)
+        else:
+            coordinate_backfill(queue, args.db, max_age_hours=args.max_age_hours, limit=args.limit)
+        if server:
+            # 等远程工作进程看到队列已关闭后再停止接口
+            time.sleep(3)
+    finally:
+        if server:
+            server.close()
+        queue.close()
+        close_exporters(exporters)
+
+if __name__ == "__main__":
+    main()